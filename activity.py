@@ -7,7 +7,15 @@ import kdate
 import logging
 import threading
 import os
+import math
+import array
 import ctypes
+import vibrationlog
+import lifecycle
+try:
+  import numpy
+except ImportError:
+  numpy = None
 #import docopt
 #import sys
 #import subprocess
@@ -51,6 +59,13 @@ class Activity:
     self.lastactivity = 0
     self.lastchange   = time.time()
     self.buttontime   = 0
+    # Recorder of raw vibrations (vibrationlog.VibrationLog)
+    self.recorder     = None
+    # Thread control. Waits use the stopped event, so stop takes effect at once
+    self.thread       = None
+    self.stopsignal   = False
+    self.stopped      = threading.Event()
+    self.lifecycle    = None   # lifecycle.Lifecycle tracking timers (optional)
 
   # This function is called once to start the monitoring of the vibration sensor
   # Just runs an infinite loop, where it either waits for activity og vacancy
@@ -84,6 +99,13 @@ class Activity:
       log.debug("Turning off power to sensor")
       self.pi.write(self.gpio_power,0)
       self.pi.set_mode(self.gpio_power, pigpio.INPUT)
+    if self.recorder: self.recorder.stop()
+
+  # Record all vibrations to binary files in directory, for replay with activity_replay.py
+  def record(self, directory="./log/vibration"):
+    if self.recorder: self.recorder.stop()
+    self.recorder=vibrationlog.VibrationLog(self.pi, self.gpio, directory)
+    self.recorder.start()
 
   def setAllwaysOn(self, state=False):
     log.info("Setting allwaysOn: %r" % state)
@@ -99,18 +121,33 @@ class Activity:
     self.singleOn = True
 
   def start(self):
+    self.stopsignal=False
+    self.stopped.clear()
     self.thread=threading.Thread(target=self.run, name="Activity")
     self.thread.start()
-    self.stopsignal=False
 
   def stop(self):
     self.stopsignal=True
+    self.stopped.set()
+
+  def join(self, timeout=None):
+    if self.thread: self.thread.join(timeout)
+
+  # Wait for a vibration up to timeout seconds. Waits in short slices, so a stop is noticed fast
+  def waitEdge(self, timeout):
+    end=time.time()+timeout
+    while not self.stopsignal:
+      left=end-time.time()
+      if left<=0: return(False)
+      if self.pi.wait_for_edge(self.gpio, pigpio.RISING_EDGE, min(left, 0.5)): return(True)
+    return(False)
 
   def click(self):
     self.buttontime=time.time()
 
   def heartbeat(self):
     self.hearttime=time.time()
+    if self.recorder: self.recorder.flush()
     # If we haven't heard from main thread in 2 minutes. Exit.
     if self.hearttime-self.heartmain > 120:
       log.debug("Main thread heartbeat too faint. Stoppong activity thread")
@@ -128,11 +165,11 @@ class Activity:
         log.debug("Stop signal - Breaking out of occupied wait")
         break
       if self.allwaysOff:
-        time.sleep(3)
+        self.stopped.wait(3)
         continue
       # Wait for activity for a few seconds
       # Needs to be short (during devel), so we can break out fast on program exit
-      if self.singleOn or self.allwaysOn or self.pi.wait_for_edge(self.gpio, pigpio.RISING_EDGE, 3):
+      if self.singleOn or self.allwaysOn or self.waitEdge(3):
         self.output("sensor",1)
         log.debug("Activity detected...")
         newtime=time.time()
@@ -164,7 +201,7 @@ class Activity:
         # We need more movements before we think the table is occupied.
         # But first sleep a little, tó ignore fast vibrations within a short time
         else:
-          time.sleep(self.activity_time_debounce)
+          self.stopped.wait(self.activity_time_debounce)
       # No vibration detected for 3600 seconds. Let the log file know
       else:
         waitbeat+=1
@@ -181,17 +218,17 @@ class Activity:
         log.debug("Stop signal - Breaking out of occupied wait")
         break
       if self.allwaysOn:
-        time.sleep(3)
+        self.stopped.wait(3)
         continue
       # Wait a few seconds for activity
-      if self.allwaysOff==0 and self.pi.wait_for_edge(self.gpio, pigpio.RISING_EDGE, 3):
+      if self.allwaysOff==0 and self.waitEdge(3):
         log.debug("Activity detected... Still occupied")
         self.lastactivity=time.time()
         self.buttontime=0
         self.output("sensor",1)
         self.move_num+=1 # Add 1 movement counter - people are still playing
         # Sleep a little, to ignore fast vibrations within a short time - no need to run this loop 1000 times/s
-        time.sleep(3)
+        self.stopped.wait(3)
       else:
         # 3 seconds passed with no activity. Check if enough time has passed, if not listen again
         # Check time since last activity or last button. If larger than limit, go to vacant
@@ -231,7 +268,7 @@ class Activity:
     if sensor=="sensor" and self.outputSensor:
       log.debug("Sensor output set to %d " % level)
       self.pi.write(self.outputSensor,level)
-      threading.Timer(1.0, self.outputOff).start()
+      lifecycle.timer(self.lifecycle, 1.0, self.outputOff)
     elif sensor=="status" and self.outputStatus:
       log.debug("Status output set to %d " % level)
       self.pi.write(self.outputStatus,level)
@@ -250,3 +287,225 @@ class Activity:
   def sensorOff():
     if self.gpio_power:
       self.pi.write(self.gpio_power,0)
+
+# Event driven version of Activity with the same configuration, callbacks and control functions.
+# Vibrations are caught by a pigpio callback, which only records the time and wakes the
+# activity thread. The thread sleeps until the next vibration, control change or deadline
+# (vacant timeout or heartbeat), so the table is occupied the moment the Nth movement
+# arrives, and stop, turnOn and allwaysOn/Off take effect at once.
+class EventActivity(Activity):
+
+  def __init__(self, pi, gpio, power=False, config=False, onVacant=None, onOccupied=None):
+    Activity.__init__(self, pi, gpio, power, config, onVacant, onOccupied)
+    self.cond=threading.Condition()
+    self.edges=[]         # Vibrations not yet handled by the activity thread
+    self.cb=None
+    self.heartinterval=3  # Seconds between heartbeats of the activity thread
+    self.counttime=0      # Time of last counted vibration (for debounce)
+    self.detector=None    # RateDetector deciding occupied/vacant. None: count movements
+
+  # Use a RateDetector in stead of counting movements (None to go back to counting)
+  def setDetector(self, detector):
+    self.detector=detector
+    self.wake()
+
+  # pigpio callback on rising edge of the vibration sensor
+  def vibration(self, gpio, level, tick):
+    with self.cond:
+      self.edges.append(time.time())
+      self.cond.notify()
+
+  # Wake the activity thread to act on a changed flag
+  def wake(self):
+    with self.cond:
+      self.cond.notify()
+
+  def setAllwaysOn(self, state=False):
+    Activity.setAllwaysOn(self, state)
+    self.wake()
+
+  def setAllwaysOff(self, state=False):
+    Activity.setAllwaysOff(self, state)
+    self.wake()
+
+  def turnOn(self):
+    self.singleOn = True
+    self.wake()
+
+  def start(self):
+    self.stopsignal=False
+    self.stopped.clear()
+    self.cb=self.pi.callback(self.gpio, pigpio.RISING_EDGE, self.vibration)
+    self.thread=threading.Thread(target=self.run, name="Activity")
+    self.thread.start()
+
+  def stop(self):
+    Activity.stop(self)
+    self.wake()
+
+  def run(self):
+    self.tid=ctypes.CDLL('libc.so.6').syscall(224)
+    log.info("Starting event driven activity sensoring (tid: %d)" % self.tid)
+    if self.gpio_power:
+      log.debug("Turning on power to sensor")
+      self.pi.write(self.gpio_power,1)
+    nextbeat=0
+    idlelog=0
+    while True:
+      now=time.time()
+      if now>=nextbeat:
+        self.heartbeat()
+        nextbeat=now+self.heartinterval
+      with self.cond:
+        edges=self.edges
+        self.edges=[]
+      if self.stopsignal: break
+      deadline=self.step(edges, now)
+      # Log long breaks in activity while vacant
+      if not self.table_occupied:
+        idle=now-max(self.lastactivity, self.lastchange)
+        if   idle<30: idlelog=0
+        elif idlelog==0 and idle>=30:     log.info("No activity for 30 seconds"); idlelog=1
+        elif idlelog==1 and idle>=300:    log.info("No activity for 5 minutes"); idlelog=2
+        elif idlelog>=2 and idle>=3600*(idlelog-1):
+          log.info("No activity last hour"); idlelog+=1
+      # Sleep until next vibration, control change, or the next deadline
+      deadline=min(nextbeat, deadline) if deadline else nextbeat
+      with self.cond:
+        if not self.edges and not self.stopsignal and not self.changed():
+          self.cond.wait(max(0, deadline-time.time()))
+    self.cb.cancel()
+    self.cb=None
+    if self.recorder: self.recorder.stop()
+    if self.gpio_power:
+      log.debug("Turning off power to sensor")
+      self.pi.write(self.gpio_power,0)
+      self.pi.set_mode(self.gpio_power, pigpio.INPUT)
+
+  # Handle vibrations at the given times and check for a change of table status at time now.
+  # Returns the time of the next deadline (None if there is none). Doesn't look at the clock,
+  # so it can also be driven by a virtual clock (see activity_replay.py)
+  def step(self, edges, now):
+    for t in edges: self.vibrationAt(t)
+    if self.table_occupied: self.checkVacant(now)
+    else:                   self.checkOccupied(now)
+    if self.table_occupied and not self.allwaysOn:
+      # buttontime is 0 when no button has been pressed since the last vibration
+      deadline=self.detector.vacantAt(now) if self.detector else self.lastactivity+self.activity_time_unoccupied
+      if self.buttontime: deadline=max(deadline, self.buttontime+self.activity_time_unoccupied)
+      return(deadline)
+    return(None)
+
+  # Is there a manual state change, which should be handled without waiting
+  def changed(self):
+    if self.table_occupied: return(False)
+    return((self.singleOn or self.allwaysOn) and not self.allwaysOff)
+
+  # Handle one vibration. Vibrations within the debounce time of the last counted one are ignored
+  def vibrationAt(self, t):
+    if self.allwaysOff: return
+    if t-self.counttime < self.activity_time_debounce: return
+    self.counttime=t
+    self.output("sensor",1)
+    self.lastactivity=t
+    if self.detector:
+      self.detector.add(t)
+      log.debug("Activity detected... Rates: %s" % self.detector.report(t))
+    if self.table_occupied:
+      log.debug("Activity detected... Still occupied")
+      self.buttontime=0
+      self.move_num+=1
+      return
+    log.debug("Activity detected...")
+    # Too long since last move - reset movements
+    if t-self.move_time > self.activity_time_reset:
+      log.debug("   long time since motion. Move_num reset...")
+      self.move_num=0
+    self.move_num+=1
+    log.debug("   Move_num new set to %d" % self.move_num)
+    self.move_time=t
+
+  def checkOccupied(self, now):
+    if self.allwaysOff: return
+    if self.detector: moving=self.detector.occupied(now)
+    else:             moving=self.move_num >= self.activity_num_to_occupied
+    if not moving and not self.singleOn and not self.allwaysOn: return
+    # Manual turn on counts as activity
+    if self.singleOn or self.allwaysOn: self.lastactivity=now
+    if self.singleOn:
+      log.info("Table turned on manually")
+      self.singleOn=False
+    if self.allwaysOn:
+      log.info("Table turned on permanently")
+    log.info("Table occupied - (vacant for %d seconds)" % (now-self.lastchange))
+    self.lastchange=now
+    self.table_occupied=True
+    self.output("status",1)
+    if self.onOccupied: self.onOccupied()
+
+  def checkVacant(self, now):
+    if self.allwaysOn: return
+    if now-self.buttontime<self.activity_time_unoccupied: return
+    if self.detector:
+      if not self.detector.vacant(now): return
+    elif now-self.lastactivity<self.activity_time_unoccupied: return
+    self.output("status",0)
+    log.info("Table vacant - (occupied for %d seconds, %d movements detected)" %
+      (now-self.lastchange, self.move_num))
+    self.lastchange=now
+    self.table_occupied=False
+    if self.onVacant: self.onVacant()
+
+# Occupancy from the rate of vibrations, in stead of counting movements in a row.
+# The times of the latest vibrations are kept in a ring buffer, and the rate (vibrations
+# per second) is computed over several windows. The table becomes occupied when the rate over
+# occupywindow reaches occupyrate, and vacant when the rate over vacantwindow drops below
+# vacantrate. The gap between the two gives hysteresis: A few bumps from people passing by
+# doesn't occupy the table, and a long rally without vibrations doesn't make it vacant.
+# Uses numpy if it is installed.
+class RateDetector:
+
+  def __init__(self, size=256, windows=(5, 15, 60), occupywindow=15, occupyrate=0.25, vacantwindow=60, vacantrate=0.05):
+    self.size=size
+    self.windows=windows
+    self.occupywindow=occupywindow
+    self.occupyrate=occupyrate
+    self.vacantwindow=vacantwindow
+    self.vacantrate=vacantrate
+    if numpy is not None: self.times=numpy.zeros(size)
+    else:                 self.times=array.array('d', [0.0]*size)
+    self.count=0   # Number of vibrations added (next index is count % size)
+
+  def add(self, t):
+    self.times[self.count % self.size]=t
+    self.count+=1
+
+  # Number of vibrations less than window seconds before now, for each window
+  def counts(self, now, windows):
+    n=min(self.count, self.size)
+    if numpy is not None:
+      ages=now-self.times[:n]
+      return([int(numpy.count_nonzero(ages<w)) for w in windows])
+    ages=[now-t for t in self.times[:n]]
+    return([sum(1 for a in ages if a<w) for w in windows])
+
+  # Vibrations per second over each window
+  def rates(self, now):
+    return(dict((w, float(c)/w) for (w, c) in zip(self.windows, self.counts(now, self.windows))))
+
+  def report(self, now):
+    rates=self.rates(now)
+    return(", ".join("%ds: %.2f/s" % (w, rates[w]) for w in sorted(rates)))
+
+  def occupied(self, now):
+    return(self.counts(now, [self.occupywindow])[0] >= self.occupyrate*self.occupywindow)
+
+  def vacant(self, now):
+    return(self.counts(now, [self.vacantwindow])[0] < self.vacantrate*self.vacantwindow)
+
+  # Time when the table turns vacant, if no more vibrations arrive: When the vibration
+  # before the last allowed ones drops out of the vacant window. now, if it already is vacant
+  def vacantAt(self, now):
+    allowed=int(math.ceil(self.vacantrate*self.vacantwindow))-1
+    if allowed>=min(self.count, self.size): return(now)
+    return(self.times[(self.count-1-allowed) % self.size]+self.vacantwindow)
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Replays recorded vibrations (see Activity.record and vibrationlog.py) through the activity
+# logic of EventActivity on a virtual clock, to tune the activity timers without standing at
+# the table. Every combination of the given parameter values is replayed, spread over a pool
+# of processes.
+#
+# If a file with the real playing periods is given (one "start,end" per line, as unix time
+# or "YYYY-MM-DD HH:MM:SS"), each setting is scored by:
+#   Falseocc:  Occupied periods with nobody playing
+#   Falsevac:  Vacant while people were playing
+#   Missed:    Playing periods never detected
+#   Latency:   Mean seconds from start of play until occupied
+#   Vacdelay:  Mean seconds from end of play until vacant
+#
+# Parameters are activity attributes (activity_num_to_occupied, activity_time_reset ...)
+# or RateDetector arguments prefixed with rate_ (rate_occupyrate ...), which replays with
+# the rate detector in stead of the movement counter.
+#
+# Usage: activity_replay.py [-t truthfile] [-p processes] file.bin ... [name=value,value,...] ...
+# Example: activity_replay.py -t played.txt log/vibration/*.bin activity_num_to_occupied=2,3,4 activity_time_reset=2,3,5
+
+import sys
+import time
+import getopt
+import logging
+import itertools
+import multiprocessing
+import fakepi
+import activity
+import vibrationlog
+
+# Vibration times, loaded once in each process of the pool
+times=None
+
+def load(filenames):
+  global times
+  logging.getLogger("Foosball").setLevel(logging.WARNING)
+  times=vibrationlog.readFiles(filenames)
+
+# Replay vibrations with the given parameters. Returns list of (occupied, vacant) periods
+def replay(times, params):
+  periods=[]
+  a=activity.EventActivity(fakepi.FakePi(), gpio=17)
+  def occupied(): periods.append([a.lastchange, None])
+  def vacant():   periods[-1][1]=a.lastchange
+  a.onOccupied=occupied
+  a.onVacant=vacant
+  a.lastchange=times[0] if times else 0
+  rateargs={}
+  for (name, value) in params:
+    if name.startswith("rate_"): rateargs[name[5:]]=value
+    else: setattr(a, name, value)
+  if rateargs: a.setDetector(activity.RateDetector(**rateargs))
+  deadline=None
+  for t in times:
+    # Deadlines before the next vibration
+    while deadline is not None and deadline<=t:
+      deadline=a.step([], deadline)
+    deadline=a.step([t], t)
+  while deadline is not None:
+    deadline=a.step([], deadline)
+  return([tuple(p) for p in periods])
+
+# Compare detected periods to the real playing periods
+def score(periods, truth):
+  falseocc=sum(1 for (o, v) in periods if not any(o<e and v>s for (s, e) in truth))
+  falsevac=sum(1 for (o, v) in periods if any(s<v<e for (s, e) in truth))
+  latency=[]
+  vacdelay=[]
+  missed=0
+  for (s, e) in truth:
+    covering=[(o, v) for (o, v) in periods if o<e and v>s]
+    if not covering:
+      missed+=1
+      continue
+    latency.append(max(0, covering[0][0]-s))
+    vacdelay.append(covering[-1][1]-e)
+  mean=lambda l: sum(l)/len(l) if l else float("nan")
+  return(falseocc, falsevac, missed, mean(latency), mean(vacdelay))
+
+def run(job):
+  (params, truth)=job
+  periods=replay(times, params)
+  return(params, periods, score(periods, truth) if truth is not None else None)
+
+def parseTime(s):
+  s=s.strip()
+  try:
+    return(float(s))
+  except ValueError:
+    return(time.mktime(time.strptime(s, "%Y-%m-%d %H:%M:%S")))
+
+def readTruth(filename):
+  truth=[]
+  with open(filename) as f:
+    for line in f:
+      if not line.strip() or line.startswith("#"): continue
+      (s, e)=line.split(",")
+      truth.append((parseTime(s), parseTime(e)))
+  return(sorted(truth))
+
+def parseParam(arg):
+  (name, values)=arg.split("=", 1)
+  if not name.startswith("activity_") and not name.startswith("rate_"):
+    raise ValueError("Unknown parameter %s" % name)
+  return([(name, float(v) if "." in v else int(v)) for v in values.split(",")])
+
+def main(argv):
+  (opts, args)=getopt.getopt(argv, "t:p:")
+  opts=dict(opts)
+  truth=readTruth(opts["-t"]) if "-t" in opts else None
+  processes=int(opts.get("-p", multiprocessing.cpu_count()))
+  filenames=[a for a in args if "=" not in a]
+  grid=[parseParam(a) for a in args if "=" in a]
+  jobs=[(list(params), truth) for params in itertools.product(*grid)]
+  start=time.time()
+  pool=multiprocessing.Pool(processes, initializer=load, initargs=(filenames,))
+  try:
+    results=pool.map(run, jobs)
+  finally:
+    pool.close()
+    pool.join()
+  load(filenames)
+  elapsed=time.time()-start
+  print("%d vibrations, %d settings, %d processes, %.1f seconds" % (len(times), len(jobs), processes, elapsed))
+  if times:
+    print("Replayed %.0f hours of vibrations %.0f times faster than real time" %
+          ((times[-1]-times[0])/3600, len(jobs)*(times[-1]-times[0])/max(elapsed, 1e-6)))
+  if truth is not None:
+    results.sort(key=lambda r: (r[2][0]+r[2][1]+r[2][2], r[2][3]))
+    print("%8s %8s %8s %8s %8s  %s" % ("Falseocc", "Falsevac", "Missed", "Latency", "Vacdelay", "Parameters"))
+    for (params, periods, s) in results:
+      print("%8d %8d %8d %8.1f %8.1f  %s" % (s+(" ".join("%s=%s" % p for p in params),)))
+  else:
+    print("%8s %10s  %s" % ("Periods", "Occupied s", "Parameters"))
+    for (params, periods, s) in results:
+      print("%8d %10.0f  %s" % (len(periods), sum(v-o for (o, v) in periods), " ".join("%s=%s" % p for p in params)))
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
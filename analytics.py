@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Analytics over the full match history in the match archive (matcharchive.py), for the
+# questions the running statistics (matchstats.py) can't answer:
+#   - heatmap:        Number of matches ending with every final score
+#   - winprobability: Chance that team 1 wins, given the score during a match
+#   - goalhours:      Goals scored in every hour of the day, and every hour of the week
+# Everything is computed with numpy on the archive columns, no loops over matches or goals.
+# Scores above maxscore are counted as maxscore.
+#
+# The results are cached with the number of the latest match. They are only computed again
+# when a match has been added, and are saved as JSON (cachefile) for the homepage and the
+# display.
+#
+# Usage: analytics.py [archive directory] [cachefile]   Compute and print the results
+
+import sys
+import json
+import time
+import logging
+import calendar
+import external
+import matcharchive
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+log = logging.getLogger("Foosball")
+
+class Analytics:
+
+  def __init__(self, directory=matcharchive.DIRECTORY, cachefile=None, maxscore=20):
+    self.directory=directory
+    self.cachefile=cachefile
+    self.maxscore=maxscore
+    self.reader=None
+    self.cache=None
+    if cachefile: self.load()
+
+  # Results for the latest match in the archive. Computed again only if it has changed
+  def results(self):
+    if self.reader is None: self.reader=matcharchive.ArchiveReader(self.directory)
+    else: self.reader.refresh()
+    last=self.reader.segments[-1].matches["id"][-1].item() if self.reader.segments else 0
+    if self.cache is None or self.cache["lastid"]!=last:
+      start=time.time()
+      self.cache=self.compute()
+      self.cache["lastid"]=last
+      log.debug("Analytics of %d matches computed in %.3f seconds" % (self.cache["matches"], time.time()-start))
+      if self.cachefile: self.save()
+    return(self.cache)
+
+  # Event handler: Update the results when a match has ended
+  def onEvent(self, event):
+    try:
+      self.results()
+    except matcharchive.ArchiveException as e:
+      log.warning("No analytics: %s" % e)
+
+  def compute(self):
+    r=self.reader
+    ids=r.column("matches", "id")
+    start=r.column("matches", "start")
+    score1=r.column("matches", "score1")
+    score2=r.column("matches", "score2")
+    # Row of the match of every goal. The goals are stored in match order
+    row=numpy.repeat(numpy.arange(len(ids)), r.column("matches", "goals"))
+    # Local time of the goals, with the UTC offset of the day the match started
+    goaltime=(start+utcOffsets(start))[row]+r.column("goals", "offset")
+    (hours, weekhours)=hourOfWeek(goaltime)
+    return({"matches": len(ids),
+            "goals": len(row),
+            "heatmap": scoreHeatmap(score1, score2, self.maxscore).tolist(),
+            "winprobability": probabilityList(*winProbability(score1, score2, r.column("goals", "score1"),
+                                                              r.column("goals", "score2"), row, self.maxscore)),
+            "goalhours": numpy.bincount(hours, minlength=24).tolist(),
+            "goalweekhours": numpy.bincount(weekhours, minlength=168).tolist()})
+
+  def save(self):
+    try:
+      external.atomicWrite(self.cachefile, json.dumps(self.cache, sort_keys=True))
+    except (IOError, OSError) as e:
+      log.warning("Could not save analytics to %s: %s" % (self.cachefile, e))
+
+  def load(self):
+    try:
+      with open(self.cachefile) as f:
+        self.cache=json.load(f)
+    except (IOError, ValueError):
+      self.cache=None
+
+# Matches ending with every score: heatmap[score1][score2]
+def scoreHeatmap(score1, score2, maxscore):
+  size=maxscore+1
+  cells=numpy.minimum(score1, maxscore).astype(numpy.int64)*size+numpy.minimum(score2, maxscore)
+  return(numpy.bincount(cells, minlength=size*size).reshape(size, size))
+
+# Matches which passed every score, and how many of them team 1 won: (wins, total) arrays
+# indexed [score1][score2]. The scores after every goal, plus 0-0 for every match
+def winProbability(score1, score2, goalscore1, goalscore2, goalrow, maxscore):
+  size=maxscore+1
+  won=(score1>score2)
+  cells=numpy.concatenate((numpy.zeros(len(score1), dtype=numpy.int64),
+                           numpy.minimum(goalscore1, maxscore).astype(numpy.int64)*size+numpy.minimum(goalscore2, maxscore)))
+  # Count lost and won in one pass: cell*2+won
+  counts=numpy.bincount(cells*2+numpy.concatenate((won, won[goalrow])), minlength=2*size*size).reshape(size, size, 2)
+  return(counts[:, :, 1], counts.sum(axis=2))
+
+# Probability of a team 1 win as nested lists (None where the score never happened)
+def probabilityList(wins, total):
+  p=wins.astype(numpy.float64)/numpy.maximum(total, 1)
+  return([[(round(float(p[i, j]), 4) if total[i, j] else None) for j in range(total.shape[1])] for i in range(total.shape[0])])
+
+# UTC offset (seconds) of unix times. The offset of the day (at noon) is used, so summer time
+# is right except in the night it changes
+def utcOffsets(times):
+  days=(times//86400).astype(numpy.int64)
+  (unique, inverse)=numpy.unique(days, return_inverse=True)
+  offsets=numpy.array([utcOffset(d*86400+43200) for d in unique.tolist()], dtype=numpy.float64)
+  return(offsets[inverse])
+
+# Hour of the day and hour of the week (monday 0-1 is 0) of local unix times
+def hourOfWeek(local):
+  hours=local.astype(numpy.int64)//3600
+  weekhours=(hours+72)%168     # 1970-01-01 was a thursday
+  return(hours%24, weekhours)
+
+def utcOffset(t):
+  return(calendar.timegm(time.localtime(t))-int(t))
+
+if __name__ == '__main__':
+  analytics=Analytics(sys.argv[1] if len(sys.argv)>1 else matcharchive.DIRECTORY, sys.argv[2] if len(sys.argv)>2 else None)
+  start=time.time()
+  results=analytics.results()
+  print("%d matches, %d goals (%.3f s)" % (results["matches"], results["goals"], time.time()-start))
+  print("Goals per hour: %s" % results["goalhours"])
+  p=results["winprobability"]
+  for (s1, s2) in ((0, 0), (3, 5), (5, 3), (8, 9)):
+    if s1<len(p) and s2<len(p): print("Team 1 wins from %d-%d: %s" % (s1, s2, p[s1][s2]))
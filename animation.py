@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# coding: utf8
+
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# Default time between frames in seconds
+TICK = 0.02
+
+# One thread drives all blinks and effects on all scoreboards.
+# Effects are objects with a step(now) method, which is called once every tick and renders
+# the current frame. step returns False when the effect is finished. It is also called
+# after the effect is cancelled, so the effect can clean up (and then return False). Adding an effect returns
+# a Handle, which can cancel it (also set as effect.handle). If a MAX7219Bus is given, every
+# frame of all effects is sent to the leds in one bus transaction.
+# The thread sleeps when there is nothing to animate, so the number of threads is constant
+# no matter how many effects are queued.
+class Scheduler:
+
+  def __init__(self, tick=TICK, bus=None):
+    self.tick=tick
+    self.bus=bus
+    self.handles=[]
+    self.cond=threading.Condition()
+    self.stopping=False
+    self.thread=None
+
+  # Start animating effect. Returns a handle to cancel it
+  # Once the scheduler is stopped, effects are not started, and the handle is allready finished
+  def add(self, effect):
+    handle=Handle(effect)
+    effect.handle=handle
+    with self.cond:
+      if self.stopping:
+        handle.finish()
+        return(handle)
+      self.handles.append(handle)
+      if not self.thread:
+        self.thread=threading.Thread(target=self.run, name="Animation")
+        self.thread.daemon=True
+        self.thread.start()
+      self.cond.notify()
+    return(handle)
+
+  # Stop the animation thread. Running effects are cancelled
+  def stop(self):
+    with self.cond:
+      self.stopping=True
+      for handle in self.handles: handle.cancel()
+      self.cond.notify()
+    if self.thread: self.thread.join()
+
+  def run(self):
+    start=time.time()
+    frame=0
+    while True:
+      with self.cond:
+        # Nothing to animate - sleep until an effect is added
+        while not self.handles and not self.stopping:
+          self.cond.wait()
+          start=time.time()
+          frame=0
+        handles=list(self.handles)
+      # Last call of cancelled effects, so they can clean up
+      if self.stopping:
+        for handle in self.render(handles, time.time()): handle.finish()
+        break
+      now=time.time()
+      done=[]
+      if self.bus:
+        with self.bus.batch(): done=self.render(handles, now)
+      else: done=self.render(handles, now)
+      # Finished only now, when the last frame has reached the leds
+      with self.cond:
+        for handle in done:
+          if handle in self.handles: self.handles.remove(handle)
+          handle.finish()
+      # Sleep until next tick on a fixed grid, so frames don't drift
+      frame+=1
+      delay=start+frame*self.tick-time.time()
+      if delay<0:
+        frame=int((time.time()-start)/self.tick)+1
+        delay=start+frame*self.tick-time.time()
+      with self.cond:
+        if not self.stopping: self.cond.wait(delay)
+    with self.cond:
+      self.handles=[]
+
+  # Render a frame of every effect. Returns the handles of the finished ones (not yet marked finished)
+  def render(self, handles, now):
+    done=[]
+    for handle in handles:
+      try:
+        if not handle.effect.step(now): done.append(handle)
+      except Exception as e:
+        log.exception("Effect %s failed: %s" % (handle.effect, e))
+        done.append(handle)
+    return(done)
+
+class Handle:
+
+  def __init__(self, effect):
+    self.effect=effect
+    self.cancelled=False
+    self.finished=threading.Event()
+
+  # Effect won't be stepped again once cancel returns (effects check cancelled under their own lock)
+  def cancel(self):
+    self.cancelled=True
+
+  def finish(self):
+    self.finished.set()
+
+  def active(self):
+    return(not self.finished.isSet())
+
+  # Wait for the effect to finish. Returns False on timeout
+  def wait(self, timeout=None):
+    self.finished.wait(timeout)
+    return(self.finished.isSet())
+
+# Turn a scoreboard off and on blinknum times, staying off and on for blinktime seconds
+class BlinkEffect:
+
+  def __init__(self, teamscore, blinknum, blinktime):
+    self.teamscore=teamscore
+    self.target=2*blinknum
+    self.blinktime=blinktime
+    self.start=time.time()
+    self.current=0
+    self.handle=None
+
+  def step(self, now):
+    phase=min(int((now-self.start)/self.blinktime), self.target)
+    with self.teamscore.blinklock:
+      if self.handle and self.handle.cancelled: return(False)
+      # Odd phases are off, even phases on. Ends on
+      if phase!=self.current:
+        self.current=phase
+        if phase%2==1: self.teamscore.blinkOff()
+        else:          self.teamscore.blinkOn()
+    return(self.current<self.target)
+
+# Scheduler used by scoreboards which are not given one
+shared=None
+
+def sharedScheduler():
+  global shared
+  if not shared: shared=Scheduler()
+  return(shared)
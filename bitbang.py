@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# coding: utf8
+
+import pigpio
+
+# Bit-bang a serial clock/data interface using bank writes, so pins changing together
+# are set (or cleared) in one pigpio call, instead of one pi.write per pin.
+# All pins must be in bank 1 (gpio 0-31), which is every user gpio on the pi.
+#
+# Data is shifted out MSB first and latched by the device on the rising clock edge.
+# Per bit:
+#   clear_bank_1(clock [+ data if bit is 0])   Clock low. Data low in the same call
+#   set_bank_1(data)                           Only if bit is 1 and data is not allready high
+#   set_bank_1(clock)                          Clock high - device reads the bit
+# So 2 calls per bit, plus 1 every time data goes from low to high (3 per bit before).
+# An optional latch pin (load/chip select) is pulled low together with the first
+# clock low, and set high after the last bit.
+class BitBang:
+
+  def __init__(self, pi, clock, data):
+    self.pi=pi
+    self.clock=clock
+    self.data=data
+    self.isBank1(clock)
+    self.isBank1(data)
+    pi.set_mode(clock, pigpio.OUTPUT)
+    pi.set_mode(data,  pigpio.OUTPUT)
+    # Number of pigpio calls used so far
+    self.calls=0
+
+  def isBank1(self, gpio):
+    if gpio is None or gpio<0 or gpio>31: raise BitBangException("GPIO %s is not in bank 1 (0-31)" % gpio)
+    return(True)
+
+  # Shift out the lowest "bits" bits of value, MSB first. Returns number of pigpio calls used.
+  # Data level is not trusted between calls, since other code may share the data pin
+  def shiftOut(self, value, bits=16, latch=None):
+    clock=1<<self.clock
+    data=1<<self.data
+    low=0
+    if latch is not None:
+      self.isBank1(latch)
+      low=1<<latch
+    level=None        # Current level of data pin. Unknown at start
+    calls=0
+    for i in range(bits-1,-1,-1):
+      q=(value>>i)&1
+      if q==0 and level!=0:
+        low|=data
+        level=0
+      self.pi.clear_bank_1(clock|low)
+      calls+=1
+      low=0
+      if q==1 and level!=1:
+        self.pi.set_bank_1(data)
+        calls+=1
+        level=1
+      self.pi.set_bank_1(clock)
+      calls+=1
+    if latch is not None:
+      self.pi.set_bank_1(1<<latch)
+      calls+=1
+    self.calls+=calls
+    return(calls)
+
+class BitBangException(Exception): pass
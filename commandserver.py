@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Command channel on a unix domain socket. Replaces correctscore.txt + SIGUSR1.
+#
+# Clients send one JSON object per line, and get one JSON object per line back for every
+# command, in order. An "id" in the command is copied to the reply. Commands:
+#   {"cmd": "score", "score1": 3, "score2": 5}   Set the score (turns the table on if needed)
+#   {"cmd": "reset"}                              Reset the score to 0-0
+#   {"cmd": "alwayson", "state": true}            Keep the table on (or stop doing so)
+#   {"cmd": "alwaysoff", "state": true}           Keep the table off (or stop doing so)
+#   {"cmd": "players", "team1": "a", "team2": "b"} Who plays on each side (left out: unknown)
+#   {"cmd": "state"}                              Just reply with the state
+# Replies are {"ok": true, "state": {...}} or {"ok": false, "error": "..."}
+#
+# One thread serves all clients in a select loop. Commands are given to handler(command,
+# reply), which must not block; it calls reply(result) when the command is done, from any
+# thread.
+#
+# Usage: commandserver.py socketpath '{"cmd": "state"}'
+
+import os
+import sys
+import json
+import stat
+import errno
+import fcntl
+import socket
+import select
+import logging
+import threading
+import collections
+
+log = logging.getLogger("Foosball")
+
+class CommandServer:
+
+  def __init__(self, path, handler, mode=0o660):
+    self.path=path
+    self.handler=handler
+    self.mode=mode
+    self.sock=None
+    self.thread=None
+    self.clients={}        # socket -> CommandClient
+    self.replies=collections.deque()
+    self.lock=threading.Lock()
+    self.stopping=False
+    (self.wakeread, self.wakewrite)=os.pipe()
+    fcntl.fcntl(self.wakewrite, fcntl.F_SETFL, fcntl.fcntl(self.wakewrite, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+  def start(self):
+    # Remove a socket left by an earlier run
+    if os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode): os.remove(self.path)
+    self.sock=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.bind(self.path)
+    os.chmod(self.path, self.mode)
+    self.sock.listen(8)
+    self.sock.setblocking(0)
+    log.info("Command server listening on %s" % self.path)
+    self.stopping=False
+    self.thread=threading.Thread(target=self.run, name="Commands")
+    self.thread.daemon=True
+    self.thread.start()
+
+  def stop(self):
+    self.stopping=True
+    self.wake()
+    if self.thread: self.thread.join(2)
+    if self.sock and os.path.exists(self.path): os.remove(self.path)
+
+  def wake(self):
+    try:
+      os.write(self.wakewrite, b"x")
+    except OSError:
+      pass
+
+  # Queue a reply to client. Safe to call from any thread
+  def reply(self, client, reply):
+    with self.lock:
+      self.replies.append((client, reply))
+    self.wake()
+
+  def run(self):
+    while not self.stopping:
+      readers=[self.sock, self.wakeread]+list(self.clients)
+      writers=[s for (s, c) in self.clients.items() if c.outbuf]
+      try:
+        (readable, writable, broken)=select.select(readers, writers, [], 1)
+      except select.error as e:
+        if e.args[0]==errno.EINTR: continue
+        raise
+      if self.wakeread in readable:
+        os.read(self.wakeread, 4096)
+        with self.lock:
+          replies=list(self.replies)
+          self.replies.clear()
+        for (client, reply) in replies: client.answer(reply)
+      if self.sock in readable: self.accept()
+      for s in readable:
+        if s in self.clients: self.clients[s].read()
+      for s in writable:
+        if s in self.clients: self.clients[s].write()
+    for c in list(self.clients.values()): c.close()
+    self.sock.close()
+
+  def accept(self):
+    try:
+      (s, addr)=self.sock.accept()
+    except socket.error:
+      return
+    s.setblocking(0)
+    self.clients[s]=CommandClient(self, s)
+
+class CommandClient:
+
+  def __init__(self, server, sock):
+    self.server=server
+    self.sock=sock
+    self.inbuf=b""
+    self.outbuf=b""
+    self.pending=collections.deque()   # [command id, reply or None] in command order
+
+  def read(self):
+    try:
+      data=self.sock.recv(4096)
+    except socket.error as e:
+      if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK): return
+      return(self.close())
+    if not data: return(self.close())
+    self.inbuf+=data
+    if len(self.inbuf)>65536: return(self.close())
+    while b"\n" in self.inbuf:
+      (line, self.inbuf)=self.inbuf.split(b"\n", 1)
+      if line.strip(): self.command(line)
+
+  def command(self, line):
+    entry=[None, None]
+    self.pending.append(entry)
+    try:
+      command=json.loads(line.decode("utf8"))
+      if not isinstance(command, dict): raise ValueError("Command must be a JSON object")
+    except ValueError as e:
+      entry[1]={"ok": False, "error": "Bad command: %s" % e}
+      return(self.flush())
+    entry[0]=command.get("id")
+    try:
+      self.server.handler(command, lambda reply: self.server.reply(self, (entry, reply)))
+    except Exception as e:
+      entry[1]={"ok": False, "error": str(e)}
+      self.flush()
+
+  # Reply to a command (in the server thread)
+  def answer(self, reply):
+    (entry, result)=reply
+    entry[1]=result
+    self.flush()
+
+  # Send replies in command order
+  def flush(self):
+    while self.pending and self.pending[0][1] is not None:
+      (cid, reply)=self.pending.popleft()
+      if cid is not None: reply=dict(reply, id=cid)
+      self.outbuf+=(json.dumps(reply, sort_keys=True)+"\n").encode("utf8")
+    self.write()
+
+  def write(self):
+    if not self.outbuf: return
+    try:
+      n=self.sock.send(self.outbuf)
+    except socket.error as e:
+      if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK): return
+      return(self.close())
+    self.outbuf=self.outbuf[n:]
+
+  def close(self):
+    self.server.clients.pop(self.sock, None)
+    try:
+      self.sock.close()
+    except socket.error:
+      pass
+
+# Send one command and return the reply
+def send(path, command, timeout=5):
+  s=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  s.settimeout(timeout)
+  try:
+    s.connect(path)
+    s.sendall((json.dumps(command)+"\n").encode("utf8"))
+    data=b""
+    while b"\n" not in data:
+      chunk=s.recv(4096)
+      if not chunk: raise socket.error("Connection closed")
+      data+=chunk
+    return(json.loads(data.split(b"\n")[0].decode("utf8")))
+  finally:
+    s.close()
+
+if __name__ == '__main__':
+  print(json.dumps(send(sys.argv[1], json.loads(sys.argv[2])), sort_keys=True))
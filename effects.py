@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Segment animations for the 2-digit scoreboards.
+#
+# Effects are written as lists of frames, each frame being the raw segments of the
+# (left, right) digit. At import they are compiled into lists of register writes for
+# both orientations, so playing an effect is just indexing a list - no per-frame work.
+# While an effect plays, decode mode is turned off. When it ends (or is cancelled)
+# decode mode is turned back on and the score is shown again.
+
+import time
+
+# Segment bits of the max7219 without decode mode
+#    -A-
+#   F   B
+#    -G-
+#   E   C
+#    -D-  DP
+DP=128; A=64; B=32; C=16; D=8; E=4; F=2; G=1
+ALL=A|B|C|D|E|F|G
+
+# Registers of the digits. Register 1 is the right (ones) digit, register 2 the left (tens)
+LEFT=2
+RIGHT=1
+
+# Default frames per second
+FPS=25
+
+# Segment values of a digit turned upside down (rotated 180 degrees)
+def flipSegments(v):
+  w=v & (DP|G)
+  for (s1, s2) in ((A, D), (B, E), (C, F)):
+    if v & s1: w|=s2
+    if v & s2: w|=s1
+  return(w)
+
+FLIP=tuple(flipSegments(v) for v in range(256))
+
+# Compile frames to register writes. Upside down, the digits also trade places
+def compileFrames(frames, flip=False):
+  if flip: return([((LEFT, FLIP[right]), (RIGHT, FLIP[left])) for (left, right) in frames])
+  else:    return([((LEFT, left), (RIGHT, right)) for (left, right) in frames])
+
+# Outer ring running around both digits
+spin=[(A,0),(0,A),(0,B),(0,C),(0,D),(D,0),(E,0),(F,0)]
+
+# Vertical bar sweeping from left to right and back
+sweep=[(F|E,0),(B|C,0),(0,F|E),(0,B|C),(0,F|E),(B|C,0)]
+
+# Segments falling down both digits
+fall=[(A,A),(B|F,B|F),(G,G),(C|E,C|E),(D,D),(0,0)]
+
+# Flash everything, then spin twice and flash again
+win=[(ALL,ALL),(0,0)]*4+spin*2+[(ALL|DP,ALL|DP),(0,0)]*2
+
+# Goal: fast sweep
+goal=sweep*2
+
+# Idle attract loop. Slow ring with a pulsing middle bar
+attract=[(a|(G if i%4<2 else 0), b|(G if i%4<2 else 0)) for (i, (a, b)) in enumerate(spin)]
+
+# Named effects: frames, frames per second and number of times played (0=until cancelled)
+PATTERNS={"spin":    (spin,    FPS, 2),
+          "sweep":   (sweep,   FPS, 2),
+          "fall":    (fall,    FPS, 2),
+          "win":     (win,     12,  1),
+          "goal":    (goal,    30,  1),
+          "attract": (attract, 6,   0)}
+
+# Compiled effects per orientation: COMPILED[flip][name]
+COMPILED={False: {}, True: {}}
+for (name, (frames, fps, repeat)) in PATTERNS.items():
+  for flip in (False, True):
+    COMPILED[flip][name]=compileFrames(frames, flip)
+
+# Play compiled frames on a scoreboard at a fixed frame rate
+class SegmentEffect:
+
+  def __init__(self, teamscore, frames, fps=FPS, repeat=1):
+    self.teamscore=teamscore
+    self.frames=frames
+    self.fps=fps
+    self.total=len(frames)*repeat if repeat else None
+    self.start=time.time()
+    self.current=-1
+    self.handle=None
+
+  def step(self, now):
+    leds=self.teamscore.leds
+    index=int((now-self.start)*self.fps)
+    with self.teamscore.blinklock:
+      if (self.handle and self.handle.cancelled) or (self.total is not None and index>=self.total):
+        self.restore()
+        return(False)
+      if index==self.current: return(True)
+      if self.current<0: leds.setDecode(False)
+      self.current=index
+      for (reg, value) in self.frames[index % len(self.frames)]:
+        leds.setRegister(reg, value)
+      leds.flush()
+    return(True)
+
+  # Back to decimal digits showing the score. Blinklock must be held
+  def restore(self):
+    if self.current<0: return
+    self.current=-1
+    self.teamscore.leds.setDecode(True)
+    self.teamscore.send()
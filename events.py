@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# coding: utf8
+
+# In-process event bus.
+#
+# Producers (gpio callbacks, the activity thread, signal handlers) only publish events, which
+# puts them in the queues of the subscribers and returns at once. Every subscriber has its
+# own thread and a bounded queue, so a slow subscriber (file writes, a display) never stalls
+# the producers or the other subscribers. When a queue is full, the subscribers policy
+# decides what is lost:
+#   DROP_OLDEST: The oldest queued event is dropped
+#   DROP_NEWEST: The new event is dropped
+#   COALESCE:    A queued event of the same kind is removed, and the new one is queued at the
+#                end, so events of different kinds keep their order (occupied, vacant, occupied
+#                ends with occupied). Used when only the latest value matters, like the score.
+#                If the queue is still full, the oldest event is dropped.
+# A subscriber can give an ondrop(event) callback, which is called (outside the queue lock)
+# with every event it drops, so a command can still be answered.
+
+import time
+import logging
+import threading
+import collections
+
+log = logging.getLogger(__name__)
+
+# Event kinds
+GOAL     = "goal"       # team: Goal detected
+BUTTON   = "button"     # gpio, buttondown, tick, team, updown: Score correction button pressed/released
+CHORD    = "chord"      # All 4 score buttons are pressed
+SCORE    = "score"      # score1, score2 (goal, tick if it was a goal): Score changed
+MATCHEND = "matchend"   # score1, score2, reason: Match ended (score reset or table vacant)
+OCCUPIED = "occupied"   # Table is occupied
+VACANT   = "vacant"     # Table is vacant
+PLAYERS  = "players"    # team1, team2: Names of the players at the table (None if unknown)
+COMMAND  = "command"    # command, reply: Command from the command channel. reply(result) when done (may be None)
+
+# Queue policies
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+COALESCE    = "coalesce"
+
+Event = collections.namedtuple("Event", "kind data time")
+
+class EventBus:
+
+  def __init__(self):
+    self.subscribers=[]
+    self.lock=threading.Lock()
+
+  # Call handler(event) in its own thread for every published event of the given kinds (None=all)
+  def subscribe(self, name, handler, kinds=None, maxsize=64, policy=DROP_OLDEST, ondrop=None):
+    sub=Subscriber(name, handler, kinds, maxsize, policy, ondrop)
+    with self.lock:
+      self.subscribers=self.subscribers+[sub]
+    sub.start()
+    return(sub)
+
+  def unsubscribe(self, sub):
+    with self.lock:
+      self.subscribers=[s for s in self.subscribers if s is not sub]
+    sub.stop()
+
+  # Queue event for all subscribers. Never blocks on subscribers
+  def publish(self, kind, **data):
+    event=Event(kind, data, time.time())
+    for sub in self.subscribers:
+      sub.put(event)
+    return(event)
+
+  # Wait until all queued events are handled. Returns False on timeout
+  def drain(self, timeout=None):
+    end=None if timeout is None else time.time()+timeout
+    for sub in self.subscribers:
+      if not sub.drain(None if end is None else max(0, end-time.time())): return(False)
+    return(True)
+
+  # Stop all subscriber threads, after they have handled the queued events
+  def stop(self, timeout=5):
+    with self.lock:
+      subs=self.subscribers
+      self.subscribers=[]
+    for sub in subs: sub.stop(timeout)
+
+class Subscriber:
+
+  def __init__(self, name, handler, kinds=None, maxsize=64, policy=DROP_OLDEST, ondrop=None):
+    if policy not in (DROP_OLDEST, DROP_NEWEST, COALESCE):
+      raise EventException("Unknown queue policy: %s" % policy)
+    self.name=name
+    self.handler=handler
+    self.kinds=frozenset(kinds) if kinds else None
+    self.maxsize=maxsize
+    self.policy=policy
+    self.ondrop=ondrop
+    self.queue=collections.deque()
+    self.cond=threading.Condition()
+    self.busy=False
+    self.stopping=False
+    self.thread=None
+    # Statistics
+    self.handled=0
+    self.dropped=0
+    self.coalesced=0
+
+  def start(self):
+    self.thread=threading.Thread(target=self.run, name="Events-%s" % self.name)
+    self.thread.daemon=True
+    self.thread.start()
+
+  def put(self, event):
+    if self.kinds is not None and event.kind not in self.kinds: return
+    dropped=self.enqueue(event)
+    if dropped and self.ondrop:
+      try:
+        self.ondrop(dropped)
+      except Exception as e:
+        log.exception("Drop handler %s failed on %s event: %s" % (self.name, dropped.kind, e))
+
+  # Queue event. Returns the event dropped to make room (or event itself), or None
+  def enqueue(self, event):
+    with self.cond:
+      if self.stopping: return(None)
+      dropped=None
+      if self.policy==COALESCE:
+        for queued in self.queue:
+          if queued.kind==event.kind:
+            self.queue.remove(queued)
+            self.coalesced+=1
+            break
+      if len(self.queue)>=self.maxsize:
+        self.dropped+=1
+        if self.policy==DROP_NEWEST:
+          log.warning("Event queue of %s full. Dropping %s event" % (self.name, event.kind))
+          return(event)
+        dropped=self.queue.popleft()
+        log.warning("Event queue of %s full. Dropping %s event" % (self.name, dropped.kind))
+      self.queue.append(event)
+      self.cond.notify_all()
+    return(dropped)
+
+  def pending(self):
+    with self.cond:
+      return(len(self.queue))
+
+  def run(self):
+    while True:
+      with self.cond:
+        self.busy=False
+        self.cond.notify_all()
+        while not self.queue and not self.stopping:
+          self.cond.wait()
+        if not self.queue: break
+        event=self.queue.popleft()
+        self.busy=True
+      try:
+        self.handler(event)
+      except Exception as e:
+        log.exception("Event handler %s failed on %s event: %s" % (self.name, event.kind, e))
+      self.handled+=1
+
+  # Wait until the queue is empty and the handler is idle. Returns False on timeout
+  def drain(self, timeout=None):
+    end=None if timeout is None else time.time()+timeout
+    with self.cond:
+      while self.queue or self.busy:
+        if end is None: self.cond.wait()
+        else:
+          left=end-time.time()
+          if left<=0: return(False)
+          self.cond.wait(left)
+    return(True)
+
+  # Handle queued events and stop the thread. New events are ignored
+  def stop(self, timeout=5):
+    with self.cond:
+      self.stopping=True
+      self.cond.notify_all()
+    if self.thread and self.thread is not threading.currentThread():
+      self.thread.join(timeout)
+
+class EventException(Exception): pass
@@ -7,19 +7,112 @@ import threading
 import datetime
 import signal
 import os
+import json
+import tempfile
+import lifecycle
+import statuspage
 
 log = logging.getLogger("Foosball")
 
+# Write data to filename atomically: Readers see either the old or the new file, never half of it
+def atomicWrite(filename, data):
+  (fd, tmpname)=tempfile.mkstemp(dir=os.path.dirname(filename) or ".", prefix="."+os.path.basename(filename))
+  try:
+    with os.fdopen(fd, "w") as f:
+      f.write(data)
+    os.chmod(tmpname, 0o644)
+    os.rename(tmpname, filename)
+  except:
+    os.remove(tmpname)
+    raise
+
+# Keeps the table state (score, vacant, occupied since, heartbeat) in memory and publishes it
+# as one JSON document (state.json), written atomically. Updates are coalesced: The state is
+# written at most once every window seconds, so a burst of changes (button repeats) gives one
+# write. With legacy=True the old text files (score.txt, vacant.txt, heartbeat) are also
+# written, when their value changes.
+class StatePublisher:
+
+  def __init__(self, directory="/var/www/scoreboard", window=0.5, legacy=True):
+    self.fileState=os.path.join(directory, "state.json")
+    self.fileStatus=os.path.join(directory, "vacant.txt")
+    self.fileScore=os.path.join(directory, "score.txt")
+    self.fileHeartbeat=os.path.join(directory, "heartbeat")
+    self.window=window
+    self.legacy=legacy
+    self.lifecycle=None   # lifecycle.Lifecycle tracking the write timer (optional)
+    self.state={"score": [0, 0], "vacant": True, "occupied_since": None, "heartbeat": None, "updated": None}
+    self.published={}     # Values of the legacy files as last written
+    self.lock=threading.Lock()
+    self.writelock=threading.Lock()
+    self.timer=None
+    self.dirty=False
+    self.lastwrite=0
+    self.writes=0         # Number of files written
+    self.version=0        # Increased on every update
+
+  # Change state values. Written within window seconds
+  def update(self, **values):
+    with self.lock:
+      self.state.update(values)
+      self.state["updated"]=time.time()
+      self.version+=1
+      self.dirty=True
+      if self.timer: return
+      delay=max(0, self.lastwrite+self.window-time.time())
+      self.timer=lifecycle.timer(self.lifecycle, delay, self.write)
+
+  # Current state and its version
+  def snapshot(self):
+    with self.lock:
+      return(self.version, dict(self.state))
+
+  # Write pending changes now
+  def flush(self):
+    with self.lock:
+      if self.timer: self.timer.cancel()
+    self.write()
+
+  def write(self):
+    with self.lock:
+      self.timer=None
+      if not self.dirty: return
+      self.dirty=False
+      self.lastwrite=time.time()
+      state=dict(self.state)
+    with self.writelock:
+      try:
+        atomicWrite(self.fileState, json.dumps(state, sort_keys=True)+"\n")
+        self.writes+=1
+        if self.legacy: self.writeLegacy(state)
+      except (IOError, OSError) as e:
+        log.warning("Cannot write table state: %s" % e)
+
+  def writeLegacy(self, state):
+    files=[(self.fileScore, "%d - %d\n" % tuple(state["score"])), (self.fileStatus, "%d\n" % state["vacant"])]
+    if state["heartbeat"] is not None: files.append((self.fileHeartbeat, "%d\n" % state["heartbeat"]))
+    for (filename, data) in files:
+      if self.published.get(filename)==data: continue
+      atomicWrite(filename, data)
+      self.published[filename]=data
+      self.writes+=1
+
 class External:
 
-  def __init__(self, cbSetScore):
-    self.fileStatus="/var/www/scoreboard/vacant.txt"
-    self.fileScore="/var/www/scoreboard/score.txt"
-    self.fileCorrect="/var/www/scoreboard/correctscore.txt"
-    self.goalScript="/var/www/scoreboard/newgoal.sh"
-    self.fileHeartbeat="/var/www/scoreboard/heartbeat"
-    self.pidfile="/var/www/scoreboard/foosball_main.pid"
+  # window: seconds to coalesce state updates. legacy: Also write score.txt, vacant.txt and heartbeat
+  # statuspath: Path of a memory-mapped status page (like /dev/shm/foosball) to keep updated
+  def __init__(self, cbSetScore, directory="/var/www/scoreboard", window=0.5, legacy=True, statuspath=None):
+    self.fileCorrect=os.path.join(directory, "correctscore.txt")
+    self.goalScript=os.path.join(directory, "newgoal.sh")
+    # Scripts run on table events (see hooks.py)
+    self.hookScripts={"goal":     self.goalScript,
+                      "occupied": os.path.join(directory, "occupied.sh"),
+                      "vacant":   os.path.join(directory, "vacant.sh"),
+                      "matchend": os.path.join(directory, "matchend.sh")}
+    self.pidfile=os.path.join(directory, "foosball_main.pid")
     self.cbSetScore=cbSetScore
+    self.publisher=StatePublisher(directory, window, legacy)
+    self.status=statuspage.StatusPage(statuspath) if statuspath else None
 
   def runSignal(self, signo, frame):
     log.debug("Signal recieved - reading new score from scorecorrect-file")
@@ -36,18 +129,28 @@ class External:
       log.debug("Cannot parse file: %s (line1: %s, line2: %s)" % (self.fileCorrect, s1, s2))
 
   def setScore(self, team1, team2):
-    log.debug("Setting score to external file: %d - %d" % (team1, team2))
-    filename=self.fileScore
-    with open(filename, "w") as text_file:
-      text_file.write("%d - %d\n" % (team1, team2))
-    return
+    log.debug("Setting external score: %d - %d" % (team1, team2))
+    self.publisher.update(score=[team1, team2])
+    if self.status: self.status.update(score1=team1, score2=team2)
 
   def setVacant(self,vacant):
-    log.debug("Setting external vacant file to %d" % vacant)
-    filename=self.fileStatus
-    with open(filename, "w") as text_file:
-      text_file.write("%d\n" % vacant)
-    return
+    log.debug("Setting external vacant to %d" % vacant)
+    since=None if vacant else time.time()
+    self.publisher.update(vacant=bool(vacant), occupied_since=since)
+    if self.status: self.status.update(vacant=int(bool(vacant)), occupiedsince=since or 0.0)
+
+  # Goal scored by team at pigpio tick
+  def setGoal(self, team, tick):
+    if self.status: self.status.update(lastgoalteam=team, lastgoaltick=tick, lastgoaltime=time.time())
+
+  # Write pending state
+  def flush(self):
+    self.publisher.flush()
+
+  # Write pending state and remove the pid file
+  def stop(self):
+    self.flush()
+    self.deletePidFile()
 
   def start(self):
     # Write PID file, so signals can reach us easily
@@ -74,8 +177,6 @@ class External:
     t=time.time()
     tstr=datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S')
     #log.debug("Setting heartbeat to %s (%d)" % (tstr, t))
-    filename=self.fileHeartbeat
-    with open(filename, "w") as text_file:
-      text_file.write("%d\n" % t)
-    return
+    self.publisher.update(heartbeat=int(t))
+    if self.status: self.status.beat()
     
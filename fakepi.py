@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# coding: utf8
+
+# In-process stand-in for pigpio.pi, for benchmarks and tests without a pi or a daemon.
+#
+# Implements the calls used by the foosball libraries on a virtual gpio bank.
+# Every call is counted per name, and can be delayed by a latency model, to mimic the
+# round-trip to the pigpio daemon (~50-100 us on a pi). Callbacks run in the thread
+# calling inject(), like the single notification thread of the real pigpio library.
+# Watchdogs are accepted but never fire.
+
+import time
+import random
+import threading
+import collections
+import pigpio
+
+class FakePi:
+
+  # latency: fixed delay in seconds per call. jitter: extra random delay 0-jitter seconds
+  def __init__(self, latency=0, jitter=0, revision=0xa02082):
+    self.latency=latency
+    self.jitter=jitter
+    self.revision=revision
+    self.connected=True
+    self.starttime=time.time()
+    self.lock=threading.RLock()
+    self.cond=threading.Condition(self.lock)
+    self.levels=0
+    self.modes={}
+    self.callbacks=[]
+    self.counts=collections.defaultdict(int)
+    self.nextwave=0
+
+  # Count the call and wait as the latency model says
+  def call(self, name):
+    with self.lock:
+      self.counts[name]+=1
+    delay=self.latency
+    if self.jitter: delay+=random.random()*self.jitter
+    if delay: time.sleep(delay)
+
+  # Number of pigpio calls, in total or for one function name
+  def calls(self, name=None):
+    with self.lock:
+      if name is None: return(sum(self.counts.values()))
+      return(self.counts[name])
+
+  def resetCalls(self):
+    with self.lock:
+      self.counts.clear()
+
+  def tick(self):
+    return(int((time.time()-self.starttime)*1000000) & 0xffffffff)
+
+  # Change the level of a gpio from the outside world. Callbacks are run in this thread
+  def inject(self, gpio, level, tick=None):
+    with self.cond:
+      if ((self.levels >> gpio) & 1)==level: return
+      if level: self.levels|=1 << gpio
+      else:     self.levels&=~(1 << gpio)
+      if tick is None: tick=self.tick()
+      callbacks=[cb for cb in self.callbacks if cb.gpio==gpio and cb.edge in (pigpio.EITHER_EDGE, 1-level)]
+      self.cond.notify_all()
+    for cb in callbacks:
+      cb.func(gpio, level, tick)
+
+  def setLevel(self, gpio, level):
+    if level: self.levels|=1 << gpio
+    else:     self.levels&=~(1 << gpio)
+
+  def set_mode(self, gpio, mode):
+    self.call("set_mode")
+    self.modes[gpio]=mode
+    return(0)
+
+  def get_mode(self, gpio):
+    self.call("get_mode")
+    return(self.modes.get(gpio, pigpio.INPUT))
+
+  def set_pull_up_down(self, gpio, pud):
+    self.call("set_pull_up_down")
+    with self.lock:
+      if pud==pigpio.PUD_UP:     self.setLevel(gpio, 1)
+      elif pud==pigpio.PUD_DOWN: self.setLevel(gpio, 0)
+    return(0)
+
+  def read(self, gpio):
+    self.call("read")
+    return((self.levels >> gpio) & 1)
+
+  def write(self, gpio, level):
+    self.call("write")
+    with self.lock: self.setLevel(gpio, level)
+    return(0)
+
+  def read_bank_1(self):
+    self.call("read_bank_1")
+    return(self.levels)
+
+  def set_bank_1(self, bits):
+    self.call("set_bank_1")
+    with self.lock: self.levels|=bits
+    return(0)
+
+  def clear_bank_1(self, bits):
+    self.call("clear_bank_1")
+    with self.lock: self.levels&=~bits
+    return(0)
+
+  def get_current_tick(self):
+    self.call("get_current_tick")
+    return(self.tick())
+
+  def get_hardware_revision(self):
+    self.call("get_hardware_revision")
+    return(self.revision)
+
+  def set_glitch_filter(self, gpio, steady):
+    self.call("set_glitch_filter")
+    return(0)
+
+  def set_watchdog(self, gpio, timeout):
+    self.call("set_watchdog")
+    return(0)
+
+  def callback(self, gpio, edge=pigpio.RISING_EDGE, func=None):
+    self.call("callback")
+    cb=FakeCallback(self, gpio, edge, func)
+    with self.lock: self.callbacks.append(cb)
+    return(cb)
+
+  def wait_for_edge(self, gpio, edge=pigpio.RISING_EDGE, timeout=60.0):
+    self.call("wait_for_edge")
+    end=time.time()+timeout
+    with self.cond:
+      level=(self.levels >> gpio) & 1
+      while True:
+        new=(self.levels >> gpio) & 1
+        if new!=level:
+          if edge==pigpio.EITHER_EDGE or new==1-edge: return(True)
+          level=new
+        left=end-time.time()
+        if left<=0: return(False)
+        self.cond.wait(left)
+
+  def wave_add_generic(self, pulses):
+    self.call("wave_add_generic")
+    return(len(pulses))
+
+  def wave_create(self):
+    self.call("wave_create")
+    self.nextwave+=1
+    return(self.nextwave-1)
+
+  def wave_send_once(self, wid):
+    self.call("wave_send_once")
+    return(0)
+
+  def wave_tx_busy(self):
+    self.call("wave_tx_busy")
+    return(0)
+
+  def wave_delete(self, wid):
+    self.call("wave_delete")
+    return(0)
+
+  def spi_open(self, channel, baud, flags=0):
+    self.call("spi_open")
+    return(channel)
+
+  def spi_xfer(self, handle, data):
+    self.call("spi_xfer")
+    return(len(data), bytearray(len(data)))
+
+  def spi_close(self, handle):
+    self.call("spi_close")
+    return(0)
+
+  def stop(self):
+    self.connected=False
+
+class FakeCallback:
+
+  def __init__(self, pi, gpio, edge, func):
+    self.pi=pi
+    self.gpio=gpio
+    self.edge=edge
+    self.func=func
+
+  def cancel(self):
+    self.pi.call("callback_cancel")
+    with self.pi.lock:
+      if self in self.pi.callbacks: self.pi.callbacks.remove(self)
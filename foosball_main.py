@@ -8,6 +8,7 @@ import logging
 import signal
 import sys
 import select
+import os
 
 sys.path.append("/home/kristian/pythonlib")
 # My own standard libraries
@@ -16,30 +17,24 @@ import kdate
 import button
 
 # Foosball libraries
+import max7219bb
+import animation
+import events
+import lifecycle
+import webserver
+import commandserver
+import hooks
+import matchlog
+import matcharchive
+import matchstore
+import matchstats
+import analytics
 import teamscore
 import goaldetect
 import activity
 import external
 
-# Should commands be read from stdin
-interactive=False
-
-if len(sys.argv)>1 and sys.argv[1]=="-i":
-  interactive=True
-
-# Setup activity logging options
-filename="./log/activity.log"
 log = logging.getLogger("Foosball")
-# If interactive just use stdout otherwise send to logfile
-if interactive: fh = logging.StreamHandler()
-else:           fh = logging.FileHandler(filename)
-fh.setFormatter(logging.Formatter('%(asctime)s %(module)s %(threadName)s - %(message)s'))
-log.addHandler(fh)
-log.setLevel(logging.DEBUG)
-
-log.debug("Starting foosball main program")
-if interactive: log.debug("Starting in interactive mode")
-else:           log.debug("Starting in non-interactive mode")
 
 # Signal names
 signalnames = {signal.SIGINT:  "SIGINT",
@@ -56,33 +51,101 @@ class Bunch:
 
 class Foosball:
 
-  def __init__(self):
-    self.pi=pigpio.pi()
+  # A pigpio instance (or stand-in) and the directory of the webpage files may be given.
+  # Activity is the table activity engine: activity.EventActivity or the polling activity.Activity
+  # If httpport is given, the state and live changes are served over http on that port
+  # Commands are accepted on the unix socket commandsocket (relative to wwwdir, None to disable)
+  # If statuspath is given, the live state is kept in a memory-mapped status page there
+  # If matchdir is given, played matches are saved in a match archive there
+  # If database is given, matches, goals and occupied periods are saved in that SQLite database
+  # Running statistics are saved in the checkpoint file statsfile (None: not saved)
+  def __init__(self, pi=None, wwwdir="/var/www/scoreboard", Activity=activity.EventActivity, httpport=None,
+               commandsocket="foosball.sock", statuspath=None, matchdir=None, database=None, statsfile=None):
+    self.pi=pi if pi else pigpio.pi()
     self.active=False
+    # All threads and timers are stopped through the lifecycle manager
+    self.lifecycle=lifecycle.Lifecycle()
     # Heartbeat of main thread
     self.hearttime=0
     self.starttime=time.time()
+    # Gpio callbacks and the activity thread only publish events. Goals and buttons are handled
+    # in the game thread, score and status files are written in the external thread
+    self.events=events.EventBus()
+    # Score changes from the game thread, external signals and the main loop are serialized
+    self.scorelock=threading.RLock()
     # Create Activity object which watches table status with vibration sensor
-    self.activity=activity.Activity(self.pi, gpio=17, onVacant=self.vacant, onOccupied=self.occupied)
+    self.activity=Activity(self.pi, gpio=17, onVacant=self.vacant, onOccupied=self.occupied)
     # Create Goaldetect object which watches for goals using the laser sensors
     self.goaldetect=goaldetect.GoalDetect(self.pi, power=9, detect1=10, detect2=11, onGoal=self.goal)
+    self.activity.lifecycle=self.lifecycle
+    self.goaldetect.lifecycle=self.lifecycle
     # Create dictionary to hold team info: scoreboards, buttons and current score
     self.team={1: Bunch(), 2: Bunch()}
+    # Both scoreboards share clock and data gpio pins, so they are connected to one bus
+    # which owns the lock and can update both displays in one transaction
+    self.scorebus=max7219bb.MAX7219Bus(self.pi, clock=22, data=27)
+    # One animation thread runs blinks and effects on both scoreboards, in bus transactions
+    self.animator=animation.Scheduler(bus=self.scorebus)
+    # Segment effect (effects.PATTERNS) played on both scoreboards when the table wakes up (None: none)
+    self.wakeEffect="spin"
     # Create Team 1 scoreboard + 2 buttons
-    self.team[1].scoreboard = teamscore.TeamScore(self.pi, clock=22, data=27, load=23)
+    self.team[1].scoreboard = teamscore.TeamScore(self.pi, clock=22, data=27, load=23, bus=self.scorebus, scheduler=self.animator)
     self.team[1].up         = button.Button(pi=self.pi, gpio=25, callback=self.scoreCorrect, args=[1,1])
     self.team[1].down       = button.Button(pi=self.pi, gpio=18, callback=self.scoreCorrect, args=[1,-1])
     self.team[1].score      = 0
-    self.team[2].scoreboard = teamscore.TeamScore(self.pi, clock=22, data=27, load=24)
+    self.team[2].scoreboard = teamscore.TeamScore(self.pi, clock=22, data=27, load=24, bus=self.scorebus, scheduler=self.animator)
     self.team[2].up         = button.Button(pi=self.pi, gpio=7, callback=self.scoreCorrect, args=[2,1])
     self.team[2].down       = button.Button(pi=self.pi, gpio=8, callback=self.scoreCorrect, args=[2,-1])
     self.team[2].score      = 0
-    # Make sure scoreboards use the same lock, since they share clock and data gpio pins
-    self.team[2].scoreboard.setLock(self.team[1].scoreboard.getLock())
     # Create Menu object
     # TO DO
     # Create external fileupdater object
-    self.external=external.External(cbSetScore=self.setFromExternal)
+    self.external=external.External(cbSetScore=self.externalScore, directory=wwwdir, statuspath=statuspath)
+    self.external.publisher.lifecycle=self.lifecycle
+    # Optional web server with state and live events for the homepage
+    self.webserver=None
+    if httpport is not None:
+      self.webserver=webserver.StateServer(self.external.publisher, port=httpport)
+    # Command channel for score corrections etc. from the homepage
+    self.commands=None
+    if commandsocket:
+      self.commands=commandserver.CommandServer(os.path.join(wwwdir, commandsocket), self.onCommand)
+    # Score to set, when the table has been turned on. Forgotten after pendingtimeout seconds
+    self.pendingScore=None
+    self.pendingTime=0
+    self.pendingtimeout=30
+    # Scripts run on goal, occupied, vacant and match end
+    self.hooks=hooks.HookRunner(self.external.hookScripts)
+    # Played matches and their goals
+    self.archive=matcharchive.MatchArchive(matchdir) if matchdir else None
+    self.database=matchstore.MatchStore(database) if database else None
+    self.matchlog=matchlog.MatchLog(*[s for s in (self.archive, self.database) if s])
+    self.stats=matchstats.MatchStats(statsfile)
+    # Analytics over the archive for the homepage (analytics.json), updated after every match
+    self.analytics=analytics.Analytics(matchdir, os.path.join(wwwdir, "analytics.json")) if matchdir else None
+    # Subscribe game logic and external files to the event bus
+    self.events.subscribe("game", self.onGameEvent, kinds=[events.GOAL, events.BUTTON, events.CHORD, events.COMMAND], policy=events.DROP_NEWEST, ondrop=self.onDropped)
+    self.events.subscribe("external", self.onExternalEvent, kinds=[events.GOAL, events.SCORE, events.OCCUPIED, events.VACANT], policy=events.COALESCE)
+    self.events.subscribe("hooks", self.onHookEvent, kinds=[events.SCORE, events.OCCUPIED, events.VACANT, events.MATCHEND])
+    self.events.subscribe("matches", self.onMatchEvent, kinds=[events.SCORE, events.OCCUPIED, events.VACANT, events.MATCHEND, events.PLAYERS], maxsize=256)
+    self.events.subscribe("statistics", self.stats.onEvent, kinds=[events.SCORE, events.OCCUPIED, events.VACANT, events.MATCHEND], maxsize=256)
+    if self.webserver:
+      self.events.subscribe("web", self.webserver.onEvent, kinds=[events.GOAL, events.SCORE, events.OCCUPIED, events.VACANT])
+    # Components are stopped in this order on shutdown
+    if self.commands:  self.lifecycle.register("commands", self.commands.stop)
+    if self.webserver: self.lifecycle.register("webserver", self.webserver.stop)
+    self.lifecycle.register("goaldetect", self.goaldetect.stop)
+    self.lifecycle.register("hooks", self.hooks.stop)
+    self.lifecycle.register("events", self.events.stop)
+    if self.archive:  self.lifecycle.register("archive", self.archive.close)
+    if self.database: self.lifecycle.register("database", self.database.stop)
+    self.lifecycle.register("statistics", self.stats.stop)
+    self.lifecycle.register("animation", self.animator.stop)
+    self.lifecycle.register("scoreboards", self.shutdownScoreboards)
+    self.lifecycle.register("buttons", self.deactivateButtons)
+    self.lifecycle.register("activity", self.activity.stop, self.activity.join)
+    self.lifecycle.register("pigpio", self.pi.stop)
+    self.lifecycle.register("external", self.external.stop)
     # Listen and catch signals to end program
     self.signalbreak=0
     signal.signal(signal.SIGTERM, self.sigterm)
@@ -91,35 +154,116 @@ class Foosball:
   def sigterm(self, signo, frame):
     log.info("Signal %s recieved. Setting signalbreak to exit main loop" % signalnames[signo])
     self.signalbreak=1
+    self.lifecycle.requestStop()
 
-  # Called when a goal is detected in goaldetect
+  # Called when a goal is detected in goaldetect (pigpio callback thread)
   def goal(self,team):
-    self.activity.click()
-    self.team[team].score+=1
-    self.team[team].scoreboard.goal()
-    self.setExternal()
-    # Something check for win-condition???
+    self.events.publish(events.GOAL, team=team, tick=self.goaldetect.lasttick)
 
-  # Called when a goalcorrection button is pressed/released in a teamscore object
+  # Called when a goalcorrection button is pressed/released in a teamscore object (pigpio callback thread)
   # Buttondown is True on button-press and False on button release
   # Team is 1 or 2 deoending on which teams scoreboard is pressed
   # Updown is -1 for goaldown button and +1 for goalup button
   def scoreCorrect(self, gpio, buttondown, tick, team, updown):
-    #print "ScoreCorrect: gpio=%d, buttondown=%d, team=%d, updown=%d" % (gpio, buttondown, team, updown)
-
     # Special case: If all 4 scorecorrect buttons are pressed, take that as a special case.
-    # Toggle allways off
-    # Players can use that to disable scoreboards, if they donøt like them.
-    # WIP: Needs buttons to NOT be completely disabled onVacant, since that means,
-    #      that you cant turn te scoreboards back on
+    # Checked here, since the pressed states may have changed once the event is handled
     if (self.team[1].up.pressed and self.team[1].down.pressed and
         self.team[2].up.pressed and self.team[2].down.pressed):
-      newstate=not self.activity.allwaysOff
-      self.activity.setAllwaysOff(newstate)
-      if newstate==False:
-        self.activity.turnOn()
-        time.sleep(.3)
+      self.events.publish(events.CHORD)
+    self.events.publish(events.BUTTON, gpio=gpio, buttondown=buttondown, tick=tick, team=team, updown=updown)
+
+  # Game thread: Goals, buttons and chords
+  def onGameEvent(self, event):
+    with self.scorelock:
+      if   event.kind==events.GOAL:   self.scoreGoal(**event.data)
+      elif event.kind==events.BUTTON: self.scoreButton(**event.data)
+      elif event.kind==events.CHORD:  self.buttonChord()
+      elif event.kind==events.COMMAND: self.runCommand(**event.data)
+
+  # Command server thread: Queue command for the game thread
+  def onCommand(self, command, reply):
+    self.events.publish(events.COMMAND, command=command, reply=reply)
+
+  # Game queue full: A dropped command is answered, so the client does not wait for it
+  def onDropped(self, event):
+    if event.kind==events.COMMAND and event.data["reply"]:
+      event.data["reply"]({"ok": False, "error": "Busy: command dropped"})
+
+  # Score from correctscore.txt (SIGUSR1). Applied in the game thread like other commands
+  def externalScore(self, score1, score2):
+    self.events.publish(events.COMMAND, command={"cmd": "score", "score1": score1, "score2": score2}, reply=None)
+
+  # Game thread: Run a command and reply with the result
+  def runCommand(self, command, reply):
+    try:
+      result={"ok": True, "state": self.command(command)}
+    except (ValueError, TypeError, KeyError) as e:
+      result={"ok": False, "error": "%s: %s" % (e.__class__.__name__, e)}
+    except Exception as e:
+      log.exception("Command %s failed: %s" % (command, e))
+      result={"ok": False, "error": "%s: %s" % (e.__class__.__name__, e)}
+    if reply: reply(result)
+
+  def command(self, command):
+    cmd=command.get("cmd")
+    log.debug("Command: %s" % command)
+    if   cmd=="score":     self.setFromExternal(self.nfix(int(command["score1"])), self.nfix(int(command["score2"])))
+    elif cmd=="reset":     self.resetScore()
+    elif cmd=="alwayson":  self.activity.setAllwaysOn(bool(command.get("state", True)))
+    elif cmd=="alwaysoff": self.activity.setAllwaysOff(bool(command.get("state", True)))
+    elif cmd=="players":   self.setPlayers(command.get("team1"), command.get("team2"))
+    elif cmd!="state":     raise ValueError("Unknown command %r" % cmd)
+    return({"score": [self.team[1].score, self.team[2].score], "active": self.active,
+            "pending": self.pendingScore, "allwaysOn": bool(self.activity.allwaysOn),
+            "allwaysOff": bool(self.activity.allwaysOff)})
+
+  # Names of the players of team 1 and 2 (None: unknown). Kept until the table is vacant
+  def setPlayers(self, team1, team2):
+    for name in (team1, team2):
+      if name is not None and not isinstance(name, basestring): raise TypeError("Player name must be a string: %r" % (name,))
+    self.events.publish(events.PLAYERS, team1=team1 or None, team2=team2 or None)
+
+  # Hooks thread: Queue scripts. They are run by the hook workers
+  def onHookEvent(self, event):
+    data=event.data
+    if event.kind==events.SCORE:
+      if "goal" in data:
+        self.hooks.trigger("goal", team=data["goal"], tick=data["tick"], score1=data["score1"], score2=data["score2"])
+    else:
+      self.hooks.trigger(event.kind, **data)
+
+  # Matches thread: Save matches, then update the analytics of the archive
+  def onMatchEvent(self, event):
+    self.matchlog.onEvent(event)
+    if event.kind==events.MATCHEND and self.analytics: self.analytics.onEvent(event)
+
+  # External thread: Score and status files
+  def onExternalEvent(self, event):
+    if   event.kind==events.SCORE:    self.external.setScore(event.data["score1"], event.data["score2"])
+    elif event.kind==events.OCCUPIED: self.external.setVacant(0)
+    elif event.kind==events.VACANT:   self.external.setVacant(1)
+    elif event.kind==events.GOAL:     self.external.setGoal(event.data["team"], event.data["tick"])
+
+  def scoreGoal(self, team, tick=0):
+    self.activity.click()
+    self.team[team].score+=1
+    self.team[team].scoreboard.goal()
+    self.setExternal(goal=team, tick=tick)
+    # Something check for win-condition???
+
+  # All 4 buttons pressed: Toggle allways off
+  # Players can use that to disable scoreboards, if they donøt like them.
+  # WIP: Needs buttons to NOT be completely disabled onVacant, since that means,
+  #      that you cant turn te scoreboards back on
+  # Runs in the game thread holding scorelock, so it must not wait for the table to turn on:
+  # occupied() updates the scoreboards, when the activity thread sees the change
+  def buttonChord(self):
+    newstate=not self.activity.allwaysOff
+    self.activity.setAllwaysOff(newstate)
+    if newstate==False:
+      self.activity.turnOn()
 
+  def scoreButton(self, gpio, buttondown, tick, team, updown):
     # What to do if the table is vacant/inactive?
     if self.active==False:
       st="pressed" if buttondown==True else "released"
@@ -162,20 +306,34 @@ class Foosball:
     self.team[team].score=self.nfix(score)
     self.team[team].scoreboard.scoreCorrect(self.team[team].score)
 
-  def setExternal(self):
-    self.external.setScore(self.team[1].score, self.team[2].score)
+  # Publish the score. The external thread writes it to the score file
+  def setExternal(self, **extra):
+    self.events.publish(events.SCORE, score1=self.team[1].score, score2=self.team[2].score, **extra)
+
+  # Publish the end of a match, if one was played
+  def matchEnd(self, reason):
+    if self.team[1].score or self.team[2].score:
+      self.events.publish(events.MATCHEND, score1=self.team[1].score, score2=self.team[2].score, reason=reason)
 
+  # If the table is off, it is turned on, and the score is set when it is occupied
+  # A table turned off with allwaysOff can't be turned on, so the score is rejected
   def setFromExternal(self, score1, score2):
-    if self.active==False:
-      log.debug("Turning table on and waiting for comfirmation")
-      self.activity.turnOn()
-      while not self.active:
-        time.sleep(.3)
-    self.setTeamScore(1, score1)
-    self.setTeamScore(2, score2)
-    self.setExternal()
-    self.team[1].scoreboard.blinkStart()
-    self.team[2].scoreboard.blinkStart()
+    with self.scorelock:
+      if self.active==False:
+        if self.activity.allwaysOff:
+          raise ValueError("Table is turned off (allwaysOff)")
+        log.debug("Turning table on. Score set when it is on")
+        self.pendingScore=(score1, score2)
+        self.pendingTime=time.time()
+        self.activity.turnOn()
+        return
+    # Update both scoreboards in one bus transaction
+    with self.scorelock, self.scorebus.batch():
+      self.setTeamScore(1, score1)
+      self.setTeamScore(2, score2)
+      self.team[1].scoreboard.blinkStart()
+      self.team[2].scoreboard.blinkStart()
+      self.setExternal()
 
   # Called to set the score - for instance by external object on signal
   # or by a resetScore from the menu
@@ -183,121 +341,170 @@ class Foosball:
     if score1==0 and score2==0:
       self.resetScore()
     else:
-      self.setTeamScore(1, score1)
-      self.setTeamScore(2, score2)
-      self.setExternal()
+      with self.scorelock, self.scorebus.batch():
+        self.setTeamScore(1, score1)
+        self.setTeamScore(2, score2)
+        self.setExternal()
 
   # Called if setScore is setting the score to 0-0
   def resetScore(self):
     log.info("Resetting table score")
-    self.team[1].score=0
-    self.team[2].score=0
-    self.team[1].scoreboard.reset() # Use reset to allow for possible blinks
-    self.team[2].scoreboard.reset() # Use reset to allow for possible blinks
-    self.setExternal()
+    with self.scorelock:
+      # A match ended on a vacant table is allready published
+      if self.active: self.matchEnd("reset")
+      self.team[1].score=0
+      self.team[2].score=0
+      with self.scorebus.batch():
+        self.team[1].scoreboard.reset() # Use reset to allow for possible blinks
+        self.team[2].scoreboard.reset() # Use reset to allow for possible blinks
+      self.setExternal()
 
   def heartbeat(self):
     self.hearttime=time.time()
     self.activity.heartmain=self.hearttime
     if self.hearttime-self.activity.hearttime > 60:
       log.debug("No heartbeat from external thread for 1 minute. Stopping program")
-      self.stop()
+      self.lifecycle.requestStop()
 
   def start(self):
     log.info("Starting Foosball control class instance")
     self.heartbeat()
     self.external.start()
+    if self.webserver: self.webserver.start()
+    if self.commands:  self.commands.start()
+    self.hooks.start()
+    if self.database: self.database.start()
     self.activity.start()
 
+  # Stop all threads and turn off all equipment. Returns list of (component, seconds)
   def stop(self):
-    # Turn off all equipment on all pins
-    log.debug("Stopping activity sensor thread")
-    if self.goaldetect.active: self.goaldetect.stop()
-    log.debug("Calling scoreboard shutdown")
+    return(self.lifecycle.shutdown())
+
+  def shutdownScoreboards(self):
     if self.team[1].scoreboard.active: self.team[1].scoreboard.shutdown()
     if self.team[2].scoreboard.active: self.team[2].scoreboard.shutdown()
-    log.debug("Deassigning goal correction buttons")
+
+  def deactivateButtons(self):
     self.team[1].up.deactivate()
     self.team[1].down.deactivate()
     self.team[2].up.deactivate()
     self.team[2].down.deactivate()
-    # Stop activity sensor and wait for the thread to return (max ca. 10 seconds)
-    self.activity.stop()
-    self.activity.thread.join()
-    log.debug("Activity thread joined")
-    log.debug("Stopping pi instance")
-    self.pi.stop()
-    self.external.deletePidFile()
+
+  # Resend everything to the scoreboards. Recovers displays showing garbage
+  def refreshScoreboards(self):
+    if not self.active: return
+    self.team[1].scoreboard.refresh()
+    self.team[2].scoreboard.refresh()
 
   def vacant(self):
-    self.active=False
-    self.external.setVacant(1)
-    self.team[1].scoreboard.shutdown()
-    self.team[2].scoreboard.shutdown()
+    with self.scorelock:
+      self.active=False
+      self.matchEnd("vacant")
+    self.events.publish(events.VACANT)
+    with self.scorebus.batch():
+      self.team[1].scoreboard.shutdown()
+      self.team[2].scoreboard.shutdown()
     self.goaldetect.stop()
     log.info("Bordet er ledigt")
 
   def occupied(self):
-    self.external.setVacant(0)
+    self.events.publish(events.OCCUPIED)
     self.resetScore()
     self.active=True
-    self.team[1].scoreboard.wakeup()
-    self.team[2].scoreboard.wakeup()
+    with self.scorebus.batch():
+      self.team[1].scoreboard.wakeup()
+      self.team[2].scoreboard.wakeup()
+    # The score is shown again when the effect ends, or at once on the first goal or correction
+    if self.wakeEffect:
+      self.team[1].scoreboard.playEffect(self.wakeEffect)
+      self.team[2].scoreboard.playEffect(self.wakeEffect)
     self.goaldetect.start()
     log.info("Bordet er nu optaget")
-
-# Create a new Foosball instance and start it
-foosball=Foosball()
-foosball.start()
-time.sleep(3)
-
-# Main loop. Only actions are:
-#  1: Log status
-#  2: Report a heartbeat to the "watchdog"
-#  3: Refresh score displays periodically, to recover from random mistakes
-try:
-  log.debug("Entering main loop")
-  n=60
-  mainbeat=0;
-  while True:
-    foosball.heartbeat()
-    foosball.external.setHeartbeat()
-    try:
-      command=""
-      # Should we take commands from stdin, then wait 60 seconds for command
-      if interactive:
-        i, o, e = select.select( [sys.stdin], [], [], 60 )
-        if i:
-          command=sys.stdin.readline().strip()
-      # Else just sleep for 60 seconds
-      else:
-        time.sleep(60)
-
-      if   command=="":  pass
-      elif command=="q": foosball.signalbreak=1
-      elif command=="i": foosball.activity.setAllwaysOff(not foosball.activity.allwaysOff)
-      elif command=="a": foosball.activity.setAllwaysOn(not foosball.activity.allwaysOn)
-      elif command=="r": foosball.resetScore()
-      elif command.isdigit(): foosball.setScore(int(command),foosball.team[2].score)
-      else:
-        log.info("Unknown command %s recieved" % command)
-    # If exception was caught from select due to signal, then ignore
-    except select.error:
-      pass
-
-    if threading.activeCount()<3:
-      log.debug("Number of threads is lower than 3. Seems strange. Quitting")
-      break
+    # Score given while the table was off
+    with self.scorelock:
+      pending=self.pendingScore
+      self.pendingScore=None
+    if pending and time.time()-self.pendingTime>self.pendingtimeout:
+      log.info("Pending score %d-%d expired" % pending)
+    elif pending: self.setFromExternal(*pending)
+
+# Run the table, when started as a program
+if __name__ == '__main__':
+  # Should commands be read from stdin
+  interactive=False
+
+  if "-i" in sys.argv[1:]:
+    interactive=True
+  # Serve state and live events over http
+  httpport=8080 if "-w" in sys.argv[1:] else None
+
+  # Setup activity logging options
+  filename="./log/activity.log"
+  # If interactive just use stdout otherwise send to logfile
+  if interactive: fh = logging.StreamHandler()
+  else:           fh = logging.FileHandler(filename)
+  fh.setFormatter(logging.Formatter('%(asctime)s %(module)s %(threadName)s - %(message)s'))
+  log.addHandler(fh)
+  log.setLevel(logging.DEBUG)
+
+  log.debug("Starting foosball main program")
+  if interactive: log.debug("Starting in interactive mode")
+  else:           log.debug("Starting in non-interactive mode")
+
+  # Create a new Foosball instance and start it
+  foosball=Foosball(httpport=httpport, statuspath="/dev/shm/foosball", matchdir="./log/matches",
+                    database="./log/foosball.db", statsfile="./log/statistics.json")
+  foosball.start()
+  foosball.lifecycle.wait(3)
+
+  # Main loop. Only actions are:
+  #  1: Log status
+  #  2: Report a heartbeat to the "watchdog"
+  #  3: Refresh score displays periodically, to recover from random mistakes
+  try:
+    log.debug("Entering main loop")
+    n=60
+    mainbeat=0;
+    while True:
+      foosball.heartbeat()
+      foosball.external.setHeartbeat()
+      foosball.refreshScoreboards()
+      try:
+        command=""
+        # Should we take commands from stdin, then wait 60 seconds for command
+        if interactive:
+          i, o, e = select.select( [sys.stdin], [], [], 60 )
+          if i:
+            command=sys.stdin.readline().strip()
+        # Else just sleep for 60 seconds (or until asked to stop)
+        else:
+          foosball.lifecycle.wait(60)
+
+        if   command=="":  pass
+        elif command=="q": foosball.lifecycle.requestStop()
+        elif command=="i": foosball.activity.setAllwaysOff(not foosball.activity.allwaysOff)
+        elif command=="a": foosball.activity.setAllwaysOn(not foosball.activity.allwaysOn)
+        elif command=="r": foosball.resetScore()
+        elif command.isdigit(): foosball.setScore(int(command),foosball.team[2].score)
+        else:
+          log.info("Unknown command %s recieved" % command)
+      # If exception was caught from select due to signal, then ignore
+      except select.error:
+        pass
+
+      if threading.activeCount()<3:
+        log.debug("Number of threads is lower than 3. Seems strange. Quitting")
+        break
       
-    if foosball.signalbreak: 
-      log.debug("Shutdown order given - Exiting main loop")
-      break
-    mainbeat+=1
-    if mainbeat%100==0:
-      q=time.time()
-      log.info("Main loop %d loops." % mainbeat)
-
-# If we stop - for any reason - stop foosball instance.
-finally:
-  log.debug("Running finally cleanup code")
-  foosball.stop()
+      if foosball.lifecycle.isStopping():
+        log.debug("Shutdown order given - Exiting main loop")
+        break
+      mainbeat+=1
+      if mainbeat%100==0:
+        q=time.time()
+        log.info("Main loop %d loops." % mainbeat)
+
+  # If we stop - for any reason - stop foosball instance.
+  finally:
+    log.debug("Running finally cleanup code")
+    foosball.stop()
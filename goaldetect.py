@@ -3,13 +3,22 @@ import pigpio
 import time
 import threading
 import logging
+import collections
+import lifecycle
 
 # Fetch logger from main thread
 log = logging.getLogger(__name__)
 
+# One ball passing a laser: when (tick of beam break), which team, how long the beam was
+# broken (us), estimated ball speed (m/s) and whether it was accepted as a goal
+Transit = collections.namedtuple("Transit", "tick team duration speed accepted")
+
 class GoalDetect:
   
-  def __init__(self, pi, power, detect1, detect2, config=False, onGoal=None):
+  # A goal is only counted if the beam is broken between mintransit and maxtransit micro seconds.
+  # With validate=False goals are counted on beam break (as before) and transits are only measured
+  def __init__(self, pi, power, detect1, detect2, config=False, onGoal=None,
+               mintransit=1000, maxtransit=500000, ballsize=0.035, glitch=100, validate=True, history=64):
     self.pi=pi
     # Set power pin and turn lasers off
     log.debug("Assigning laser power pin=%d" % power)
@@ -29,11 +38,28 @@ class GoalDetect:
     self.onGoal=onGoal
     self.cb1=False
     self.cb2=False
+    # Transit time validation
+    self.mintransit=mintransit  # Shortest accepted beam interruption (us)
+    self.maxtransit=maxtransit  # Longest accepted beam interruption (us)
+    self.ballsize=ballsize      # Ball diameter in meters, for speed estimate
+    self.glitch=glitch          # Glitch filter on detector pins (us). Keep it well below mintransit,
+                                # or short real transits are filtered away before they are measured
+    if validate and glitch>=mintransit:
+      log.warning("Glitch filter (%d us) is not shorter than mintransit (%d us). Short transits are lost" % (glitch, mintransit))
+    self.validate=validate
+    self.breaktick={}           # gpio -> tick when beam was broken
+    # Ring buffer with the latest transits
+    self.transits=collections.deque(maxlen=history)
+    self.transitlock=threading.Lock()
 
     # Disable goal output
     self.output=(False, False)
     # Detector not started
     self.active=False
+    # Tick of the latest goal
+    self.lasttick=0
+    # lifecycle.Lifecycle tracking timers (optional)
+    self.lifecycle=None
 
   def start(self):
     log.debug("Starting goaldetector")
@@ -43,11 +69,13 @@ class GoalDetect:
     time.sleep(.1)
     self.cb1 = self.pi.callback(self.detect[0], pigpio.EITHER_EDGE, self.goaltrigger)
     self.cb2 = self.pi.callback(self.detect[1], pigpio.EITHER_EDGE, self.goaltrigger)
-    self.pi.set_glitch_filter(self.detect[0], 3000)
-    self.pi.set_glitch_filter(self.detect[1], 3000)
+    self.pi.set_glitch_filter(self.detect[0], self.glitch)
+    self.pi.set_glitch_filter(self.detect[1], self.glitch)
+    self.breaktick={}
     self.active=True
 
   def stop(self):
+    if not self.active: return
     log.debug("Stopping goaldetector")
     if self.cb1: self.cb1.cancel()
     if self.cb2: self.cb2.cancel()
@@ -78,7 +106,7 @@ class GoalDetect:
       self.pi.write(pin,1)
       log.debug("Giving goal indication on pin %d",pin)
       # Set a timer to turn off the pin in 2 seconds
-      treading.Timer(2.0, outputOff, [team])
+      lifecycle.timer(self.lifecycle, 2.0, self.outputOff, team)
 
   def outputOff(self, team):
     pin=self.output[team-1]
@@ -86,19 +114,43 @@ class GoalDetect:
       self.pi.write(pin,0)
       log.debug("Turning off  goal indication on pin %d",pin)
 
+  # Latest transits, oldest first
+  def measurements(self):
+    with self.transitlock:
+      return(list(self.transits))
+
   def goaltrigger(self, gpio, level, tick):
     log.debug("Goal triggered on gpio=%d, level=%d" % (gpio,level))
     # If detector is not active, do nothing (callbacks should be inactive anyway)
     if not self.active: return
-    # Only react to laser off events 
-    # (laser off -> phototransistor off -> No connection to ground -> pin pulled high by pull-up)
-    # Should perhaps be changed to measure ball passing time, to filter out
-    # false positives
-    if level==0: return
     # Which team scored
     if   gpio==self.detect[0]: team=1
     elif gpio==self.detect[1]: team=2
     else: raise GoalDetectException("Strange pin triggered in goaldetect")
+    # Laser off (beam broken by the ball)
+    # (laser off -> phototransistor off -> No connection to ground -> pin pulled high by pull-up)
+    if level==1:
+      self.breaktick[gpio]=tick
+      if not self.validate: self.scored(team, tick)
+      return
+    # Laser back on. Measure how long the ball was in the beam. tickDiff handles 32 bit wraparound
+    start=self.breaktick.pop(gpio, None)
+    if start is None: return
+    duration=pigpio.tickDiff(start, tick)
+    speed=self.ballsize/(duration/1000000.0) if duration else 0.0
+    accepted=self.mintransit<=duration<=self.maxtransit
+    with self.transitlock:
+      self.transits.append(Transit(start, team, duration, speed, accepted))
+    if not self.validate: return
+    if not accepted:
+      log.info("Goal for team %d rejected. Beam broken %d us (allowed %d-%d us)" % (team, duration, self.mintransit, self.maxtransit))
+      return
+    log.debug("Goal for team %d. Beam broken %d us, ball speed %.1f m/s" % (team, duration, speed))
+    self.scored(team, start)
+
+  # Tick is the tick of the beam break
+  def scored(self, team, tick):
+    self.lasttick=tick
     # Set output pin (if defined)
     self.outputGoal(team)
     # Call external callback function
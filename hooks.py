@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Runs external scripts (hooks) on table events: goal, occupied, vacant and matchend.
+#
+# trigger() only queues the hook and returns; a small pool of worker threads runs the scripts.
+#  - A hook already waiting in the queue is not queued twice. It runs once with the newest data
+#  - The same hook is started at most once every interval seconds, and never runs twice at once
+#  - A hook running longer than timeout seconds is killed (with the processes it started)
+#  - When the queue is full, the oldest waiting hook is dropped
+# The event data is given to the script as environment variables (FOOSBALL_EVENT and
+# FOOSBALL_<KEY> for every value) and as a JSON object on stdin. Missing or non-executable
+# scripts are skipped.
+
+import os
+import json
+import signal
+import time
+import logging
+import threading
+import subprocess
+
+log = logging.getLogger("Foosball")
+
+class Job:
+  def __init__(self, name, data, notbefore):
+    self.name=name
+    self.data=data
+    self.time=time.time()
+    self.notbefore=notbefore
+
+class HookRunner:
+
+  # hooks: dict of event name -> script path
+  def __init__(self, hooks, workers=2, timeout=10, interval=1.0, maxqueue=32):
+    self.hooks=dict(hooks)
+    self.workers=workers
+    self.timeout=timeout
+    self.interval=interval
+    self.maxqueue=maxqueue
+    self.queue=[]
+    self.running={}      # name -> Popen
+    self.lastrun={}      # name -> start time of latest run
+    self.cond=threading.Condition()
+    self.threads=[]
+    self.stopping=False
+    # Statistics
+    self.runs=0
+    self.failures=0
+    self.timeouts=0
+    self.coalesced=0
+    self.dropped=0
+
+  def start(self):
+    self.stopping=False
+    for i in range(self.workers):
+      t=threading.Thread(target=self.run, name="Hooks-%d" % (i+1))
+      t.daemon=True
+      t.start()
+      self.threads.append(t)
+
+  # Kill running hooks and stop the workers. Queued hooks are not run
+  def stop(self, timeout=2):
+    with self.cond:
+      self.stopping=True
+      self.queue=[]
+      for p in self.running.values():
+        if p: kill(p)
+      self.cond.notify_all()
+    for t in self.threads: t.join(timeout)
+    self.threads=[]
+
+  # Queue the hook of event name. Returns False if there is no such hook
+  def trigger(self, name, **data):
+    script=self.hooks.get(name)
+    if not script or not os.access(script, os.X_OK): return(False)
+    with self.cond:
+      if self.stopping: return(False)
+      for job in self.queue:
+        if job.name==name:
+          job.data=data
+          job.time=time.time()
+          self.coalesced+=1
+          return(True)
+      if len(self.queue)>=self.maxqueue:
+        dropped=self.queue.pop(0)
+        self.dropped+=1
+        log.warning("Hook queue full. Dropping %s hook" % dropped.name)
+      self.queue.append(Job(name, data, self.lastrun.get(name, 0)+self.interval))
+      self.cond.notify()
+    return(True)
+
+  # Next job which may run now, or the time when one may. Condition must be held
+  def nextJob(self, now):
+    wakeup=None
+    for job in self.queue:
+      if job.name in self.running: continue
+      if job.notbefore<=now:
+        self.queue.remove(job)
+        return(job, None)
+      wakeup=job.notbefore if wakeup is None else min(wakeup, job.notbefore)
+    return(None, wakeup)
+
+  def run(self):
+    while True:
+      with self.cond:
+        while True:
+          if self.stopping: return
+          (job, wakeup)=self.nextJob(time.time())
+          if job: break
+          self.cond.wait(None if wakeup is None else max(0.001, wakeup-time.time()))
+        self.running[job.name]=None
+        self.lastrun[job.name]=time.time()
+      try:
+        self.execute(job)
+      except Exception as e:
+        self.failures+=1
+        log.exception("Hook %s failed: %s" % (job.name, e))
+      with self.cond:
+        del self.running[job.name]
+        # Queued runs of this hook wait for the interval from this start
+        for queued in self.queue:
+          if queued.name==job.name: queued.notbefore=self.lastrun[job.name]+self.interval
+        self.cond.notify_all()
+
+  def execute(self, job):
+    script=self.hooks[job.name]
+    env=dict(os.environ)
+    env["FOOSBALL_EVENT"]=job.name
+    for (key, value) in job.data.items():
+      if isinstance(value, (bool, int, long, float, str, unicode)): env["FOOSBALL_%s" % key.upper()]=str(value)
+    payload=json.dumps(dict(job.data, event=job.name, time=job.time), sort_keys=True)
+    with open(os.devnull, "w") as devnull:
+      # Own process group, so children of the script are killed with it
+      p=subprocess.Popen([script], stdin=subprocess.PIPE, stdout=devnull, stderr=subprocess.PIPE, env=env, close_fds=True,
+                         preexec_fn=os.setsid)
+    with self.cond:
+      self.running[job.name]=p
+      if self.stopping: kill(p)
+    killed=[]
+    timer=threading.Timer(self.timeout, lambda: killed.append(kill(p)))
+    timer.daemon=True
+    timer.start()
+    start=time.time()
+    try:
+      (out, err)=p.communicate(payload)
+    finally:
+      timer.cancel()
+    self.runs+=1
+    if killed:
+      self.timeouts+=1
+      log.warning("Hook %s killed after %d seconds" % (job.name, self.timeout))
+    elif p.returncode!=0:
+      self.failures+=1
+      log.warning("Hook %s failed with exit code %d: %s" % (job.name, p.returncode, err.strip()[:200]))
+    else:
+      log.debug("Hook %s ran in %.3f seconds" % (job.name, time.time()-start))
+
+# Kill the process group of a hook
+def kill(p):
+  try:
+    os.killpg(p.pid, signal.SIGKILL)
+  except OSError:
+    pass
+  return(True)
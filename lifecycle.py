@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Coordinated shutdown of all threads of the program.
+#
+# Components (threads, event handlers, hardware) are registered with a stop function and
+# optionally a join function, and are stopped in the order they were registered. Timers are
+# started through the manager, so pending timers can be cancelled. Threads wait on the
+# stopping event (wait) in stead of sleeping, so a stop request (from a signal handler or
+# the main loop) brings everything down at once. Shutdown reports the time spent on each
+# component.
+
+import time
+import logging
+import threading
+
+log = logging.getLogger("Foosball")
+
+class Lifecycle:
+
+  def __init__(self, jointimeout=2):
+    self.jointimeout=jointimeout
+    self.stopping=threading.Event()
+    self.components=[]
+    self.timers=set()
+    self.lock=threading.Lock()
+    self.stoptimes=None
+
+  # stop() is called on shutdown, then join(timeout) if given
+  def register(self, name, stop, join=None):
+    with self.lock:
+      self.components.append((name, stop, join))
+
+  # Start a timer, which is cancelled on shutdown. Returns None when shutting down
+  def timer(self, delay, func, *args):
+    with self.lock:
+      if self.stopping.isSet(): return(None)
+      t=threading.Timer(delay, self.runTimer, [func, args])
+      t.daemon=True
+      self.timers.add(t)
+    t.start()
+    return(t)
+
+  def runTimer(self, func, args):
+    with self.lock:
+      self.timers.discard(threading.currentThread())
+    func(*args)
+
+  # Sleep for timeout seconds or until shutdown. Returns True when shutting down
+  def wait(self, timeout=None):
+    return(self.stopping.wait(timeout))
+
+  def isStopping(self):
+    return(self.stopping.isSet())
+
+  # Ask everything to stop. Safe to call from signal handlers
+  def requestStop(self):
+    self.stopping.set()
+
+  # Stop all components. Returns list of (name, seconds). Only stops once
+  def shutdown(self):
+    with self.lock:
+      if self.stoptimes is not None: return(self.stoptimes)
+      self.stoptimes=[]
+      self.stopping.set()
+      timers=list(self.timers)
+      self.timers.clear()
+      components=list(self.components)
+    for t in timers: t.cancel()
+    start=time.time()
+    for (name, stop, join) in components:
+      t=time.time()
+      try:
+        stop()
+        if join: join(self.jointimeout)
+      except Exception as e:
+        log.exception("Stopping %s failed: %s" % (name, e))
+      self.stoptimes.append((name, time.time()-t))
+      log.debug("Stopped %s in %.3f seconds" % (name, time.time()-t))
+    log.info("Shutdown took %.3f seconds (%s)" % (time.time()-start,
+             ", ".join("%s %.3f" % (name, s) for (name, s) in self.stoptimes)))
+    return(self.stoptimes)
+
+# Start a timer through manager, or a plain daemon timer if there is no manager
+def timer(manager, delay, func, *args):
+  if manager: return(manager.timer(delay, func, *args))
+  t=threading.Timer(delay, func, args)
+  t.daemon=True
+  t.start()
+  return(t)
@@ -0,0 +1,327 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Archive of all played matches, stored as columns of fixed width values.
+#
+# The archive is a directory of segments: one directory per day (YYYYMMDD) with the matches
+# which started that day, and compacted segments (YYYYMM) with closed days merged into one
+# segment per month. In every segment each column is a file of little endian values:
+#   matches.<column>  One value per match (see MATCHES)
+#   goals.<column>    One value per goal, in match order (see GOALS)
+# A match is appended by writing its goals, then one value to every match column, so adding
+# a match costs the same no matter how large the archive is. A match exists when all its
+# columns are written. A half written match (power cut) is ignored by readers and cut off by
+# the next writer.
+#
+# Readers memory-map the columns as numpy arrays, so queries need no parsing and no copying.
+# The goals of match i of a segment are rows firstgoal[i]:firstgoal[i]+goals[i] of the goal
+# columns. Writing needs no numpy.
+#
+# Usage: matcharchive.py [directory] [-c]   Show the latest matches (-c: compact first)
+
+import os
+import sys
+import time
+import shutil
+import struct
+import logging
+import threading
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+log = logging.getLogger("Foosball")
+
+DIRECTORY="./log/matches"
+
+# (column, numpy type, struct format)
+MATCHES=[("start",  "<f8", "<d"),    # Unix time the match started
+         ("end",    "<f8", "<d"),    # Unix time the match ended
+         ("score1", "<u1", "<B"),
+         ("score2", "<u1", "<B"),
+         ("goals",  "<u2", "<H"),    # Number of goals in the goal columns
+         ("reason", "<u1", "<B"),    # Why the match ended (see REASONS)
+         ("id",     "<u4", "<I")]    # Match number. Increasing through the archive
+GOALS=[("match",  "<u4", "<I"),      # Match number
+       ("team",   "<u1", "<B"),
+       ("tick",   "<u4", "<I"),      # pigpio tick of the goal (0 if not known)
+       ("offset", "<f4", "<f"),      # Seconds since the start of the match
+       ("score1", "<u1", "<B"),      # Score after the goal
+       ("score2", "<u1", "<B")]
+
+REASONS={None: 0, "reset": 1, "vacant": 2}
+
+def isDay(name):     return(len(name)==8 and name.isdigit())
+def isMonth(name):   return(len(name)==6 and name.isdigit())
+def isSegment(name): return(isDay(name) or isMonth(name))
+
+def columnFile(path, table, column):
+  return(os.path.join(path, "%s.%s" % (table, column)))
+
+# Number of complete values in a column file
+def columnLength(path, table, column, dtype):
+  try:
+    return(os.path.getsize(columnFile(path, table, column))//int(dtype[2:]))
+  except OSError:
+    return(0)
+
+# Number of complete matches in a segment
+def matchCount(path):
+  return(min(columnLength(path, "matches", c, t) for (c, t, f) in MATCHES))
+
+# Read the values of a column without numpy (used by the writer to repair a segment)
+def readColumn(path, table, column, fmt, count):
+  size=struct.calcsize(fmt)
+  with open(columnFile(path, table, column), "rb") as f:
+    data=f.read(count*size)
+  return(struct.unpack("<%d%s" % (count, fmt[1]), data))
+
+# Cut all columns of a segment to its complete matches. Returns the number of matches
+def repair(path):
+  n=matchCount(path)
+  ngoals=sum(readColumn(path, "matches", "goals", "<H", n)) if n else 0
+  for (table, columns, rows) in (("matches", MATCHES, n), ("goals", GOALS, ngoals)):
+    for (column, dtype, fmt) in columns:
+      name=columnFile(path, table, column)
+      if os.path.exists(name) and os.path.getsize(name)>rows*struct.calcsize(fmt):
+        log.warning("Cutting half written match from %s" % name)
+        with open(name, "r+b") as f: f.truncate(rows*struct.calcsize(fmt))
+  return(n)
+
+class MatchArchive:
+
+  def __init__(self, directory=DIRECTORY):
+    self.directory=directory
+    self.lock=threading.Lock()
+    self.segment=None       # Name of the open segment
+    self.files={}           # (table, column) -> open file
+    self.lastid=None
+    self.compacted=None     # Day of the latest compaction
+
+  # Append a finished match (matchlog.Match)
+  def add(self, match):
+    with self.lock:
+      name=time.strftime("%Y%m%d", time.localtime(match.starttime))
+      if name!=self.segment: self.open(name)
+      self.lastid+=1
+      goals=match.goallist
+      values={"start": match.starttime, "end": match.finishtime or time.time(),
+              "score1": match.score1, "score2": match.score2, "goals": len(goals),
+              "reason": REASONS.get(match.reason, 0), "id": self.lastid}
+      for (column, dtype, fmt) in GOALS:
+        if not goals: break
+        if column=="match": data=[self.lastid]*len(goals)
+        elif column=="offset": data=[g.time-match.starttime for g in goals]
+        else: data=[getattr(g, column) for g in goals]
+        self.write("goals", column, struct.pack("<%d%s" % (len(data), fmt[1]), *data))
+      for (column, dtype, fmt) in MATCHES:
+        self.write("matches", column, struct.pack(fmt, values[column]))
+      return(self.lastid)
+
+  def write(self, table, column, data):
+    f=self.files.get((table, column))
+    if f is None:
+      f=self.files[(table, column)]=open(columnFile(os.path.join(self.directory, self.segment), table, column), "ab")
+    f.write(data)
+    f.flush()
+
+  # Open the segment of a day for appending. Compacts closed days, when the day has changed
+  def open(self, name):
+    self.closeFiles()
+    if self.compacted!=time.strftime("%Y%m%d"): self.compactLocked()
+    if self.lastid is None: self.lastid=lastId(self.directory)
+    path=os.path.join(self.directory, name)
+    if not os.path.isdir(path): os.makedirs(path)
+    else: repair(path)
+    self.segment=name
+
+  def closeFiles(self):
+    for f in self.files.values(): f.close()
+    self.files={}
+    self.segment=None
+
+  def close(self):
+    with self.lock:
+      self.closeFiles()
+
+  # Merge closed days into month segments
+  def compact(self, today=None):
+    with self.lock:
+      self.closeFiles()
+      return(self.compactLocked(today))
+
+  def compactLocked(self, today=None):
+    today=today or time.strftime("%Y%m%d")
+    self.compacted=today
+    return(compact(self.directory, today))
+
+# Highest match number in the archive (0 if empty)
+def lastId(directory):
+  segments=listSegments(directory, True)
+  for name in reversed(segments):
+    path=os.path.join(directory, name)
+    n=repair(path)
+    if n: return(readColumn(path, "matches", "id", "<I", n)[-1])
+  return(0)
+
+# Segment names in order. The writer cleans up after an interrupted compaction (cleanup=True)
+def listSegments(directory, cleanup=False):
+  if not os.path.isdir(directory): return([])
+  names=os.listdir(directory)
+  if not cleanup: return(sorted(n for n in names if isSegment(n)))
+  for name in names:
+    if name.endswith(".new") and isMonth(name[:-4]):
+      # Complete if it was renamed away from, else half written
+      if name[:-4] not in names: os.rename(os.path.join(directory, name), os.path.join(directory, name[:-4]))
+      else: shutil.rmtree(os.path.join(directory, name))
+  names=os.listdir(directory)
+  for name in names:
+    if name.endswith(".old") and isMonth(name[:-4]): shutil.rmtree(os.path.join(directory, name))
+  return(sorted(n for n in os.listdir(directory) if isSegment(n)))
+
+# Merge all day segments before today into their month segments. Returns merged days
+def compact(directory, today):
+  days=[n for n in listSegments(directory, True) if isDay(n) and n<today]
+  months=sorted(set(d[:6] for d in days))
+  for month in months:
+    final=os.path.join(directory, month)
+    new=final+".new"
+    sources=([final] if os.path.isdir(final) else [])+[os.path.join(directory, d) for d in days if d[:6]==month]
+    if os.path.exists(new): shutil.rmtree(new)
+    os.makedirs(new)
+    for (table, columns) in (("matches", MATCHES), ("goals", GOALS)):
+      counts=[]
+      for source in sources:
+        n=repair(source)
+        counts.append(n if table=="matches" else (sum(readColumn(source, "matches", "goals", "<H", n)) if n else 0))
+      for (column, dtype, fmt) in columns:
+        with open(columnFile(new, table, column), "wb") as out:
+          for (source, n) in zip(sources, counts):
+            if not n: continue
+            with open(columnFile(source, table, column), "rb") as f:
+              out.write(f.read(n*struct.calcsize(fmt)))
+          out.flush()
+          os.fsync(out.fileno())
+    if os.path.isdir(final): os.rename(final, final+".old")
+    os.rename(new, final)
+    for source in sources[1:] if sources[0]==final else sources: shutil.rmtree(source)
+    if os.path.isdir(final+".old"): shutil.rmtree(final+".old")
+    log.info("Compacted %d segments into %s" % (len(sources), month))
+  return(days)
+
+# A segment as numpy arrays. The arrays are memory maps of the column files
+class Segment:
+
+  def __init__(self, path):
+    self.path=path
+    self.name=os.path.basename(path)
+    self.size=None
+    self.load()
+
+  # (Re)map the columns if the segment has grown. Returns True if it had
+  def load(self):
+    n=matchCount(self.path)
+    if n==self.size: return(False)
+    self.matches=dict((c, mapColumn(self.path, "matches", c, t, n)) for (c, t, f) in MATCHES)
+    self.firstgoal=numpy.zeros(n, dtype=numpy.int64)
+    numpy.cumsum(self.matches["goals"][:-1], out=self.firstgoal[1:])
+    ngoals=int(self.firstgoal[-1]+self.matches["goals"][-1]) if n else 0
+    self.goals=dict((c, mapColumn(self.path, "goals", c, t, ngoals)) for (c, t, f) in GOALS)
+    self.size=n
+    return(True)
+
+  def __len__(self):
+    return(self.size)
+
+  # Goal columns of match row i (views, no copies)
+  def matchGoals(self, i):
+    (a, b)=(self.firstgoal[i], self.firstgoal[i]+self.matches["goals"][i])
+    return(dict((c, v[a:b]) for (c, v) in self.goals.items()))
+
+def mapColumn(path, table, column, dtype, count):
+  if not count: return(numpy.zeros(0, dtype=dtype))
+  return(numpy.memmap(columnFile(path, table, column), dtype=dtype, mode="r", shape=(count,)))
+
+class ArchiveReader:
+
+  def __init__(self, directory=DIRECTORY):
+    if numpy is None: raise ArchiveException("Reading the match archive needs numpy")
+    self.directory=directory
+    self.cache={}
+    self.segments=[]
+    self.refresh()
+
+  # Pick up new matches and segments. Cheap if nothing has changed
+  def refresh(self):
+    segments=[]
+    lastid=0
+    for name in listSegments(self.directory):
+      seg=self.cache.get(name)
+      if seg is None: seg=self.cache[name]=Segment(os.path.join(self.directory, name))
+      else: seg.load()
+      # Skip days allready merged into their month (compaction interrupted before cleanup)
+      if not len(seg) or seg.matches["id"][0]<=lastid: continue
+      lastid=seg.matches["id"][-1]
+      segments.append(seg)
+    for name in set(self.cache)-set(s.name for s in segments):
+      if not os.path.isdir(os.path.join(self.directory, name)): del self.cache[name]
+    self.segments=segments
+
+  def count(self):
+    return(sum(len(s) for s in self.segments))
+
+  # Whole column over all segments. Only copies if there are more than one segment
+  def column(self, table, column):
+    arrays=[getattr(s, table)[column] for s in self.segments]
+    if len(arrays)==1: return(arrays[0])
+    if not arrays: return(numpy.zeros(0, dtype=dict((c, t) for (c, t, f) in (MATCHES if table=="matches" else GOALS))[column]))
+    return(numpy.concatenate(arrays))
+
+  # Match as a dict (with its goal columns), or None
+  def match(self, matchid):
+    for seg in self.segments:
+      ids=seg.matches["id"]
+      if ids[0]<=matchid<=ids[-1]:
+        i=int(numpy.searchsorted(ids, matchid))
+        if ids[i]==matchid: return(record(seg, i))
+    return(None)
+
+  # The n latest matches, newest first
+  def last(self, n=1):
+    result=[]
+    for seg in reversed(self.segments):
+      for i in range(len(seg)-1, -1, -1):
+        if len(result)>=n: return(result)
+        result.append(record(seg, i))
+    return(result)
+
+  # Matches started in [start, end), oldest first
+  def between(self, start, end):
+    result=[]
+    for seg in self.segments:
+      starts=seg.matches["start"]
+      if starts[0]>=end or starts[-1]<start: continue
+      (a, b)=numpy.searchsorted(starts, [start, end])
+      result.extend(record(seg, i) for i in range(a, b))
+    return(result)
+
+def record(seg, i):
+  match=dict((c, v[i].item()) for (c, v) in seg.matches.items())
+  match["reason"]=dict((v, k) for (k, v) in REASONS.items()).get(match["reason"])
+  match["goallist"]=seg.matchGoals(i)
+  return(match)
+
+class ArchiveException(Exception): pass
+
+if __name__ == '__main__':
+  args=[a for a in sys.argv[1:] if a!="-c"]
+  directory=args[0] if args else DIRECTORY
+  if "-c" in sys.argv:
+    print("Compacted: %s" % ", ".join(compact(directory, time.strftime("%Y%m%d"))))
+  reader=ArchiveReader(directory)
+  print("%d matches in %d segments" % (reader.count(), len(reader.segments)))
+  for m in reader.last(10):
+    print("%5d  %s  %2d-%-2d  %4d s  %s" % (m["id"], time.strftime("%Y-%m-%d %H:%M", time.localtime(m["start"])),
+          m["score1"], m["score2"], m["end"]-m["start"], m["reason"] or ""))
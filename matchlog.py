@@ -8,6 +8,9 @@ import threading
 import os
 import ctypes
 import json
+import array
+import struct
+import events
 #import docopt
 #import sys
 #import subprocess
@@ -16,22 +19,35 @@ log = logging.getLogger("Foosball")
 
 class MatchLog:
 
-  def __init__(self):
+  # Finished matches are given to all stores (matcharchive.MatchArchive, matchstore.MatchStore)
+  def __init__(self, *stores):
+    self.stores=stores
+    self.history=MatchHistory()
+    self.match=None
+    self.players=(None, None)   # Players at the table. Given to every match until it is vacant
+    self.occupiedtime=None
     self.stopsignal=False
+    self.stopped=threading.Event()
+    self.thread=None
     self.running=False
     self.hearttime=0
     self.heartmain=0
     self.log=[]
 
   def start(self):
+    self.stopsignal=False
+    self.stopped.clear()
     self.thread=threading.Thread(target=self.run, name="MatchLog")
     self.thread.start()
-    self.stopsignal=False
     self.running=True
     self.heartbeat()
 
   def stop(self):
     self.stopsignal=True
+    self.stopped.set()
+
+  def join(self, timeout=None):
+    if self.thread: self.thread.join(timeout)
 
   def heartbeat(self):
     self.hearttime=time.time()
@@ -40,33 +56,274 @@ class MatchLog:
       log.debug("Main thread heartbeat too faint. Stoppong MatchLog thread")
       self.stop()
 
+  # Save a finished match in all stores
+  def add(self, match):
+    self.history.add(match)
+    for store in self.stores: store.add(match)
+
+  # Event handler: Follows the match played from occupied, score, match end, vacant and players events
+  def onEvent(self, event):
+    data=event.data
+    if event.kind==events.OCCUPIED:
+      self.occupiedtime=event.time
+      self.match=self.newMatch(event.time)
+    elif event.kind==events.VACANT:
+      if self.occupiedtime:
+        for store in self.stores:
+          if hasattr(store, "addSession"): store.addSession(self.occupiedtime, event.time)
+      self.occupiedtime=None
+      self.players=(None, None)
+    elif event.kind==events.PLAYERS:
+      self.players=(data["team1"], data["team2"])
+      if self.match is not None: self.match.players=self.players
+    elif event.kind==events.SCORE:
+      if self.match is None: self.match=self.newMatch(event.time)
+      if "goal" in data:
+        self.match.goal(data["goal"], event.time, data["score1"], data["score2"], data.get("tick", 0))
+      elif (data["score1"], data["score2"])!=(self.match.score1, self.match.score2):
+        self.match.correct(event.time, data["score1"], data["score2"])
+    elif event.kind==events.MATCHEND:
+      if self.match is None: self.match=self.newMatch(event.time)
+      self.match.finish(data["score1"], data["score2"], data["reason"], event.time)
+      # After a reset the next match starts at once. A vacant table waits for players
+      self.match=self.newMatch(event.time) if data["reason"]=="reset" else None
+
+  def newMatch(self, starttime):
+    match=Match(self, starttime)
+    match.players=self.players
+    return(match)
+
   def run(self):
     self.tid=ctypes.CDLL('libc.so.6').syscall(224)
     log.info("Starting MatchLog program (tid: %d)" % self.tid)
-    # If sensor power is a gpio, then turn on sensor
-    if self.gpio_power:
-      log.debug("Turning on power to sensor")
-      self.pi.write(self.gpio_power,1)
-    # Main loop of activity thread
-    while True:
-      pass
+    # Main loop of matchlog thread. Wakes at once on stop
+    while not self.stopped.wait(3):
+      self.heartbeat()
+    self.running=False
  
-class Match:
-  def __init__(self):
-    self.starttime=time.time()
+# Records of matches, goals and score corrections.
+#
+# Goal, Correction and Match have __slots__, so they carry no __dict__. Every record can be
+# packed to bytes with struct (pack/unpack, little endian) and converted to and from plain
+# dicts for JSON (toJSON/fromJSON). MatchHistory keeps the latest matches in array columns,
+# which costs about 15 bytes per goal.
+
+GOAL=struct.Struct("<dIBBB")         # time, tick, team, score1, score2
+CORRECTION=struct.Struct("<dBB")     # time, score1, score2
+MATCH=struct.Struct("<ddBBBHHH")     # start, finish, score1, score2, reason, goals, corrections, players length
+REASONS=(None, "reset", "vacant")
+
+class Goal(object):
+  __slots__=("team", "time", "score1", "score2", "tick")
+
+  def __init__(self, team, time, score1, score2, tick=0):
+    self.team=team
+    self.time=time
+    self.score1=score1          # Score after the goal
+    self.score2=score2
+    self.tick=tick              # pigpio tick of the goal (0 if not known)
+
+  def pack(self):
+    return(GOAL.pack(self.time, self.tick, self.team, self.score1, self.score2))
+
+  @classmethod
+  def unpack(cls, data, offset=0):
+    (time, tick, team, score1, score2)=GOAL.unpack_from(data, offset)
+    return(cls(team, time, score1, score2, tick))
+
+  def toJSON(self):
+    return({"team": self.team, "time": self.time, "score1": self.score1, "score2": self.score2, "tick": self.tick})
+
+  @classmethod
+  def fromJSON(cls, d):
+    return(cls(d["team"], d["time"], d["score1"], d["score2"], d.get("tick", 0)))
+
+  def __repr__(self):
+    return("Goal(team=%d, time=%.3f, score=%d-%d)" % (self.team, self.time, self.score1, self.score2))
+
+class Correction(object):
+  __slots__=("time", "score1", "score2")
+
+  def __init__(self, time, score1, score2):
+    self.time=time
+    self.score1=score1          # Score after the correction
+    self.score2=score2
+
+  def pack(self):
+    return(CORRECTION.pack(self.time, self.score1, self.score2))
+
+  @classmethod
+  def unpack(cls, data, offset=0):
+    return(cls(*CORRECTION.unpack_from(data, offset)))
+
+  def toJSON(self):
+    return({"time": self.time, "score1": self.score1, "score2": self.score2})
+
+  @classmethod
+  def fromJSON(cls, d):
+    return(cls(d["time"], d["score1"], d["score2"]))
+
+  def __repr__(self):
+    return("Correction(time=%.3f, score=%d-%d)" % (self.time, self.score1, self.score2))
+
+class Match(object):
+  __slots__=("starttime", "goallist", "corrections", "finishtime", "stamp", "score1", "score2", "reason", "players", "store")
+
+  def __init__(self, store=None, starttime=None):
+    self.starttime=starttime or time.time()
     self.goallist=[]
+    self.corrections=[]
     self.finishtime=False
     self.stamp=False
+    self.score1=0
+    self.score2=0
+    self.reason=None
+    self.players=(None, None)   # Names of the players of team 1 and 2, when known
+    self.store=store
+
+  # End the match and save it in the store. The score defaults to the score after the last goal
+  def finish(self, score1=None, score2=None, reason=None, finishtime=None):
+    self.finishtime=finishtime or time.time()
+    if score1 is not None: (self.score1, self.score2)=(score1, score2)
+    self.reason=reason
+    if self.store: self.store.add(self)
+
+  def goal(self, team, time, black, yellow, tick=0):
+    self.goallist.append(Goal(team, time, black, yellow, tick))
+    (self.score1, self.score2)=(black, yellow)
+
+  # Score changed by hand (buttons or the command channel)
+  def correct(self, time, score1, score2):
+    self.corrections.append(Correction(time, score1, score2))
+    (self.score1, self.score2)=(score1, score2)
+
+  # Header, players (utf8, separated by newline), goals and corrections
+  def pack(self):
+    players="\n".join(p or "" for p in self.players).encode("utf8")
+    return(b"".join([MATCH.pack(self.starttime, self.finishtime or 0, self.score1, self.score2, REASONS.index(self.reason),
+                                len(self.goallist), len(self.corrections), len(players)), players]+
+                    [g.pack() for g in self.goallist]+[c.pack() for c in self.corrections]))
+
+  # Match from bytes. Returns (match, offset after it)
+  @classmethod
+  def unpack(cls, data, offset=0):
+    (start, finish, score1, score2, reason, goals, corrections, length)=MATCH.unpack_from(data, offset)
+    match=cls(None, start)
+    (match.finishtime, match.score1, match.score2, match.reason)=(finish or False, score1, score2, REASONS[reason])
+    offset+=MATCH.size
+    match.players=tuple(p or None for p in data[offset:offset+length].decode("utf8").split("\n")) if length else (None, None)
+    offset+=length
+    for i in range(goals):
+      match.goallist.append(Goal.unpack(data, offset))
+      offset+=GOAL.size
+    for i in range(corrections):
+      match.corrections.append(Correction.unpack(data, offset))
+      offset+=CORRECTION.size
+    return(match, offset)
+
+  def toJSON(self):
+    return({"starttime": self.starttime, "finishtime": self.finishtime, "score1": self.score1, "score2": self.score2,
+            "reason": self.reason, "players": list(self.players),
+            "goals": [g.toJSON() for g in self.goallist], "corrections": [c.toJSON() for c in self.corrections]})
+
+  @classmethod
+  def fromJSON(cls, d):
+    match=cls(None, d["starttime"])
+    (match.finishtime, match.score1, match.score2, match.reason)=(d["finishtime"], d["score1"], d["score2"], d["reason"])
+    match.players=tuple(d.get("players") or (None, None))
+    match.goallist=[Goal.fromJSON(g) for g in d["goals"]]
+    match.corrections=[Correction.fromJSON(c) for c in d["corrections"]]
+    return(match)
+
+# The latest finished matches (at least size), kept in array columns. Add it to the stores of
+# MatchLog. Iterating gives Match records, made when they are read
+class MatchHistory(object):
+
+  def __init__(self, size=1000):
+    self.size=size
+    self.matches=dict((c, array.array(t)) for (c, t) in (("start", "d"), ("finish", "d"), ("score1", "B"), ("score2", "B"),
+                                                          ("reason", "B"), ("goals", "H"), ("corrections", "H")))
+    self.goals=dict((c, array.array(t)) for (c, t) in (("time", "d"), ("tick", "I"), ("team", "B"), ("score1", "B"), ("score2", "B")))
+    self.corrections=dict((c, array.array(t)) for (c, t) in (("time", "d"), ("score1", "B"), ("score2", "B")))
+    self.lock=threading.Lock()
+
+  def add(self, match):
+    with self.lock:
+      m=self.matches
+      m["start"].append(match.starttime)
+      m["finish"].append(match.finishtime or 0)
+      m["score1"].append(match.score1)
+      m["score2"].append(match.score2)
+      m["reason"].append(REASONS.index(match.reason))
+      m["goals"].append(len(match.goallist))
+      m["corrections"].append(len(match.corrections))
+      for (column, values) in self.goals.items():
+        values.extend([getattr(g, column) for g in match.goallist])
+      for (column, values) in self.corrections.items():
+        values.extend([getattr(c, column) for c in match.corrections])
+      # Drop the oldest matches in one go, when there are twice as many as needed
+      if len(m["start"])>=2*self.size: self.trim(len(m["start"])-self.size)
+
+  def trim(self, n):
+    goals=sum(self.matches["goals"][:n])
+    corrections=sum(self.matches["corrections"][:n])
+    for (table, rows) in ((self.matches, n), (self.goals, goals), (self.corrections, corrections)):
+      for values in table.values(): del values[:rows]
+
+  def __len__(self):
+    return(len(self.matches["start"]))
+
+  # Copy of the columns of the n latest matches (all if n is None) and their goals and corrections.
+  # Only the copy is made under the lock. The records are built from it by matchesFrom
+  def rows(self, n=None):
+    with self.lock:
+      m=self.matches
+      first=0 if n is None else max(0, len(m["start"])-n)
+      goals=sum(m["goals"][first:])
+      corrections=sum(m["corrections"][first:])
+      return([dict((k, v[first:]) for (k, v) in m.items()),
+              dict((k, v[len(v)-goals:]) for (k, v) in self.goals.items()),
+              dict((k, v[len(v)-corrections:]) for (k, v) in self.corrections.items())])
+
+  # Matches of a copy from rows, oldest first
+  def matchesFrom(self, rows):
+    (m, goals, corrections)=rows
+    (g, c)=(0, 0)
+    for i in range(len(m["start"])):
+      match=Match(None, m["start"][i])
+      (match.finishtime, match.score1, match.score2, match.reason)=(m["finish"][i] or False, m["score1"][i], m["score2"][i],
+                                                                     REASONS[m["reason"][i]])
+      match.goallist=[Goal(*[goals[k][j] for k in ("team", "time", "score1", "score2", "tick")])
+                      for j in range(g, g+m["goals"][i])]
+      match.corrections=[Correction(*[corrections[k][j] for k in ("time", "score1", "score2")])
+                         for j in range(c, c+m["corrections"][i])]
+      g+=m["goals"][i]
+      c+=m["corrections"][i]
+      yield(match)
+
+  # Matches, oldest first
+  def __iter__(self):
+    return(self.matchesFrom(self.rows()))
+
+  # The n latest matches, newest first
+  def last(self, n=1):
+    return(list(self.matchesFrom(self.rows(n)))[::-1])
+
+  # Bytes used by the columns
+  def nbytes(self):
+    return(sum(v.itemsize*len(v) for table in (self.matches, self.goals, self.corrections) for v in table.values()))
 
-  def finish(self):
-    self.finishtime=time.time()
+  # All matches as bytes, and back
+  def pack(self):
+    return(b"".join(match.pack() for match in self))
 
-  def goal(self, team, time, black, yellow):
-    b=locals()
-    del(b["self"])
-    self.goallist.append(b)
+  def unpack(self, data):
+    offset=0
+    while offset<len(data):
+      (match, offset)=Match.unpack(data, offset)
+      self.add(match)
 
 if __name__ == '__main__':
   match=Match()
   match.goal(1,2,3,4)
-  print(json.dumps(match.__dict__))
+  print(json.dumps(match.toJSON()))
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Running table statistics, updated from the events of the table.
+#
+# Every goal, score correction, match end, occupied and vacant event updates the running
+# totals directly, so the statistics are always ready and never recomputed from the match log:
+#   - Matches per day, and the average match length
+#   - Distribution of the time between goals (a histogram, plus mean and deviation)
+#   - Comebacks: Matches won by the team which was behind by comeback goals or more
+#   - Longest streak of goals in a row by one team, and most matches won in a row by one side
+#   - Minutes the table is occupied in every hour of the week (monday 0-1 is hour 0)
+# An event only touches a few counters. A vacant event adds the occupied period to the hours
+# it covers, which is a handful.
+#
+# The totals are saved as JSON (checkpoint) at most every interval seconds and on stop, and
+# loaded on start, so a restart continues from the checkpoint.
+#
+# Usage: matchstats.py [checkpoint]   Print the statistics
+
+import sys
+import json
+import time
+import bisect
+import logging
+import events
+import external
+
+log = logging.getLogger("Foosball")
+
+VERSION=1
+# Upper edges (seconds) of the goal interval histogram. The last bin is everything above
+INTERVALS=[5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300]
+
+class MatchStats:
+
+  def __init__(self, path=None, interval=60, comeback=3):
+    self.path=path
+    self.interval=interval
+    self.comeback=comeback
+    self.saved=0
+    self.state=self.empty()
+    if path: self.load()
+
+  def empty(self):
+    return({"version": VERSION,
+            "matches": 0, "matchtime": 0.0, "perday": {},
+            "goals": 0, "corrections": 0,
+            "intervals": [0]*(len(INTERVALS)+1), "intervalcount": 0, "intervalsum": 0.0, "intervalsumsq": 0.0,
+            "comebacks": 0, "biggestcomeback": 0,
+            "goalstreak": 0, "winstreak": {"team": 0, "length": 0}, "beststreak": {"team": 0, "length": 0},
+            "occupied": [0.0]*168,
+            # The match being played, and the occupied period
+            "match": None, "occupiedsince": None})
+
+  def newMatch(self, t):
+    return({"start": t, "score": [0, 0], "lastgoal": None, "streak": [0, 0], "behind": [0, 0]})
+
+  # Event handler
+  def onEvent(self, event):
+    data=event.data
+    if event.kind==events.SCORE:
+      if "goal" in data: self.goal(event.time, data["goal"], data["score1"], data["score2"])
+      else:              self.correct(event.time, data["score1"], data["score2"])
+    elif event.kind==events.MATCHEND: self.matchEnd(event.time, data["score1"], data["score2"])
+    elif event.kind==events.OCCUPIED: self.occupied(event.time)
+    elif event.kind==events.VACANT:   self.vacant(event.time)
+    if self.path and time.time()-self.saved>=self.interval: self.save()
+
+  def current(self, t):
+    s=self.state
+    if s["match"] is None: s["match"]=self.newMatch(t)
+    return(s["match"])
+
+  def goal(self, t, team, score1, score2):
+    s=self.state
+    m=self.current(t)
+    s["goals"]+=1
+    if m["lastgoal"] is not None:
+      gap=t-m["lastgoal"]
+      s["intervals"][bisect.bisect_left(INTERVALS, gap)]+=1
+      s["intervalcount"]+=1
+      s["intervalsum"]+=gap
+      s["intervalsumsq"]+=gap*gap
+    m["lastgoal"]=t
+    # Goals in a row by one team
+    other=2-team
+    m["streak"][team-1]+=1
+    m["streak"][other]=0
+    s["goalstreak"]=max(s["goalstreak"], m["streak"][team-1])
+    self.setScore(m, score1, score2)
+
+  # Score set by hand. Only changes the score of the match
+  def correct(self, t, score1, score2):
+    m=self.current(t)
+    if [score1, score2]==m["score"]: return
+    self.state["corrections"]+=1
+    m["streak"]=[0, 0]
+    self.setScore(m, score1, score2)
+
+  def setScore(self, m, score1, score2):
+    m["score"]=[score1, score2]
+    m["behind"][0]=max(m["behind"][0], score2-score1)
+    m["behind"][1]=max(m["behind"][1], score1-score2)
+
+  def matchEnd(self, t, score1, score2):
+    s=self.state
+    m=self.current(t)
+    self.setScore(m, score1, score2)
+    s["match"]=None if s["occupiedsince"] is None else self.newMatch(t)
+    s["matches"]+=1
+    s["matchtime"]+=t-m["start"]
+    day=time.strftime("%Y-%m-%d", time.localtime(t))
+    s["perday"][day]=s["perday"].get(day, 0)+1
+    if score1==score2: return
+    winner=1 if score1>score2 else 2
+    behind=m["behind"][winner-1]
+    if behind>=self.comeback: s["comebacks"]+=1
+    s["biggestcomeback"]=max(s["biggestcomeback"], behind)
+    # Matches won in a row by one side of the table
+    streak=s["winstreak"]
+    streak["length"]=streak["length"]+1 if streak["team"]==winner else 1
+    streak["team"]=winner
+    if streak["length"]>s["beststreak"]["length"]: s["beststreak"]=dict(streak)
+
+  def occupied(self, t):
+    s=self.state
+    s["occupiedsince"]=t
+    s["match"]=self.newMatch(t)
+
+  def vacant(self, t):
+    s=self.state
+    start=s["occupiedsince"]
+    s["occupiedsince"]=None
+    s["match"]=None
+    if start is None or t<=start: return
+    # Split the period on the hours of the week it covers
+    while start<t:
+      lt=time.localtime(start)
+      end=min(t, start+3600-lt.tm_min*60-lt.tm_sec-(start%1))
+      s["occupied"][lt.tm_wday*24+lt.tm_hour]+=(end-start)/60.0
+      start=end
+
+  # Statistics for the homepage and the display
+  def report(self):
+    s=self.state
+    n=s["intervalcount"]
+    mean=s["intervalsum"]/n if n else 0
+    return({"matches": s["matches"],
+            "averagematch": s["matchtime"]/s["matches"] if s["matches"] else 0,
+            "matchesperday": dict(s["perday"]),
+            "goals": s["goals"],
+            "corrections": s["corrections"],
+            "goalinterval": {"mean": mean, "deviation": max(0, s["intervalsumsq"]/n-mean*mean)**.5 if n else 0,
+                             "edges": INTERVALS, "histogram": list(s["intervals"])},
+            "comebacks": s["comebacks"],
+            "biggestcomeback": s["biggestcomeback"],
+            "longestgoalstreak": s["goalstreak"],
+            "longestwinstreak": dict(s["beststreak"]),
+            "occupiedminutes": list(s["occupied"])})
+
+  # Write the checkpoint
+  def save(self):
+    self.saved=time.time()
+    try:
+      external.atomicWrite(self.path, json.dumps(self.state, sort_keys=True))
+    except (IOError, OSError) as e:
+      log.warning("Could not save statistics to %s: %s" % (self.path, e))
+
+  def load(self):
+    try:
+      with open(self.path) as f:
+        state=json.load(f)
+    except (IOError, ValueError) as e:
+      log.info("No statistics checkpoint loaded from %s: %s" % (self.path, e))
+      return(False)
+    if state.get("version")!=VERSION:
+      log.warning("Statistics checkpoint %s has version %s. Starting over" % (self.path, state.get("version")))
+      return(False)
+    self.state=dict(self.empty(), **state)
+    return(True)
+
+  def stop(self):
+    if self.path: self.save()
+
+if __name__ == '__main__':
+  stats=MatchStats(sys.argv[1] if len(sys.argv)>1 else "./log/statistics.json")
+  print(json.dumps(stats.report(), indent=2, sort_keys=True))
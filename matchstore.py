@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Matches, goals, score corrections and occupied periods in an SQLite database.
+#
+# The database runs in WAL mode, so the menu and the homepage can read while matches are
+# written. Nothing is written in the calling thread: add() and addSession() only queue the
+# rows, and a writer thread inserts everything queued in one transaction every interval
+# seconds (or when batch rows are waiting).
+#
+# The queries behind the "Sidste kamp" and "Statistik" menus are fixed SQL statements, so
+# sqlite3 compiles them once and reuses them. They are served by indexes:
+#   matches(tab, start)    Latest match, matches in a period
+#   matches(team1, team2)  Head to head
+#   goals(match, seq)      Goal sequence of a match
+# tab is the name of the table (the foosball table), so several tables can share a database.
+# team1 and team2 are the names of the players, as given by the "players" command on the
+# command channel (NULL when nobody told the table who plays).
+#
+# Usage: matchstore.py database [match id]   Show the latest match, today and a goal sequence
+
+import sys
+import time
+import sqlite3
+import logging
+import threading
+
+log = logging.getLogger("Foosball")
+
+SCHEMA="""
+CREATE TABLE IF NOT EXISTS matches (
+  id     INTEGER PRIMARY KEY,
+  tab    TEXT NOT NULL,
+  start  REAL NOT NULL,
+  end    REAL NOT NULL,
+  score1 INTEGER NOT NULL,
+  score2 INTEGER NOT NULL,
+  reason TEXT,
+  team1  TEXT,
+  team2  TEXT);
+CREATE INDEX IF NOT EXISTS matches_tab_start ON matches (tab, start);
+CREATE INDEX IF NOT EXISTS matches_teams ON matches (team1, team2);
+CREATE TABLE IF NOT EXISTS goals (
+  match  INTEGER NOT NULL REFERENCES matches (id),
+  seq    INTEGER NOT NULL,
+  time   REAL NOT NULL,
+  team   INTEGER NOT NULL,
+  tick   INTEGER,
+  score1 INTEGER NOT NULL,
+  score2 INTEGER NOT NULL,
+  PRIMARY KEY (match, seq));
+CREATE TABLE IF NOT EXISTS corrections (
+  match  INTEGER NOT NULL REFERENCES matches (id),
+  time   REAL NOT NULL,
+  score1 INTEGER NOT NULL,
+  score2 INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS corrections_match ON corrections (match);
+CREATE TABLE IF NOT EXISTS sessions (
+  id     INTEGER PRIMARY KEY,
+  tab    TEXT NOT NULL,
+  start  REAL NOT NULL,
+  end    REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS sessions_tab_start ON sessions (tab, start);
+"""
+
+INSERT_MATCH="INSERT INTO matches (tab, start, end, score1, score2, reason, team1, team2) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_GOAL="INSERT INTO goals (match, seq, time, team, tick, score1, score2) VALUES (?, ?, ?, ?, ?, ?, ?)"
+INSERT_CORRECTION="INSERT INTO corrections (match, time, score1, score2) VALUES (?, ?, ?, ?)"
+INSERT_SESSION="INSERT INTO sessions (tab, start, end) VALUES (?, ?, ?)"
+
+LAST_MATCH="SELECT * FROM matches WHERE tab=? ORDER BY start DESC LIMIT 1"
+MATCHES_BETWEEN="SELECT * FROM matches WHERE tab=? AND start>=? AND start<? ORDER BY start"
+GOAL_SEQUENCE="SELECT seq, time, team, tick, score1, score2 FROM goals WHERE match=? ORDER BY seq"
+CORRECTIONS="SELECT time, score1, score2 FROM corrections WHERE match=? ORDER BY rowid"
+# Both ways round: a and b may have played on either side. One indexed lookup per side
+HEAD_TO_HEAD="""SELECT count(*) AS matches, coalesce(sum(wins1), 0) AS wins1, coalesce(sum(wins2), 0) AS wins2,
+  coalesce(sum(goals1), 0) AS goals1, coalesce(sum(goals2), 0) AS goals2 FROM (
+  SELECT score1>score2 AS wins1, score2>score1 AS wins2, score1 AS goals1, score2 AS goals2
+    FROM matches WHERE team1=? AND team2=? AND tab=?
+  UNION ALL
+  SELECT score2>score1, score1>score2, score2, score1
+    FROM matches WHERE team1=? AND team2=? AND tab=?)"""
+
+class MatchStore:
+
+  def __init__(self, path, tab="foosball", interval=1.0, batch=500):
+    self.path=path
+    self.tab=tab
+    self.interval=interval
+    self.batch=batch
+    self.queue=[]
+    self.cond=threading.Condition()
+    self.local=threading.local()
+    self.thread=None
+    self.stopping=False
+    self.urgent=False       # A flush is waiting
+    self.written=0          # Number of flushed items
+    self.queued=0           # Number of queued items
+    db=self.connect()
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    db.close()
+
+  def connect(self):
+    db=sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+    db.row_factory=sqlite3.Row
+    # WAL only needs to sync at checkpoints. A power cut may lose the latest transactions only
+    db.execute("PRAGMA synchronous=NORMAL")
+    return(db)
+
+  # Connection of the calling thread, for queries
+  def reader(self):
+    db=getattr(self.local, "db", None)
+    if db is None: db=self.local.db=self.connect()
+    return(db)
+
+  def start(self):
+    self.stopping=False
+    self.thread=threading.Thread(target=self.run, name="MatchStore")
+    self.thread.daemon=True
+    self.thread.start()
+
+  # Write what is queued and stop the writer
+  def stop(self):
+    with self.cond:
+      self.stopping=True
+      self.cond.notify_all()
+    if self.thread: self.thread.join(10)
+    self.thread=None
+    # Written in the calling thread, if the writer was never started
+    if self.queue: self.write(self.take())
+
+  # Queue a finished match (matchlog.Match)
+  def add(self, match):
+    self.put(("match", match))
+
+  # Queue a period the table was occupied
+  def addSession(self, start, end):
+    self.put(("session", (start, end)))
+
+  def put(self, item):
+    with self.cond:
+      self.queue.append(item)
+      self.queued+=1
+      if len(self.queue)>=self.batch: self.cond.notify_all()
+
+  # Wait until everything queued so far is written. Returns False on timeout
+  def flush(self, timeout=10):
+    end=time.time()+timeout
+    with self.cond:
+      target=self.queued
+      self.urgent=True
+      self.cond.notify_all()
+      while self.written<target:
+        if not self.thread or time.time()>=end: return(False)
+        self.cond.wait(end-time.time())
+    return(True)
+
+  def take(self):
+    with self.cond:
+      (items, self.queue)=(self.queue, [])
+    return(items)
+
+  def run(self):
+    db=self.connect()
+    while True:
+      with self.cond:
+        if len(self.queue)<self.batch and not self.stopping and not self.urgent: self.cond.wait(self.interval)
+        self.urgent=False
+        stopping=self.stopping
+      items=self.take()
+      if items:
+        try:
+          self.write(items, db)
+        except sqlite3.Error as e:
+          log.error("Writing %d matches and sessions to %s failed: %s" % (len(items), self.path, e))
+      with self.cond:
+        self.written+=len(items)
+        self.cond.notify_all()
+      if stopping and not self.queue: break
+    db.close()
+
+  # Insert matches and sessions in one transaction
+  def write(self, items, db=None):
+    db=db or self.reader()
+    with db:
+      for (kind, item) in items:
+        if kind=="session":
+          db.execute(INSERT_SESSION, (self.tab,)+tuple(item))
+          continue
+        m=item
+        cursor=db.execute(INSERT_MATCH, (self.tab, m.starttime, m.finishtime or time.time(), m.score1, m.score2, m.reason)+tuple(m.players))
+        matchid=cursor.lastrowid
+        db.executemany(INSERT_GOAL, [(matchid, i, g.time, g.team, g.tick, g.score1, g.score2)
+                                     for (i, g) in enumerate(m.goallist)])
+        db.executemany(INSERT_CORRECTION, [(matchid, c.time, c.score1, c.score2) for c in m.corrections])
+
+  # Latest match of this table as a dict, or None
+  def lastMatch(self):
+    row=self.reader().execute(LAST_MATCH, (self.tab,)).fetchone()
+    return(dict(row) if row else None)
+
+  # Matches started in [start, end), oldest first
+  def matchesBetween(self, start, end):
+    return([dict(r) for r in self.reader().execute(MATCHES_BETWEEN, (self.tab, start, end))])
+
+  # Matches started today (local time)
+  def matchesToday(self):
+    midnight=time.mktime(time.localtime()[:3]+(0, 0, 0, 0, 0, -1))
+    return(self.matchesBetween(midnight, midnight+86400))
+
+  # Goals of a match in the order they were scored
+  def goalSequence(self, matchid):
+    return([dict(r) for r in self.reader().execute(GOAL_SEQUENCE, (matchid,))])
+
+  def corrections(self, matchid):
+    return([dict(r) for r in self.reader().execute(CORRECTIONS, (matchid,))])
+
+  # Matches, wins and goals of a against b (player names)
+  def headToHead(self, a, b):
+    return(dict(self.reader().execute(HEAD_TO_HEAD, (a, b, self.tab, b, a, self.tab)).fetchone()))
+
+if __name__ == '__main__':
+  store=MatchStore(sys.argv[1])
+  last=store.lastMatch()
+  print("Last match: %s" % last)
+  print("Matches today: %d" % len(store.matchesToday()))
+  matchid=int(sys.argv[2]) if len(sys.argv)>2 else (last["id"] if last else None)
+  if matchid:
+    for g in store.goalSequence(matchid):
+      print("  %2d  %s  team %d  %d-%d" % (g["seq"], time.strftime("%H:%M:%S", time.localtime(g["time"])), g["team"], g["score1"], g["score2"]))
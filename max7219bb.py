@@ -5,6 +5,10 @@ import time
 import pigpio
 import logging
 import threading
+import contextlib
+import collections
+import max7219transport
+from max7219transport import BITBANG, BANK, WAVE, SPI
 
 DECODE_MODE  = 0x09
 INTENSITY    = 0x0a
@@ -12,22 +16,36 @@ SCAN_LIMIT   = 0x0b
 SHUTDOWN     = 0x0c
 DISPLAY_TEST = 0x0f
 
+log = logging.getLogger(__name__)
+
 class MAX7219bb:
   
-  def __init__(self, pi, clock, data, load, skipsetup=False, showcommand=False):
+  # Register writes are sent by a transport (see max7219transport.py). Either give a
+  # transport mode (BITBANG, BANK, WAVE or SPI) or a ready made transport object
+  def __init__(self, pi, clock, data, load, skipsetup=False, showcommand=False, mode=BANK, transport=None):
     self.pi=pi           # Pigpio instance
-    # Define GPIO pins and set them to OUTPUT
+    # Define GPIO pins. The transport sets them to OUTPUT
     self.clock=clock     # Clock pin
     self.data=data       # Data-pin
     self.load=load       # Load pin (CS)
-    pi.set_mode(clock, pigpio.OUTPUT)
-    pi.set_mode(data,  pigpio.OUTPUT)
-    pi.set_mode(load,  pigpio.OUTPUT)
     # Lock which ensures only 1 thread will try to send data to the max7219
     # If lock is supplied, reuse that lock. Necessary if several max chips share gpio pins
     self.lock=threading.Lock()
     # Should the commands sent to the max by printed
     self.showcommand=showcommand
+    # How register writes are sent and number of pigpio calls made so far
+    if transport: self.setTransport(transport)
+    else:         self.setMode(mode)
+    self.calls=0
+    # Shadow copy of the 16 registers as last latched in the max7219 (None = unknown)
+    # and registers staged for the next flush, in the order they were staged (the latest
+    # staging of a register counts), so shutdown, decode and intensity go out as written
+    self.shadow=[None]*16
+    self.frame=collections.OrderedDict()
+    # Guards the frame only, since several threads stage registers (never held while sending)
+    self.framelock=threading.Lock()
+    # Shared bus this max7219 is connected to (set by MAX7219Bus.device)
+    self.bus=None
     # Unless user asks for no setup, set max to sensible default state
     if not skipsetup:
       self.shutdown()            # Start in shutdown mode
@@ -39,27 +57,103 @@ class MAX7219bb:
   def setLock(self,lock):
     self.lock=lock
 
-  def sendBits(self, value):
-    #print "Value: %d" % value
-    for i in range(0,16):
-      mask=1 << (15-i)  # Calculate bit mask - select i'th bit
-      q = (mask & value)>0
-      #print "%d - %d - %d" % (i,mask,q)
-      self.pi.write(self.clock,0)
-      self.pi.write(self.data,q)
-      self.pi.write(self.clock,1)
-
-  def send(self, reg, data):
-    if self.showcommand: self.showcom(reg, data)
+  def setMode(self, mode):
+    if mode not in (BITBANG, BANK, WAVE, SPI): raise Max7219Exception("Unknown transport mode: %s" % mode)
+    self.setTransport(max7219transport.makeTransport(self.pi, self.clock, self.data, mode))
+
+  def setTransport(self, transport):
+    transport.attach(self.load)
+    self.transport=transport
+    self.mode=transport.mode
+
+  # Number of pigpio daemon calls used to talk to the max7219 since start (or last reset)
+  def resetCalls(self):
+    self.calls=0
+
+  # Send a register value to the max7219. Skipped if the register allready holds
+  # that value, unless force is True. Register 0 (No-op) is never cached
+  def send(self, reg, data, force=False):
     #print "%d - %d" % (reg,data)
     self.isInterval(reg,0,15)
     self.isInterval(data,0,255)
+    # Inside a bus batch, just stage the value. The bus sends everything when the batch ends
+    if not force and reg and self.bus and self.bus.batching():
+      self.stage(reg, data)
+      return(True)
+    if not force and reg and self.shadow[reg]==data: return(False)
     # Make sure only 1 thread at a time sends stuff to the max7219.
     # Share the lock to make the lock protect several max-chips sharing data and clock pins
     with self.lock:
-      self.pi.write(self.load,0)
-      self.sendBits((reg << 8) + data)
-      self.pi.write(self.load,1)
+      self.write(reg, data)
+    return(True)
+
+  # Stage a register value for the next flush. Nothing is sent yet
+  def setRegister(self, reg, data):
+    self.isInterval(reg,1,15)
+    self.isInterval(data,0,255)
+    self.stage(reg, data)
+
+  # Move reg to the end of the frame with the new value
+  def stage(self, reg, data):
+    with self.framelock:
+      self.frame.pop(reg, None)
+      self.frame[reg]=data
+
+  # Send all staged registers, which differ from the latched value (or all staged if force)
+  # in one go while holding the lock. Returns number of registers actually sent
+  # Inside a bus batch nothing is sent - the bus flushes all its devices when the batch ends
+  def flush(self, force=False):
+    if self.bus and self.bus.batching(): return(0)
+    if not self.pending(force): return(0)
+    with self.lock:
+      return(self.sendFrame(force))
+
+  # Are there any staged registers which needs to be sent
+  def pending(self, force=False):
+    with self.framelock:
+      for (reg, data) in self.frame.items():
+        if force or self.shadow[reg]!=data: return(True)
+    return(False)
+
+  # Send the staged frame. Lock must be held
+  def sendFrame(self, force=False):
+    with self.framelock:
+      frame=self.frame
+      self.frame=collections.OrderedDict()
+    n=0
+    for reg in frame:
+      if force or self.shadow[reg]!=frame[reg]:
+        self.write(reg, frame[reg])
+        n+=1
+    return(n)
+
+  # Re-send every register with a known value. Recovers the max7219 from noise
+  # on the wires or a power glitch, which the shadow registers can't see
+  def refresh(self):
+    n=0
+    with self.lock:
+      for reg in range(1,16):
+        if self.shadow[reg] is not None:
+          self.write(reg, self.shadow[reg])
+          n+=1
+    return(n)
+
+  # Forget all latched values, so the next write of each register is always sent
+  def invalidate(self):
+    self.shadow=[None]*16
+
+  # Write a register to the max7219 and record it in the shadow registers. Lock must be held
+  def write(self, reg, data):
+    if self.showcommand: self.showcom(reg, data)
+    self.shadow[reg]=data
+    try:
+      self.calls+=self.transport.send((reg << 8) + data, self.load)
+    # If waveforms fail (no resources, old daemon...) then fall back to bit-banging for good
+    except (pigpio.error, max7219transport.TransportException) as e:
+      if self.mode!=WAVE: raise
+      log.warning("Waveform send failed (%s). Falling back to bit-banging" % e)
+      self.setMode(BANK)
+      self.calls+=self.transport.send((reg << 8) + data, self.load)
 
   def showcom(self,reg,data):
     if not self.showcommand: return
@@ -101,7 +195,8 @@ class MAX7219bb:
     if self.decode: v=15
     else: v=0
     for i in range(1,self.digits+1):
-      self.send(i,v)
+      self.setRegister(i,v)
+    self.flush()
 
   def isInt(self,value):
     try: return(value==int(value))
@@ -116,4 +211,54 @@ class MAX7219bb:
     bittable = ((126,126),(48,6),(109,109),(121,79),(51,23),(91,91),(95,123),(112,70),(127,127),(123,95))
     return(bittable[num][flip])
 
+# Several max7219 chips sharing clock and data pins, each with its own load pin.
+# The bus owns the lock protecting the shared pins, and can collect register writes
+# to all devices and send them in one locked transaction:
+#   with bus.batch():
+#     ...update several devices...
+# All devices on the bus share one transport
+class MAX7219Bus:
+
+  def __init__(self, pi, clock, data, mode=BANK, transport=None):
+    self.pi=pi
+    self.clock=clock
+    self.data=data
+    if not transport: transport=max7219transport.makeTransport(pi, clock, data, mode)
+    self.transport=transport
+    self.lock=threading.Lock()
+    self.devices=[]
+    # Batch depth is per thread, so other threads (blinkers) keep sending directly
+    self.local=threading.local()
+
+  # Create a max7219 on the bus with the given load pin
+  def device(self, load, skipsetup=False, showcommand=False):
+    dev=MAX7219bb(self.pi, self.clock, self.data, load, skipsetup=skipsetup, showcommand=showcommand, transport=self.transport)
+    dev.setLock(self.lock)
+    dev.bus=self
+    self.devices.append(dev)
+    return(dev)
+
+  def batching(self):
+    return(getattr(self.local, "depth", 0)>0)
+
+  # Collect all writes in this thread until the outermost batch ends, then send them together
+  @contextlib.contextmanager
+  def batch(self):
+    self.local.depth=getattr(self.local, "depth", 0)+1
+    try:
+      yield self
+    finally:
+      self.local.depth-=1
+      if self.local.depth==0: self.flush()
+
+  # Send staged registers of all devices while holding the lock once
+  def flush(self, force=False):
+    devices=[dev for dev in self.devices if dev.pending(force)]
+    if not devices: return(0)
+    n=0
+    with self.lock:
+      for dev in devices:
+        n+=dev.sendFrame(force)
+    return(n)
+
 class Max7219Exception(Exception): pass
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# coding: utf8
+
+import time
+import pigpio
+import bitbang
+
+# Transports clock a 16 bit register word (register << 8 + data) out to a max7219.
+# Every transport has the same small interface:
+#   attach(load)       Prepare the load pin (CS) of a max7219 using this transport
+#   send(value, load)  Send the word and latch it with the load pin. Returns number of pigpio calls used
+#   close()            Release any resources (spi handles)
+# Validation, shadow registers and locking is done by MAX7219bb, so it works the same on every transport.
+
+# Transport modes
+BITBANG = "bitbang"  # One pi.write per pin change (3 per bit + 2 for load)
+BANK    = "bank"     # Bit-bang with bank writes, changing several pins per call (see bitbang.py)
+WAVE    = "wave"     # Whole register write built as a pigpio waveform and sent in one go
+SPI     = "spi"      # Hardware SPI. Clock and data must be wired to SCLK (gpio 11) and MOSI (gpio 10)
+
+# Half clock period in micro seconds, when sending as waveform. Max7219 handles 10MHz, so 1us is plenty safe
+WAVE_DELAY = 1
+
+# Create a transport for the given mode
+def makeTransport(pi, clock, data, mode=BANK):
+  if   mode==BITBANG: return(PinTransport(pi, clock, data))
+  elif mode==BANK:    return(BankTransport(pi, clock, data))
+  elif mode==WAVE:    return(WaveTransport(pi, clock, data))
+  elif mode==SPI:
+    if (clock, data)!=(SPITransport.SCLK, SPITransport.MOSI):
+      raise TransportException("SPI needs clock on gpio %d and data on gpio %d (not %d and %d)" %
+                               (SPITransport.SCLK, SPITransport.MOSI, clock, data))
+    return(SPITransport(pi))
+  else: raise TransportException("Unknown transport mode: %s" % mode)
+
+# Base class of the transports, with the attach and close most of them need. Every transport
+# (made by makeTransport) implements send(value, load) itself (see the interface above)
+class Transport:
+  mode=None
+
+  def __init__(self, pi):
+    self.pi=pi
+    self.calls=0   # Number of pigpio calls used so far
+
+  def attach(self, load):
+    self.pi.set_mode(load, pigpio.OUTPUT)
+    self.calls+=1
+
+  def close(self):
+    pass
+
+# The original max7219 bit-banging. One pi.write for every pin change
+class PinTransport(Transport):
+  mode=BITBANG
+
+  def __init__(self, pi, clock, data):
+    Transport.__init__(self, pi)
+    self.clock=clock
+    self.data=data
+    pi.set_mode(clock, pigpio.OUTPUT)
+    pi.set_mode(data,  pigpio.OUTPUT)
+
+  def send(self, value, load):
+    self.pi.write(load,0)
+    for i in range(0,16):
+      mask=1 << (15-i)  # Calculate bit mask - select i'th bit
+      q = (mask & value)>0
+      self.pi.write(self.clock,0)
+      self.pi.write(self.data,q)
+      self.pi.write(self.clock,1)
+    self.pi.write(load,1)
+    self.calls+=50
+    return(50)
+
+# Bit-banging with bank writes. Around 35 calls per register instead of 50
+class BankTransport(Transport):
+  mode=BANK
+
+  def __init__(self, pi, clock, data):
+    Transport.__init__(self, pi)
+    self.bitbang=bitbang.BitBang(pi, clock, data)
+
+  def send(self, value, load):
+    n=self.bitbang.shiftOut(value, 16, latch=load)
+    self.calls+=n
+    return(n)
+
+# Send load low, 16 bits and load high as one pigpio waveform.
+# Costs 5 daemon calls (if not still busy) + waiting for the wave instead of 50 calls when bit-banging
+# Raises TransportException (or pigpio.error) if the waveform can't be made
+class WaveTransport(Transport):
+  mode=WAVE
+
+  def __init__(self, pi, clock, data):
+    Transport.__init__(self, pi)
+    self.clock=clock
+    self.data=data
+    pi.set_mode(clock, pigpio.OUTPUT)
+    pi.set_mode(data,  pigpio.OUTPUT)
+
+  def send(self, value, load):
+    clock=1<<self.clock
+    data=1<<self.data
+    load=1<<load
+    pulses=[pigpio.pulse(0, load, WAVE_DELAY)]
+    for i in range(0,16):
+      if value & (1 << (15-i)): pulses.append(pigpio.pulse(data, clock, WAVE_DELAY))
+      else:                     pulses.append(pigpio.pulse(0, clock|data, WAVE_DELAY))
+      pulses.append(pigpio.pulse(clock, 0, WAVE_DELAY))
+    pulses.append(pigpio.pulse(load, 0, WAVE_DELAY))
+    calls=0
+    self.pi.wave_add_generic(pulses)
+    wid=self.pi.wave_create()
+    calls+=2
+    if wid<0:
+      self.calls+=calls
+      raise TransportException("Could not create waveform (error %d)" % wid)
+    self.pi.wave_send_once(wid)
+    calls+=1
+    # Wave is sent by the daemon in the background. Wait until done, before it can be deleted
+    wavetime=len(pulses)*WAVE_DELAY/1000000.0
+    while True:
+      time.sleep(wavetime)
+      calls+=1
+      if not self.pi.wave_tx_busy(): break
+    self.pi.wave_delete(wid)
+    calls+=1
+    self.calls+=calls
+    return(calls)
+
+# Hardware SPI (pigpio spi_open/spi_xfer). One call per register.
+# If the load pin is a chip enable pin of the main SPI bus (CE0=gpio 8, CE1=gpio 7), the SPI
+# hardware drives load. Any other load pin is driven with pi.write around the transfer (3 calls)
+# on channel 0, with the CE0 pin left alone.
+class SPITransport(Transport):
+  mode=SPI
+  SCLK=11
+  MOSI=10
+  CE={8: 0, 7: 1}
+
+  def __init__(self, pi, baud=1000000, channel=0):
+    Transport.__init__(self, pi)
+    self.baud=baud          # Max7219 handles up to 10MHz
+    self.channel=channel    # Channel used for load pins which are not CE pins
+    self.handles={}         # Open spi handles per channel
+
+  def handle(self, channel, flags=0):
+    if channel not in self.handles:
+      self.handles[channel]=self.pi.spi_open(channel, self.baud, flags)
+      self.calls+=1
+    return(self.handles[channel])
+
+  def attach(self, load):
+    if load in self.CE:
+      self.handle(self.CE[load])
+    else:
+      # Flag bit ux (5+channel) tells pigpio not to reserve the CE pin of the channel
+      self.handle(self.channel, 1 << (5+self.channel))
+      self.pi.set_mode(load, pigpio.OUTPUT)
+      self.pi.write(load, 1)
+      self.calls+=2
+
+  def send(self, value, load):
+    data=[value >> 8, value & 255]
+    if load in self.CE:
+      self.pi.spi_xfer(self.handles[self.CE[load]], data)
+      self.calls+=1
+      return(1)
+    self.pi.write(load,0)
+    self.pi.spi_xfer(self.handles[self.channel], data)
+    self.pi.write(load,1)
+    self.calls+=3
+    return(3)
+
+  def close(self):
+    for channel in list(self.handles):
+      self.pi.spi_close(self.handles.pop(channel))
+      self.calls+=1
+
+# In-memory transport for testing without a pi. Records every word sent
+class FakeTransport(Transport):
+  mode="fake"
+
+  def __init__(self, pi=None):
+    Transport.__init__(self, pi)
+    self.loads=[]   # Attached load pins
+    self.sent=[]    # (load, register, data) for every word sent
+
+  def attach(self, load):
+    self.loads.append(load)
+
+  def send(self, value, load):
+    self.sent.append((load, value >> 8, value & 255))
+    self.calls+=1
+    return(1)
+
+  # Register values latched in the max7219 on the given load pin, as a dictionary
+  def latched(self, load):
+    registers={}
+    for (l, reg, data) in self.sent:
+      if l==load: registers[reg]=data
+    return(registers)
+
+  def clear(self):
+    self.sent=[]
+
+class TransportException(Exception): pass
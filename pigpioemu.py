@@ -0,0 +1,339 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Local emulator of the pigpio daemon (pigpiod) socket protocol.
+#
+# Speaks enough of the protocol for the unmodified pigpio python client (pigpio.pi())
+# to run our code on any machine: set_mode, get_mode, set_pull_up_down, read, write,
+# bank reads/writes, callbacks (notifications), wait_for_edge, set_glitch_filter,
+# set_watchdog, get_current_tick, get_hardware_revision, waveforms and hardware SPI.
+# GPIO levels are kept in a virtual bank. Edges on inputs can be injected with inject()
+# and pulse(). Every command is counted, so real round-trip counts of our code paths
+# can be measured.
+#
+# Start it and point the client at it:
+#   emu=pigpioemu.Emulator(port=8889).start()
+#   pi=pigpio.pi("localhost", 8889)
+# or from the command line (reads "gpio level" or "gpio level ms" lines from stdin):
+#   ./pigpioemu.py 8889
+
+import sys
+import time
+import struct
+import socket
+import logging
+import threading
+import collections
+try:
+  import SocketServer as socketserver
+except ImportError:
+  import socketserver
+
+log = logging.getLogger(__name__)
+
+# Command numbers (from pigpio.py)
+MODES=0; MODEG=1; PUD=2; READ=3; WRITE=4; WDOG=9
+BR1=10; BR2=11; BC1=12; BC2=13; BS1=14; BS2=15; TICK=16; HWVER=17
+NO=18; NB=19; NP=20; NC=21; PIGPV=26
+WVCLR=27; WVAG=28; WVBSY=32; WVHLT=33; WVCRE=49; WVDEL=50; WVTX=51; WVNEW=53
+SPIO=71; SPIC=72; SPIR=73; SPIW=74; SPIX=75
+FG=97; FN=98; NOIB=99
+
+NAMES={MODES: "set_mode", MODEG: "get_mode", PUD: "set_pull_up_down", READ: "read", WRITE: "write",
+       WDOG: "set_watchdog", BR1: "read_bank_1", BR2: "read_bank_2", BC1: "clear_bank_1",
+       BC2: "clear_bank_2", BS1: "set_bank_1", BS2: "set_bank_2", TICK: "get_current_tick",
+       HWVER: "get_hardware_revision", NO: "notify_open", NB: "notify_begin", NP: "notify_pause",
+       NC: "notify_close", PIGPV: "get_pigpio_version", WVCLR: "wave_clear", WVAG: "wave_add_generic",
+       WVBSY: "wave_tx_busy", WVHLT: "wave_tx_stop", WVCRE: "wave_create", WVDEL: "wave_delete",
+       WVTX: "wave_send_once", WVNEW: "wave_add_new", SPIO: "spi_open", SPIC: "spi_close",
+       SPIR: "spi_read", SPIW: "spi_write", SPIX: "spi_xfer", FG: "set_glitch_filter",
+       FN: "set_noise_filter", NOIB: "notify_open_in_band"}
+
+# Modes, pulls and notification flags
+INPUT=0; OUTPUT=1
+PUD_OFF=0; PUD_DOWN=1; PUD_UP=2
+NTFY_FLAGS_WDOG=1 << 5
+
+# Error codes
+PI_BAD_GPIO=-3; PI_BAD_HANDLE=-25; PI_BAD_WAVE_ID=-66; PI_UNKNOWN_COMMAND=-88
+
+HARDWARE_REVISION=0xa02082  # Pi 3 model B
+PIGPIO_VERSION=79
+
+class Emulator:
+
+  def __init__(self, host="localhost", port=8888, latency=0, history=100000):
+    self.host=host
+    self.port=port
+    self.latency=latency        # Extra delay in seconds added to every command (models a slow pi)
+    self.lock=threading.RLock()
+    self.starttime=time.time()
+    # Virtual gpio state
+    self.levels=0               # Bank 1 levels
+    self.modes=[INPUT]*54
+    self.pulls=[PUD_OFF]*54
+    self.glitch=[0]*32          # Glitch filter steady time in us
+    self.watchdog=[0]*32        # Watchdog timeout in ms
+    self.lastchange=[0]*32      # Tick of last reported level change
+    self.pending={}             # gpio -> (level, tick) of edges held back by a glitch filter
+    # Notifications: handle -> [socket, bits, sequence number]
+    self.notify={}
+    self.nexthandle=0
+    # Waveforms and spi
+    self.wavepulses=[]
+    self.waves={}
+    self.spi={}                 # handle -> (channel, baud, flags)
+    self.spilog=collections.deque(maxlen=history)
+    # Statistics and history of level changes (tick, gpio, level)
+    self.counts=collections.defaultdict(int)
+    self.history=collections.deque(maxlen=history)
+    self.server=None
+    self.running=False
+
+  # Start server and timer threads. Returns self, so emu=Emulator().start() works
+  def start(self):
+    emulator=self
+    class Handler(socketserver.BaseRequestHandler):
+      def handle(self):
+        emulator.serve(self.request)
+    socketserver.TCPServer.allow_reuse_address=True
+    self.server=socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+    self.server.daemon_threads=True
+    self.port=self.server.server_address[1]   # In case port 0 was given
+    self.running=True
+    self.thread=threading.Thread(target=self.server.serve_forever, name="PigpioEmu")
+    self.thread.daemon=True
+    self.thread.start()
+    self.timer=threading.Thread(target=self.runTimers, name="PigpioEmuTimer")
+    self.timer.daemon=True
+    self.timer.start()
+    log.info("Pigpio emulator listening on %s:%d" % (self.host, self.port))
+    return(self)
+
+  def stop(self):
+    self.running=False
+    if self.server:
+      self.server.shutdown()
+      self.server.server_close()
+    with self.lock:
+      for (sock, bits, seq) in self.notify.values():
+        try: sock.close()
+        except socket.error: pass
+      self.notify={}
+
+  def tick(self):
+    return(int((time.time()-self.starttime)*1000000) & 0xffffffff)
+
+  # Number of commands recieved, in total or for one command name ("write", "set_bank_1"...)
+  def calls(self, name=None):
+    if name is None: return(sum(self.counts.values()))
+    return(self.counts[name])
+
+  def resetCalls(self):
+    self.counts.clear()
+
+  # Set the level of a gpio from the outside world (a sensor or button changing)
+  def inject(self, gpio, level):
+    with self.lock:
+      self.setLevel(gpio, level, self.tick(), external=True)
+
+  # Set gpio to level for duration seconds and back again. Runs in the background unless wait
+  def pulse(self, gpio, level, duration, wait=False):
+    def run():
+      self.inject(gpio, level)
+      time.sleep(duration)
+      self.inject(gpio, 1-level)
+    if wait: run()
+    else: threading.Thread(target=run).start()
+
+  def read(self, gpio):
+    return((self.levels >> gpio) & 1)
+
+  # Change a level. Edges on inputs from the outside pass through the glitch filter
+  def setLevel(self, gpio, level, tick, external=False):
+    level=1 if level else 0
+    if gpio>31: return
+    if external and self.glitch[gpio]:
+      if self.read(gpio)==level: self.pending.pop(gpio, None)
+      else: self.pending[gpio]=(level, tick)
+      return
+    if self.read(gpio)==level: return
+    if level: self.levels|=1 << gpio
+    else:     self.levels&=~(1 << gpio)
+    self.history.append((tick, gpio, level))
+    self.lastchange[gpio]=tick
+    self.report(1 << gpio, tick)
+
+  def setBank(self, bits, level, tick):
+    for gpio in range(32):
+      if bits & (1 << gpio): self.setLevel(gpio, level, tick)
+
+  # Send a report to all notification handles watching any of the given gpio bits
+  def report(self, bits, tick, flags=0):
+    for (handle, entry) in list(self.notify.items()):
+      (sock, monitor, seq)=entry
+      if not (monitor & bits): continue
+      entry[2]=(seq+1) & 0xffff
+      try:
+        sock.sendall(struct.pack("HHII", seq, flags, tick, self.levels))
+      except socket.error:
+        del self.notify[handle]
+
+  # Watchdogs and glitch filters are handled by this thread with 1ms resolution
+  def runTimers(self):
+    while self.running:
+      time.sleep(.001)
+      with self.lock:
+        tick=self.tick()
+        for (gpio, (level, t)) in list(self.pending.items()):
+          if ((tick-t) & 0xffffffff)>=self.glitch[gpio]:
+            del self.pending[gpio]
+            self.setLevel(gpio, level, t)
+        for gpio in range(32):
+          timeout=self.watchdog[gpio]
+          if timeout and ((tick-self.lastchange[gpio]) & 0xffffffff)>=1000*timeout:
+            self.lastchange[gpio]=tick
+            self.report(1 << gpio, tick, NTFY_FLAGS_WDOG | gpio)
+
+  # Serve one client connection (command or notification socket)
+  def serve(self, sock):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    handle=None
+    try:
+      while self.running:
+        msg=self.recvall(sock, 16)
+        if msg is None: break
+        (cmd, p1, p2, p3)=struct.unpack("IIII", msg)
+        ext=self.recvall(sock, p3) if p3 else b""
+        if ext is None: break
+        if self.latency: time.sleep(self.latency)
+        with self.lock:
+          self.counts[NAMES.get(cmd, "cmd%d" % cmd)]+=1
+          if cmd==NOIB:
+            handle=self.nexthandle
+            self.nexthandle+=1
+            sock.sendall(struct.pack("IIIi", cmd, p1, p2, handle))
+            self.notify[handle]=[sock, 0, 0]
+            continue
+          (res, data)=self.command(cmd, p1, p2, ext)
+          sock.sendall(struct.pack("IIIi", cmd, p1, p2, res)+data)
+    except socket.error:
+      pass
+    finally:
+      with self.lock:
+        if handle is not None: self.notify.pop(handle, None)
+
+  def recvall(self, sock, n):
+    buf=b""
+    while len(buf)<n:
+      chunk=sock.recv(n-len(buf))
+      if not chunk: return(None)
+      buf+=chunk
+    return(buf)
+
+  # Execute a command. Returns (result, extra data). Lock is held
+  def command(self, cmd, p1, p2, ext):
+    tick=self.tick()
+    if cmd in (MODES, MODEG, PUD, READ, WRITE, FG, FN, WDOG) and p1>53: return(PI_BAD_GPIO, b"")
+    if cmd==MODES:
+      self.modes[p1]=p2
+      if p2==INPUT and self.pulls[p1]!=PUD_OFF: self.setLevel(p1, self.pulls[p1]==PUD_UP, tick)
+    elif cmd==MODEG: return(self.modes[p1], b"")
+    elif cmd==PUD:
+      self.pulls[p1]=p2
+      if self.modes[p1]==INPUT and p2!=PUD_OFF: self.setLevel(p1, p2==PUD_UP, tick)
+    elif cmd==READ:  return(self.read(p1), b"")
+    elif cmd==WRITE:
+      if self.modes[p1]==INPUT: self.modes[p1]=OUTPUT   # Like pigpiod, writing makes the pin an output
+      self.setLevel(p1, p2, tick)
+    elif cmd==BR1:   return(self.levels, b"")
+    elif cmd==BR2:   return(0, b"")
+    elif cmd==BC1:   self.setBank(p1, 0, tick)
+    elif cmd==BS1:   self.setBank(p1, 1, tick)
+    elif cmd in (BC2, BS2): pass
+    elif cmd==TICK:  return(tick, b"")
+    elif cmd==HWVER: return(HARDWARE_REVISION, b"")
+    elif cmd==PIGPV: return(PIGPIO_VERSION, b"")
+    elif cmd==NB:
+      if p1 not in self.notify: return(PI_BAD_HANDLE, b"")
+      self.notify[p1][1]=p2
+    elif cmd==NP:
+      if p1 not in self.notify: return(PI_BAD_HANDLE, b"")
+      self.notify[p1][1]=0
+    elif cmd==NC:
+      if p1 not in self.notify: return(PI_BAD_HANDLE, b"")
+      del self.notify[p1]
+    elif cmd==WDOG:
+      self.watchdog[p1]=p2
+      self.lastchange[p1]=tick
+    elif cmd==FG:
+      self.glitch[p1]=p2
+      if not p2: self.pending.pop(p1, None)
+    elif cmd==FN: pass
+    elif cmd in (WVCLR, WVNEW):
+      self.wavepulses=[]
+      if cmd==WVCLR: self.waves={}
+    elif cmd==WVAG:
+      for i in range(0, len(ext), 12):
+        self.wavepulses.append(struct.unpack("III", ext[i:i+12]))
+      return(len(self.wavepulses), b"")
+    elif cmd==WVCRE:
+      wid=0
+      while wid in self.waves: wid+=1
+      self.waves[wid]=self.wavepulses
+      self.wavepulses=[]
+      return(wid, b"")
+    elif cmd==WVDEL:
+      if p1 not in self.waves: return(PI_BAD_WAVE_ID, b"")
+      del self.waves[p1]
+    elif cmd==WVTX:
+      if p1 not in self.waves: return(PI_BAD_WAVE_ID, b"")
+      # The wave is played instantly, with ticks advancing as the pulse delays say
+      for (on, off, delay) in self.waves[p1]:
+        self.setBank(on, 1, tick)
+        self.setBank(off, 0, tick)
+        tick=(tick+delay) & 0xffffffff
+      return(len(self.waves[p1]), b"")
+    elif cmd in (WVBSY, WVHLT): pass
+    elif cmd==SPIO:
+      handle=0
+      while handle in self.spi: handle+=1
+      flags=struct.unpack("I", ext[:4])[0] if len(ext)>=4 else 0
+      self.spi[handle]=(p1, p2, flags)
+      return(handle, b"")
+    elif cmd==SPIC:
+      if p1 not in self.spi: return(PI_BAD_HANDLE, b"")
+      del self.spi[p1]
+    elif cmd in (SPIW, SPIX):
+      if p1 not in self.spi: return(PI_BAD_HANDLE, b"")
+      self.spilog.append((tick, self.spi[p1][0], bytearray(ext)))
+      if cmd==SPIX: return(len(ext), b"\0"*len(ext))
+      return(len(ext), b"")
+    elif cmd==SPIR:
+      if p1 not in self.spi: return(PI_BAD_HANDLE, b"")
+      return(p2, b"\0"*p2)
+    else:
+      log.warning("Unknown pigpio command %d" % cmd)
+      return(PI_UNKNOWN_COMMAND, b"")
+    return(0, b"")
+
+if __name__ == '__main__':
+  logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(threadName)s:%(message)s')
+  port=int(sys.argv[1]) if len(sys.argv)>1 else 8888
+  emu=Emulator(port=port).start()
+  print("Enter 'gpio level' to set a level, 'gpio level ms' for a pulse, 's' for statistics, 'q' to quit")
+  try:
+    while True:
+      line=sys.stdin.readline()
+      if not line or line.strip()=="q": break
+      args=line.split()
+      if not args: continue
+      if args[0]=="s":
+        for name in sorted(emu.counts): print("%-24s %d" % (name, emu.counts[name]))
+      elif len(args)==2: emu.inject(int(args[0]), int(args[1]))
+      elif len(args)==3: emu.pulse(int(args[0]), int(args[1]), int(args[2])/1000.0)
+      else: print("Unknown command")
+  except KeyboardInterrupt:
+    print("Keyboard interrupt")
+  finally:
+    emu.stop()
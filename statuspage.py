@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Live table state in a small memory-mapped file (default /dev/shm/foosball), for local
+# readers polling at high frequency without opening files or touching the SD card.
+#
+# Fixed little endian layout (see LAYOUT):
+#   magic "FBST", layout version, size, sequence number,
+#   score1, score2, vacant, team of last goal, tick of last goal, time of last goal,
+#   occupied since, heartbeat counter, heartbeat time, time of last update
+# Times are unix times (0 if unset). Ticks are pigpio ticks.
+#
+# Seqlock: The writer makes the sequence number odd, writes the fields and makes it even
+# again. A reader reads the sequence number, the fields and the sequence number again, and
+# retries if it was odd or has changed. So readers never lock and never see a half update.
+#
+# Usage: statuspage.py [path] [-f]     Print the status (-f: keep printing changes)
+
+import os
+import sys
+import mmap
+import time
+import struct
+import threading
+import collections
+
+PATH="/dev/shm/foosball"
+MAGIC=b"FBST"
+VERSION=1
+HEAD=struct.Struct("<4sHHI")           # magic, version, size, sequence
+BODY=struct.Struct("<HHBB2xIddI4xdd")  # Fields after the sequence number
+SEQ=8                                  # Offset of the sequence number
+SIZE=HEAD.size+BODY.size
+
+Status=collections.namedtuple("Status", "seq score1 score2 vacant lastgoalteam lastgoaltick lastgoaltime "
+                                        "occupiedsince heartbeat heartbeattime updated")
+
+class StatusPage:
+
+  def __init__(self, path=PATH):
+    self.path=path
+    self.lock=threading.Lock()
+    self.fields={"score1": 0, "score2": 0, "vacant": 1, "lastgoalteam": 0, "lastgoaltick": 0, "lastgoaltime": 0.0,
+                 "occupiedsince": 0.0, "heartbeat": 0, "heartbeattime": 0.0, "updated": 0.0}
+    self.seq=0
+    # Create the file under a temporary name, so readers never see it without a header
+    tmpname="%s.%d" % (path, os.getpid())
+    with open(tmpname, "wb") as f:
+      f.write(HEAD.pack(MAGIC, VERSION, SIZE, 0)+b"\0"*BODY.size)
+    os.chmod(tmpname, 0o644)
+    os.rename(tmpname, path)
+    self.file=open(path, "r+b")
+    self.map=mmap.mmap(self.file.fileno(), SIZE)
+    self.update()
+
+  # Change fields (names as in Status)
+  def update(self, **fields):
+    with self.lock:
+      self.fields.update(fields)
+      self.fields["updated"]=time.time()
+      f=self.fields
+      body=BODY.pack(f["score1"], f["score2"], f["vacant"], f["lastgoalteam"], f["lastgoaltick"],
+                     f["lastgoaltime"], f["occupiedsince"], f["heartbeat"], f["heartbeattime"], f["updated"])
+      # Slice assignments, not pack_into: pack_into (python 2) zeroes the bytes before packing,
+      # so readers could see sequence number 0, which is even
+      self.seq+=1
+      self.map[SEQ:SEQ+4]=struct.pack("<I", self.seq)
+      self.map[HEAD.size:SIZE]=body
+      self.seq+=1
+      self.map[SEQ:SEQ+4]=struct.pack("<I", self.seq)
+
+  # Heartbeat: Count up and set time
+  def beat(self):
+    with self.lock:
+      count=self.fields["heartbeat"]+1
+    self.update(heartbeat=count, heartbeattime=time.time())
+
+  def close(self):
+    self.map.close()
+    self.file.close()
+
+class StatusReader:
+
+  def __init__(self, path=PATH):
+    self.file=open(path, "rb")
+    self.map=mmap.mmap(self.file.fileno(), SIZE, access=mmap.ACCESS_READ)
+    (magic, version, size, seq)=HEAD.unpack_from(self.map, 0)
+    if magic!=MAGIC or version!=VERSION or size!=SIZE:
+      raise StatusPageException("%s is not a status page (version %d)" % (path, VERSION))
+
+  # Consistent snapshot of the status
+  def read(self):
+    while True:
+      seq=struct.unpack_from("<I", self.map, SEQ)[0]
+      if seq & 1: continue
+      body=self.map[HEAD.size:SIZE]
+      if struct.unpack_from("<I", self.map, SEQ)[0]==seq:
+        return(Status(seq, *BODY.unpack(body)))
+
+  def close(self):
+    self.map.close()
+    self.file.close()
+
+class StatusPageException(Exception): pass
+
+if __name__ == '__main__':
+  args=[a for a in sys.argv[1:] if a!="-f"]
+  reader=StatusReader(args[0] if args else PATH)
+  seq=None
+  while True:
+    status=reader.read()
+    if status.seq!=seq:
+      print(status)
+      seq=status.seq
+    if "-f" not in sys.argv: break
+    time.sleep(.05)
@@ -4,6 +4,8 @@
 import time
 import pigpio
 import max7219bb
+import animation
+import effects
 import threading
 import logging
 
@@ -11,8 +13,11 @@ log = logging.getLogger(__name__)
 
 class TeamScore:
   
-  def __init__(self, pi, clock, data, load):
-    self.leds=max7219bb.MAX7219bb(pi, clock, data, load)
+  # If a MAX7219Bus is given, the leds are created on that bus (sharing its pins and lock)
+  # Blinks are run by the given animation scheduler, or by one shared by all scoreboards
+  def __init__(self, pi, clock, data, load, mode=max7219bb.BANK, bus=None, scheduler=None):
+    if bus: self.leds=bus.device(load)
+    else:   self.leds=max7219bb.MAX7219bb(pi, clock, data, load, mode=mode)
     # Teamscore configuration variables
     self.setIntensity(4)      # Current intensity - default=4
     self.leading0=False       # Should leading zero be displayed
@@ -25,8 +30,11 @@ class TeamScore:
     self.blinknum=2           # Blink on score update (turn off) this many times. 0 or false to deactivate
     self.blinktime=.2         # Stay on and off for this many seconds
     self.blinklock=threading.Lock()
-    self.blinkthread=None     # Thread object for last blinker thread started
-    self.deadthreads=()       # List of threads asked to die, ready to be joined and thus erased
+    self.blinkhandle=None     # Animation handle of the last blink started
+    self.scheduler=scheduler if scheduler else animation.sharedScheduler()
+    # Segment effects (see effects.py)
+    self.effecthandle=None    # Animation handle of the segment effect playing
+    self.flip=False           # Scoreboard is mounted upside down. Only used by effects
     # Default max7219 setup
     self.leds.setDecode(True) # Use decoding, so the digits are send as decimals
     self.leds.useDigits(2)    # Only scan 2 digits.
@@ -60,6 +68,7 @@ class TeamScore:
     self.leds.shutdown()
     self.active=False
 
+  # Registers allready holding the wanted value are not resent. Use refresh() to force everything
   def wakeup(self):
     self.active=True
     self.leds.disableTest()           # Turn off test mode
@@ -68,6 +77,10 @@ class TeamScore:
     self.send()                       # Send current score
     self.leds.wakeup()
 
+  # Force all registers to be resent, to recover from random mistakes on the leds
+  def refresh(self):
+    self.leds.refresh()
+
   def blinkOn(self):
     self.leds.wakeup()
     self.active=True
@@ -93,50 +106,43 @@ class TeamScore:
     if self.active: self.blinkStart()
 
   def setScore(self,num):
+    self.effectCancel()
     self.score=num
     self.send()
 
+  # Play a named segment effect from effects.PATTERNS. The score is shown again when it ends
+  def playEffect(self, name):
+    (frames, fps, repeat)=effects.PATTERNS[name]
+    self.effectCancel()
+    self.effecthandle=self.scheduler.add(effects.SegmentEffect(self, effects.COMPILED[self.flip][name], fps, repeat))
+    return(self.effecthandle)
+
+  # Stop a playing effect and show the score in decimal digits again at once
+  def effectCancel(self):
+    if not self.effecthandle: return
+    self.effecthandle.cancel()
+    with self.blinklock:
+      self.effecthandle.effect.restore()
+    self.effecthandle=None
+
   def blinkCancel(self):
-    try:
-      self.blinkthread.stoprequest.set()
-    except:
-      pass
+    if self.blinkhandle: self.blinkhandle.cancel()
     with self.blinklock:
       if not self.active: self.wakeup()
 
   def blinkStart(self):
     self.blinkCancel()
-    self.blinkthread=EffectThread(self)
-    self.blinkthread.start()
+    if not self.blinknum: return
+    self.blinkhandle=self.scheduler.add(animation.BlinkEffect(self, self.blinknum, self.blinktime))
 
+  # Only digits which actually changed are sent to the leds
   def send(self):
     d1=self.score%10
     d2=int(self.score/10)
-    self.leds.send(1,d1)
+    self.leds.setRegister(1,d1)
     # Check if leading zero should be desplayed
     if d2==0 and not self.leading0: d2=15
-    self.leds.send(2,d2)
-
-class EffectThread(threading.Thread):
-
-  def __init__(self, teamscore):
-    super(EffectThread, self).__init__()
-    self.teamscore=teamscore
-    self.stoprequest=threading.Event()
-    self.blinkCurrent=0
-    self.blinkTarget=2*teamscore.blinknum
-    self.blinkTime=teamscore.blinktime
-
-  def stop(self):
-    self.stoprequest.set()
-
-  def run(self):
-    while self.blinkCurrent<self.blinkTarget:
-      time.sleep(self.blinkTime)
-      with self.teamscore.blinklock:
-        if self.stoprequest.isSet(): break
-        if self.blinkCurrent%2==0: self.teamscore.blinkOff()
-        else:                      self.teamscore.blinkOn()
-        self.blinkCurrent+=1
-  
+    self.leds.setRegister(2,d2)
+    self.leds.flush()
+
 class TeamScoreException(Exception): pass
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the match history analytics. No pi needed (needs numpy).
+# Compares the results on a small archive with the same statistics computed match by match,
+# then times a large archive (written directly as columns) and the cache.
+#
+# Usage: test_analytics.py [matches in the large archive]
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import numpy
+import matchlog
+import analytics
+import matcharchive
+
+def randomMatch(store, start):
+  match=matchlog.Match(store, start)
+  score=[0, 0, 0]
+  t=start
+  while max(score)<10:
+    t+=random.uniform(5, 120)
+    team=random.choice((1, 2))
+    score[team]+=1
+    match.goal(team, t, score[1], score[2])
+  match.finish(reason="reset", finishtime=t+10)
+  return(match)
+
+# The analytics computed match by match
+def expected(played, maxscore):
+  size=maxscore+1
+  heatmap=[[0]*size for i in range(size)]
+  wins=[[0]*size for i in range(size)]
+  total=[[0]*size for i in range(size)]
+  hours=[0]*24
+  for m in played:
+    heatmap[min(m.score1, maxscore)][min(m.score2, maxscore)]+=1
+    won=m.score1>m.score2
+    for (s1, s2) in [(0, 0)]+[(g.score1, g.score2) for g in m.goallist]:
+      total[min(s1, maxscore)][min(s2, maxscore)]+=1
+      wins[min(s1, maxscore)][min(s2, maxscore)]+=won
+    for g in m.goallist:
+      hours[time.localtime(m.starttime+numpy.float32(g.time-m.starttime)).tm_hour]+=1
+  p=[[(round(float(wins[i][j])/total[i][j], 4) if total[i][j] else None) for j in range(size)] for i in range(size)]
+  return(heatmap, p, hours)
+
+# Write n random matches straight into the columns of one segment
+def writeSegment(path, n):
+  os.makedirs(path)
+  goals=numpy.random.randint(10, 20, n)
+  rows=int(goals.sum())
+  start=time.time()-n*900+numpy.arange(n)*900.0
+  columns={"matches": {"start": start, "end": start+600, "score1": numpy.random.randint(0, 11, n),
+                       "score2": numpy.random.randint(0, 11, n), "goals": goals, "reason": numpy.ones(n),
+                       "id": numpy.arange(1, n+1)},
+           "goals":   {"match": numpy.repeat(numpy.arange(1, n+1), goals), "team": numpy.random.randint(1, 3, rows),
+                       "tick": numpy.zeros(rows), "offset": numpy.random.uniform(0, 600, rows),
+                       "score1": numpy.random.randint(0, 11, rows), "score2": numpy.random.randint(0, 11, rows)}}
+  for (table, schema) in (("matches", matcharchive.MATCHES), ("goals", matcharchive.GOALS)):
+    for (column, dtype, fmt) in schema:
+      columns[table][column].astype(dtype).tofile(matcharchive.columnFile(path, table, column))
+  return(rows)
+
+if __name__ == '__main__':
+  count=int(sys.argv[1]) if len(sys.argv)>1 else 100000
+  directory=tempfile.mkdtemp()
+  try:
+    # Small archive, checked against the match by match results
+    small=os.path.join(directory, "small")
+    archive=matcharchive.MatchArchive(small)
+    archive.compacted=time.strftime("%Y%m%d")
+    first=time.mktime((2026, 8, 20, 0, 0, 0, 0, 0, -1))
+    played=[randomMatch(archive, first+i*1800) for i in range(2000)]
+    archive.compact(today=time.strftime("%Y%m%d", time.localtime(first+1000*1800)))
+    a=analytics.Analytics(small, os.path.join(directory, "analytics.json"), maxscore=8)
+    results=a.results()
+    (heatmap, p, hours)=expected(played, 8)
+    assert results["matches"]==2000 and results["goals"]==sum(len(m.goallist) for m in played)
+    assert results["heatmap"]==heatmap
+    assert results["winprobability"]==p
+    assert results["goalhours"]==hours, (results["goalhours"], hours)
+    assert sum(results["goalweekhours"])==results["goals"]
+    print("Heatmap, win probability and goal hours: OK (team 1 wins from 0-0 %.3f, from 2-5 %s)" %
+          (p[0][0], p[2][5]))
+    # Cached until a match is added. The cache file is used by a new instance
+    assert a.results() is results
+    assert analytics.Analytics(small, os.path.join(directory, "analytics.json"), maxscore=8).results()==results
+    played.append(randomMatch(archive, time.time()))
+    archive.close()
+    assert a.results()["matches"]==2001
+    print("Cache: OK")
+
+    # Large archive
+    large=os.path.join(directory, "large")
+    rows=writeSegment(os.path.join(large, time.strftime("%Y%m%d")), count)
+    a=analytics.Analytics(large)
+    start=time.time()
+    results=a.results()
+    elapsed=time.time()-start
+    assert results["matches"]==count and results["goals"]==rows
+    start=time.time()
+    a.results()
+    print("%d matches, %d goals: %.3f s (cached: %.2f ms)" % (count, rows, elapsed, 1000*(time.time()-start)))
+  finally:
+    shutil.rmtree(directory)
@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Micro-benchmark of the max7219 transport modes.
+# Sends the same register writes in every mode and shows pigpio calls and time per register
+# Without a pigpio daemon it runs against the local emulator (pigpioemu.py), which counts the
+# same calls, but the times are those of the emulator, not of a pi.
+
+import time
+import pigpio
+import max7219bb
+import pigpioemu
+
+# Register writes of a typical scoreboard session: digits, blink (shutdown) and setup
+writes=[(1,d) for d in range(10)]+[(2,d) for d in range(10)]
+writes+=[(max7219bb.SHUTDOWN,0),(max7219bb.SHUTDOWN,1)]*5
+writes+=[(max7219bb.INTENSITY,4),(max7219bb.DECODE_MODE,255),(max7219bb.SCAN_LIMIT,1),(max7219bb.DISPLAY_TEST,0)]
+
+pi=pigpio.pi(show_errors=False)
+emu=None
+if not pi.connected:
+  print("No pigpio daemon. Using the pigpio emulator")
+  emu=pigpioemu.Emulator(port=8889).start()
+  pi=pigpio.pi("localhost", 8889)
+m=max7219bb.MAX7219bb(pi, clock=22, data=27, load=23, skipsetup=True)
+
+try:
+  print("%-8s %10s %10s" % ("Mode", "Calls/reg", "ms/reg"))
+  for mode in (max7219bb.BITBANG, max7219bb.BANK, max7219bb.WAVE):
+    m.setMode(mode)
+    m.resetCalls()
+    start=time.time()
+    for (reg, data) in writes:
+      m.send(reg, data, force=True)
+    t=time.time()-start
+    # Wave mode falls back to bank writes if waveforms are not available
+    if m.mode!=mode: print("%-8s fell back to %s" % (mode, m.mode))
+    print("%-8s %10.1f %10.3f" % (mode, float(m.calls)/len(writes), 1000*t/len(writes)))
+
+except KeyboardInterrupt:
+  print("Keyboard interrupt")
+
+finally:
+  print("Running finally cleanup code")
+  m.shutdown()
+  pi.stop()
+  if emu: emu.stop()
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the command channel against a Foosball instance on the in-process fake pigpio
+# (fakepi.py). No pi needed. Sends commands over the unix socket, checks the replies and
+# the scoreboards, and measures the round trip time.
+#
+# Usage: test_commandserver.py [round trips]
+
+import sys
+import json
+import time
+import socket
+import shutil
+import logging
+import tempfile
+import fakepi
+import foosball_main
+import commandserver
+
+if __name__ == '__main__':
+  logging.getLogger("Foosball").setLevel(logging.WARNING)
+  n=int(sys.argv[1]) if len(sys.argv)>1 else 1000
+  directory=tempfile.mkdtemp()
+  pi=fakepi.FakePi()
+  foosball=foosball_main.Foosball(pi=pi, wwwdir=directory)
+  path=foosball.commands.path
+  try:
+    foosball.start()
+    # A table turned off can't be turned on by a score
+    reply=commandserver.send(path, {"cmd": "alwaysoff"})
+    assert reply["ok"], reply
+    reply=commandserver.send(path, {"cmd": "score", "score1": 3, "score2": 5})
+    assert not reply["ok"] and "allwaysOff" in reply["error"], reply
+    assert commandserver.send(path, {"cmd": "alwaysoff", "state": False})["ok"]
+    assert foosball.pendingScore is None
+    print("Score on table turned off rejected: OK")
+    # Setting the score turns the table on, and the score is set when it is occupied
+    reply=commandserver.send(path, {"cmd": "score", "score1": 3, "score2": 5, "id": 1})
+    assert reply["ok"] and reply["id"]==1, reply
+    for i in range(100):
+      if foosball.active and foosball.team[1].score==3: break
+      time.sleep(.01)
+    assert foosball.active and (foosball.team[1].score, foosball.team[2].score)==(3, 5)
+    print("Score on inactive table: OK")
+    reply=commandserver.send(path, {"cmd": "state"})
+    assert reply["ok"] and reply["state"]["score"]==[3, 5], reply
+    reply=commandserver.send(path, {"cmd": "nonsense"})
+    assert not reply["ok"], reply
+    reply=commandserver.send(path, {"cmd": "score", "score1": "x"})
+    assert not reply["ok"], reply
+    print("State and errors: OK")
+    # Pipelined commands on one connection are answered in order
+    s=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    f=s.makefile("r")
+    s.sendall("".join(json.dumps({"cmd": "score", "score1": i, "score2": 0, "id": i})+"\n" for i in range(10)))
+    ids=[json.loads(f.readline())["id"] for i in range(10)]
+    assert ids==range(10), ids
+    print("Pipelined commands: OK")
+    # Unexpected errors and commands dropped from a full game queue are answered too
+    def fail(state): raise RuntimeError("broken")
+    (setAllwaysOn, foosball.activity.setAllwaysOn)=(foosball.activity.setAllwaysOn, fail)
+    logging.getLogger("Foosball").setLevel(logging.CRITICAL)
+    logging.getLogger("events").addHandler(logging.NullHandler())
+    reply=commandserver.send(path, {"cmd": "alwayson"})
+    assert not reply["ok"] and "RuntimeError" in reply["error"], reply
+    foosball.activity.setAllwaysOn=setAllwaysOn
+    with foosball.scorelock:
+      s.sendall("".join(json.dumps({"cmd": "state", "id": i})+"\n" for i in range(100)))
+      time.sleep(.2)
+    replies=[json.loads(f.readline()) for i in range(100)]
+    logging.getLogger("Foosball").setLevel(logging.WARNING)
+    assert [r["id"] for r in replies]==range(100) and not all(r["ok"] for r in replies), replies
+    print("Failed and dropped commands answered: OK (%d dropped)" % len([r for r in replies if not r["ok"]]))
+    # Round trips
+    times=[]
+    for i in range(n):
+      start=time.time()
+      s.sendall(json.dumps({"cmd": "state"})+"\n")
+      json.loads(f.readline())
+      times.append(time.time()-start)
+    times.sort()
+    print("Round trip p50 %.3f ms, p99 %.3f ms" % (1000*times[n/2], 1000*times[int(n*.99)]))
+    s.close()
+  finally:
+    foosball.stop()
+    shutil.rmtree(directory)
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# coding: utf8
+
+# End-to-end latency benchmark of the goal path, score corrections and occupied/vacant.
+# Runs the real Foosball class against an in-process fake pigpio (fakepi.py), where every
+# pigpio call costs a configurable latency. No pi needed.
+#
+# For every scenario it reports p50/p99 latency, pigpio calls, time spent waiting for the
+# scoreboard lock and files written (pending state is flushed after each action). Latency is
+# measured from the gpio edge until both the scoreboard digit and the external score has
+# been updated.
+#
+# Usage: test_goal_latency.py [iterations] [latency us per pigpio call] [jitter us]
+
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import logging
+import fakepi
+import max7219bb
+import foosball_main
+
+# Lock wrapper measuring how long callers wait to get the scoreboard bus lock
+class TimedLock:
+  def __init__(self):
+    self.lock=threading.Lock()
+    self.wait=0.0
+    self.count=0
+  def __enter__(self):
+    start=time.time()
+    self.lock.acquire()
+    self.wait+=time.time()-start
+    self.count+=1
+  def __exit__(self, *args):
+    self.lock.release()
+
+def percentile(values, p):
+  values=sorted(values)
+  if not values: return(0)
+  return(values[min(len(values)-1, int(p*len(values)))])
+
+class Bench:
+
+  def __init__(self, latency, jitter):
+    self.wwwdir=tempfile.mkdtemp()
+    self.pi=fakepi.FakePi(latency=latency, jitter=jitter)
+    self.foosball=foosball_main.Foosball(pi=self.pi, wwwdir=self.wwwdir)
+    f=self.foosball
+    # Lasers are on, so the detector pins are low
+    for gpio in f.goaldetect.detect: self.pi.inject(gpio, 0)
+    # Measure lock waits on the shared scoreboard bus
+    self.lock=TimedLock()
+    f.scorebus.lock=self.lock
+    for dev in f.scorebus.devices: dev.setLock(self.lock)
+    # Short blinks, so blink threads are done before the next iteration
+    for team in (1,2):
+      f.team[team].scoreboard.blinktime=0.001
+      for b in (f.team[team].up, f.team[team].down): b.startup=False
+    # Record when the score file and the scoreboard digits are written
+    self.scoreDone=threading.Event()
+    self.ledDone=threading.Event()
+    self.expect=None
+    self.tscore=self.tled=0
+    setScore=f.external.setScore
+    def timedSetScore(team1, team2):
+      setScore(team1, team2)
+      if self.expect and (team1, team2)==self.expect[:2]:
+        self.tscore=time.time()
+        self.scoreDone.set()
+    f.external.setScore=timedSetScore
+    for team in (1,2):
+      leds=f.team[team].scoreboard.leds
+      def timedWrite(reg, data, leds=leds, write=leds.write, team=team):
+        write(reg, data)
+        if self.expect and reg==1 and team==self.expect[2] and data==self.expect[3]:
+          self.tled=time.time()
+          self.ledDone.set()
+      leds.write=timedWrite
+
+  def stop(self):
+    self.foosball.goaldetect.stop()
+    self.foosball.events.stop()
+    self.foosball.animator.stop()
+    shutil.rmtree(self.wwwdir)
+
+  # Wait for blinks and segment effects (the wake-up effect) to end
+  def waitBlinks(self):
+    for team in (1,2):
+      for handle in (self.foosball.team[team].scoreboard.blinkhandle, self.foosball.team[team].scoreboard.effecthandle):
+        if handle: handle.wait()
+
+  # Run action and wait for the score file and the team digit to show the new score
+  def measure(self, action, team, score1, score2):
+    f=self.foosball
+    digit=(score1 if team==1 else score2)%10
+    self.expect=(score1, score2, team, digit)
+    self.scoreDone.clear()
+    self.ledDone.clear()
+    calls=self.pi.calls()
+    writes=f.external.publisher.writes
+    lockwait=self.lock.wait
+    start=time.time()
+    action()
+    self.scoreDone.wait(5)
+    self.ledDone.wait(5)
+    latency=max(self.tscore, self.tled)-start
+    pathcalls=self.pi.calls()-calls
+    self.expect=None
+    self.foosball.events.drain(5)
+    f.external.flush()
+    self.waitBlinks()
+    return(latency, pathcalls, self.pi.calls()-calls, self.lock.wait-lockwait, f.external.publisher.writes-writes)
+
+  def goal(self, team):
+    f=self.foosball
+    gpio=f.goaldetect.detect[team-1]
+    s1=f.team[1].score+(team==1)
+    s2=f.team[2].score+(team==2)
+    def action():
+      # Ball breaks the laser for 5 ms. The goal is counted when the beam is restored
+      tick=self.pi.tick()
+      self.pi.inject(gpio, 1, tick)
+      self.pi.inject(gpio, 0, (tick+5000) & 0xffffffff)
+    return(self.measure(action, team, s1, s2))
+
+  def correct(self, team):
+    f=self.foosball
+    button=f.team[team].up
+    s1=f.team[1].score+(team==1)
+    s2=f.team[2].score+(team==2)
+    def action():
+      self.pi.inject(button.gpio, 0)   # Press
+      self.pi.inject(button.gpio, 1)   # Release
+    return(self.measure(action, team, s1, s2))
+
+  # Occupied/vacant are called directly, as the activity thread would
+  def transition(self, func):
+    calls=self.pi.calls()
+    writes=self.foosball.external.publisher.writes
+    lockwait=self.lock.wait
+    start=time.time()
+    func()
+    # Status and score files are written by the event threads
+    self.foosball.events.drain(5)
+    self.foosball.external.flush()
+    latency=time.time()-start
+    pathcalls=self.pi.calls()-calls
+    self.waitBlinks()
+    return(latency, pathcalls, self.pi.calls()-calls, self.lock.wait-lockwait, self.foosball.external.publisher.writes-writes)
+
+def report(name, results):
+  n=len(results)
+  lat=[r[0] for r in results]
+  print("%-12s %8.3f %8.3f %10.1f %10.1f %12.3f %8.2f" % (name, 1000*percentile(lat, .5), 1000*percentile(lat, .99),
+        float(sum(r[1] for r in results))/n, float(sum(r[2] for r in results))/n,
+        1000*sum(r[3] for r in results)/n, float(sum(r[4] for r in results))/n))
+
+if __name__ == '__main__':
+  logging.getLogger("Foosball").setLevel(logging.WARNING)
+  iterations=int(sys.argv[1]) if len(sys.argv)>1 else 200
+  latency=float(sys.argv[2])/1000000 if len(sys.argv)>2 else 80e-6
+  jitter=float(sys.argv[3])/1000000 if len(sys.argv)>3 else 40e-6
+  print("%d iterations, pigpio call latency %d us + 0-%d us jitter" % (iterations, latency*1000000, jitter*1000000))
+  bench=Bench(latency, jitter)
+  f=bench.foosball
+  try:
+    results={"goal": [], "correction": [], "occupied": [], "vacant": []}
+    results["occupied"].append(bench.transition(f.occupied))
+    # The wake-up effect has played, and the scoreboards show decimal digits again
+    for team in (1, 2):
+      leds=f.team[team].scoreboard.leds
+      assert f.team[team].scoreboard.effecthandle and leds.shadow[max7219bb.DECODE_MODE]==255
+    for i in range(iterations):
+      if f.team[1].score>=90 or f.team[2].score>=90: f.resetScore()
+      results["goal"].append(bench.goal(1+i%2))
+      results["correction"].append(bench.correct(1+i%2))
+    for i in range(max(1, iterations/20)):
+      results["vacant"].append(bench.transition(f.vacant))
+      results["occupied"].append(bench.transition(f.occupied))
+    print("%-12s %8s %8s %10s %10s %12s %8s" % ("Scenario", "p50 ms", "p99 ms", "Calls", "Calls+blink", "Lockwait ms", "Writes"))
+    for name in ("goal", "correction", "occupied", "vacant"):
+      report(name, results[name])
+  finally:
+    bench.stop()
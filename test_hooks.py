@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the hook scripts against a Foosball instance on the in-process fake pigpio
+# (fakepi.py). No pi needed. Installs a slow goal hook and a hanging matchend hook, scores
+# goals, and checks that goals are not delayed, that queued goal hooks are coalesced, that
+# hooks get the event data and that the hanging hook is killed.
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import fakepi
+import foosball_main
+
+# Hook script writing its environment and stdin to a file, then sleeping
+SCRIPT="""#!/bin/sh
+echo "$FOOSBALL_EVENT $FOOSBALL_TEAM $FOOSBALL_SCORE1-$FOOSBALL_SCORE2 $(cat)" >> %s
+sleep %s
+"""
+
+def install(directory, name, sleep):
+  path=os.path.join(directory, name)
+  with open(path, "w") as f: f.write(SCRIPT % (os.path.join(directory, "hooks.log"), sleep))
+  os.chmod(path, 0o755)
+
+def lines(directory):
+  path=os.path.join(directory, "hooks.log")
+  if not os.path.exists(path): return([])
+  with open(path) as f: return(f.read().splitlines())
+
+if __name__ == '__main__':
+  logging.getLogger("Foosball").setLevel(logging.ERROR)
+  directory=tempfile.mkdtemp()
+  install(directory, "newgoal.sh", 1)
+  install(directory, "matchend.sh", 100)
+  pi=fakepi.FakePi()
+  foosball=foosball_main.Foosball(pi=pi, wwwdir=directory, commandsocket=None)
+  foosball.hooks.timeout=2
+  foosball.hooks.interval=0.1
+  try:
+    foosball.start()
+    foosball.occupied()
+    for gpio in foosball.goaldetect.detect: pi.inject(gpio, 0)
+    # 5 goals in a row while the first goal hook is still running
+    worst=0
+    for i in range(5):
+      start=time.time()
+      tick=pi.tick()
+      pi.inject(10, 1, tick)
+      pi.inject(10, 0, (tick+5000) & 0xffffffff)
+      foosball.events.drain()
+      worst=max(worst, time.time()-start)
+    assert foosball.team[1].score==5
+    print("5 goals handled, slowest %.1f ms while the goal hook takes 1 s" % (1000*worst))
+    time.sleep(2.5)
+    log=lines(directory)
+    assert len(log)==2, log    # First goal, then the 4 queued ones coalesced into one
+    assert log[0].startswith("goal 1 1-0") and log[1].startswith("goal 1 5-0"), log
+    assert json.loads(log[1].split(" ", 3)[3])["score1"]==5
+    assert foosball.hooks.coalesced==3
+    print("Goal hooks coalesced, environment and stdin data: OK")
+    foosball.resetScore()
+    time.sleep(2.5)
+    assert lines(directory)[-1].startswith("matchend  5-0"), lines(directory)
+    assert foosball.hooks.timeouts==1
+    print("Hanging matchend hook killed after timeout: OK")
+  finally:
+    foosball.stop()
+    shutil.rmtree(directory)
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the match archive. No pi needed (needs numpy).
+# Writes a few months of random matches, queries them, compacts the closed days, cuts off a
+# half written match, and plays one match on a Foosball instance on the fake pigpio.
+#
+# Usage: test_matcharchive.py [matches]
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import tempfile
+import fakepi
+import matchlog
+import matcharchive
+import foosball_main
+
+def randomMatch(store, start):
+  match=matchlog.Match(store, start)
+  score=[0, 0, 0]
+  t=start
+  while max(score)<10:
+    t+=random.uniform(5, 60)
+    team=random.choice((1, 2))
+    score[team]+=1
+    match.goal(team, t, score[1], score[2], random.randint(0, 2**32-1))
+  match.finish(reason=random.choice(("reset", "vacant")), finishtime=t+10)
+  return(match)
+
+if __name__ == '__main__':
+  logging.getLogger("Foosball").setLevel(logging.ERROR)
+  count=int(sys.argv[1]) if len(sys.argv)>1 else 20000
+  directory=tempfile.mkdtemp()
+  try:
+    archive=matcharchive.MatchArchive(directory)
+    # Matches spread over 60 days, written without compaction as if it was the last day
+    archive.compacted=time.strftime("%Y%m%d")
+    first=time.mktime((2026, 8, 1, 12, 0, 0, 0, 0, -1))
+    played=[]
+    start=time.time()
+    for i in range(count):
+      played.append(randomMatch(archive, first+i*60*86400.0/count))
+    elapsed=time.time()-start
+    print("%d matches with %d goals appended in %.2f s (%.0f us per match)" %
+          (count, sum(len(m.goallist) for m in played), elapsed, 1e6*elapsed/count))
+
+    days=sorted(set(time.strftime("%Y%m%d", time.localtime(m.starttime)) for m in played))
+    reader=matcharchive.ArchiveReader(directory)
+    assert reader.count()==count and len(reader.segments)==len(days), (reader.count(), len(reader.segments))
+    def check(reader):
+      last=reader.last(3)
+      assert [m["id"] for m in last]==[count, count-1, count-2]
+      m=reader.match(1234)
+      assert (m["score1"], m["score2"])==(played[1233].score1, played[1233].score2)
+      assert list(m["goallist"]["team"])==[g.team for g in played[1233].goallist]
+      assert list(m["goallist"]["tick"])==[g.tick for g in played[1233].goallist]
+      assert (m["goallist"]["match"]==1234).all()
+      assert m["reason"]==played[1233].reason
+      day=reader.between(first+10*86400, first+11*86400)
+      assert [d["id"] for d in day]==[i+1 for (i, p) in enumerate(played) if first+10*86400<=p.starttime<first+11*86400]
+      assert (reader.column("goals", "score1")>=0).all() and len(reader.column("goals", "team"))==sum(len(p.goallist) for p in played)
+    check(reader)
+    start=time.time()
+    for i in range(1000): reader.match(random.randint(1, count))
+    print("Queries: OK (match by id %.1f us)" % (1000*(time.time()-start)))
+    start=time.time()
+    reader.refresh()
+    print("Refresh without changes: %.2f ms" % (1000*(time.time()-start)))
+
+    # Compaction leaves the last day, and makes one segment of every month
+    merged=archive.compact(today=days[-1])
+    assert merged==days[:-1]
+    reader.refresh()
+    assert [s.name for s in reader.segments]==["202608", "202609", days[-1]], [s.name for s in reader.segments]
+    check(reader)
+    # An interrupted compaction: A half written month is removed
+    os.makedirs(os.path.join(directory, "202609.new"))
+    assert archive.compact(today=days[-1])==[]
+    reader=matcharchive.ArchiveReader(directory)
+    assert not os.path.exists(os.path.join(directory, "202609.new"))
+    check(reader)
+    print("Compaction: OK (%s)" % ", ".join(sorted(os.listdir(directory))))
+
+    # Power cut while writing a match: Goals and a part of the match columns are written
+    archive.close()
+    last=os.path.join(directory, reader.segments[-1].name)
+    for (column, dtype, fmt) in matcharchive.GOALS:
+      with open(matcharchive.columnFile(last, "goals", column), "ab") as f: f.write(b"\1"*7)
+    with open(matcharchive.columnFile(last, "matches", "start"), "ab") as f: f.write(b"\1"*8)
+    reader.refresh()
+    check(reader)
+    archive=matcharchive.MatchArchive(directory)
+    archive.compacted=time.strftime("%Y%m%d")
+    randomMatch(archive, first+59.9*86400)
+    reader.refresh()
+    assert reader.count()==count+1 and reader.last()[0]["id"]==count+1
+    assert len(reader.segments[-1].goals["team"])==sum(reader.segments[-1].matches["goals"])
+    print("Half written match cut off: OK")
+    archive.close()
+    shutil.rmtree(directory)
+
+    # A match on the table is saved when the score is reset
+    directory=tempfile.mkdtemp()
+    pi=fakepi.FakePi()
+    foosball=foosball_main.Foosball(pi=pi, wwwdir=directory, commandsocket=None, matchdir=os.path.join(directory, "matches"))
+    try:
+      foosball.start()
+      foosball.occupied()
+      for gpio in foosball.goaldetect.detect: pi.inject(gpio, 0)
+      for (gpio, n) in ((10, 3), (11, 2)):
+        for i in range(n):
+          tick=pi.tick()
+          pi.inject(gpio, 1, tick)
+          pi.inject(gpio, 0, (tick+5000) & 0xffffffff)
+          foosball.events.drain()
+      foosball.resetScore()
+      foosball.events.drain()
+      reader=matcharchive.ArchiveReader(os.path.join(directory, "matches"))
+      m=reader.last()[0]
+      assert (m["score1"], m["score2"], m["reason"])==(3, 2, "reset"), m
+      assert list(m["goallist"]["team"])==[1, 1, 1, 2, 2] and list(m["goallist"]["score2"])==[0, 0, 0, 1, 2]
+      with open(os.path.join(directory, "analytics.json")) as f: assert json.load(f)["matches"]==1
+      assert [g.team for g in foosball.matchlog.history.last()[0].goallist]==[1, 1, 1, 2, 2]
+      print("Match played on the table archived: OK")
+    finally:
+      foosball.stop()
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the running statistics. No pi needed.
+# Makes random occupied periods with matches, goals and corrections as events, feeds them
+# to MatchStats and compares with the statistics computed from the full match list. Then
+# feeds half the events, restarts from the checkpoint and feeds the rest.
+#
+# Usage: test_matchstats.py [periods]
+
+import os
+import sys
+import time
+import random
+import itertools
+import shutil
+import tempfile
+import events
+import matchstats
+
+# Events of random occupied periods, and the matches played (team of every goal, final score)
+def randomEvents(periods):
+  result=[]
+  matches=[]
+  t=time.mktime((2026, 9, 1, 8, 0, 0, 0, 0, -1))
+  for p in range(periods):
+    t+=random.uniform(600, 20000)
+    result.append(events.Event(events.OCCUPIED, {}, t))
+    start=t
+    for n in range(random.randint(1, 4)):
+      score=[0, 0]
+      goals=[]
+      while max(score)<10:
+        t+=random.uniform(2, 200)
+        if random.random()<.05 and max(score)>0:
+          # Correction: Take a goal back
+          team=score.index(max(score))
+          score[team]-=1
+          result.append(events.Event(events.SCORE, {"score1": score[0], "score2": score[1]}, t))
+          goals.append(("correction", t, list(score)))
+          continue
+        team=random.choice((1, 2))
+        score[team-1]+=1
+        result.append(events.Event(events.SCORE, {"goal": team, "tick": 0, "score1": score[0], "score2": score[1]}, t))
+        goals.append((team, t, list(score)))
+      t+=random.uniform(5, 30)
+      last=random.random()<.3
+      result.append(events.Event(events.MATCHEND, {"score1": score[0], "score2": score[1], "reason": "vacant" if last else "reset"}, t))
+      matches.append({"start": start, "end": t, "score": score, "goals": goals})
+      start=t
+      if last: break
+    t+=random.uniform(60, 600)
+    result.append(events.Event(events.VACANT, {}, t))
+  return(result, matches)
+
+# The statistics from the full match list
+def expected(matches, comeback=3):
+  intervals=[]
+  best=0
+  comebacks=0
+  wins=[]
+  for m in matches:
+    last=None
+    run=[0, 0]
+    worst=[0, 0]
+    for (team, t, score) in m["goals"]:
+      if team=="correction":
+        run=[0, 0]
+      else:
+        if last is not None: intervals.append(t-last)
+        last=t
+        run[team-1]+=1
+        run[2-team]=0
+        best=max(best, run[team-1])
+      worst=[max(worst[0], score[1]-score[0]), max(worst[1], score[0]-score[1])]
+    (s1, s2)=m["score"]
+    if s1!=s2:
+      winner=1 if s1>s2 else 2
+      wins.append(winner)
+      if worst[winner-1]>=comeback: comebacks+=1
+  longest=max(len(list(g)) for (k, g) in itertools.groupby(wins))
+  return({"matches": len(matches), "goalintervals": len(intervals), "intervalmean": sum(intervals)/len(intervals),
+          "goalstreak": best, "comebacks": comebacks, "winstreak": longest,
+          "matchtime": sum(m["end"]-m["start"] for m in matches)})
+
+def check(report, want, occupied):
+  assert report["matches"]==want["matches"]
+  assert sum(report["goalinterval"]["histogram"])==want["goalintervals"]
+  assert abs(report["goalinterval"]["mean"]-want["intervalmean"])<1e-6
+  assert report["longestgoalstreak"]==want["goalstreak"]
+  assert report["comebacks"]==want["comebacks"], (report["comebacks"], want["comebacks"])
+  assert report["longestwinstreak"]["length"]==want["winstreak"]
+  assert abs(report["averagematch"]*report["matches"]-want["matchtime"])<1e-3
+  assert sum(report["matchesperday"].values())==want["matches"]
+  assert abs(sum(report["occupiedminutes"])-occupied/60.0)<1e-3
+
+if __name__ == '__main__':
+  periods=int(sys.argv[1]) if len(sys.argv)>1 else 5000
+  (evts, matches)=randomEvents(periods)
+  want=expected(matches)
+  occupied=sum(e.time for e in evts if e.kind==events.VACANT)-sum(e.time for e in evts if e.kind==events.OCCUPIED)
+
+  stats=matchstats.MatchStats()
+  start=time.time()
+  for e in evts: stats.onEvent(e)
+  elapsed=time.time()-start
+  check(stats.report(), want, occupied)
+  print("%d events (%d matches): OK (%.1f us per event)" % (len(evts), len(matches), 1e6*elapsed/len(evts)))
+
+  # Restart from a checkpoint halfway
+  directory=tempfile.mkdtemp()
+  try:
+    path=os.path.join(directory, "statistics.json")
+    first=matchstats.MatchStats(path)
+    for e in evts[:len(evts)//2]: first.onEvent(e)
+    first.stop()
+    second=matchstats.MatchStats(path)
+    for e in evts[len(evts)//2:]: second.onEvent(e)
+    check(second.report(), want, occupied)
+    assert second.report()==stats.report()
+    print("Restart from checkpoint: OK (%d bytes)" % os.path.getsize(path))
+  finally:
+    shutil.rmtree(directory)
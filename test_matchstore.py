@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the SQLite match store. No pi needed.
+# Writes random matches (about 16 goals each) through the writer thread, times the menu
+# queries, checks that they use the indexes, and plays a match with players, a score
+# correction and an occupied period on a Foosball instance on the fake pigpio.
+#
+# Usage: test_matchstore.py [matches]
+
+import os
+import sys
+import time
+import random
+import shutil
+import logging
+import tempfile
+import fakepi
+import matchlog
+import matchstore
+import foosball_main
+
+PLAYERS=["anders", "bente", "carl", "dorte"]
+
+def randomMatch(store, start):
+  match=matchlog.Match(store, start)
+  match.players=tuple(random.sample(PLAYERS, 2))
+  score=[0, 0, 0]
+  t=start
+  while max(score)<10:
+    t+=random.uniform(5, 60)
+    team=random.choice((1, 2))
+    score[team]+=1
+    match.goal(team, t, score[1], score[2], random.randint(0, 2**32-1))
+  match.finish(reason="reset", finishtime=t+10)
+  return(match)
+
+# Average milliseconds of n calls
+def timed(n, func, *args):
+  start=time.time()
+  for i in range(n): func(*args)
+  return(1000*(time.time()-start)/n)
+
+if __name__ == '__main__':
+  logging.getLogger("Foosball").setLevel(logging.ERROR)
+  count=int(sys.argv[1]) if len(sys.argv)>1 else 20000
+  directory=tempfile.mkdtemp()
+  try:
+    path=os.path.join(directory, "foosball.db")
+    store=matchstore.MatchStore(path)
+    store.start()
+    # The last matches are played today
+    first=time.time()-count*600
+    played=[randomMatch(None, first+i*600) for i in range(count)]
+    delays=[]
+    start=time.time()
+    for match in played:
+      t=time.time()
+      store.add(match)
+      delays.append(time.time()-t)
+    assert store.flush(60)
+    delays.sort()
+    print("%d matches with %d goals written in %.2f s (add p50 %.1f us, p99 %.1f us)" %
+          (count, sum(len(m.goallist) for m in played), time.time()-start, 1e6*delays[count//2], 1e6*delays[int(count*.99)]))
+
+    last=store.lastMatch()
+    assert last["id"]==count and (last["score1"], last["score2"])==(played[-1].score1, played[-1].score2)
+    goals=store.goalSequence(1234)
+    assert [(g["team"], g["score1"], g["score2"]) for g in goals]==[(g.team, g.score1, g.score2) for g in played[1233].goallist]
+    midnight=time.mktime(time.localtime()[:3]+(0, 0, 0, 0, 0, -1))
+    assert len(store.matchesToday())==len([m for m in played if m.starttime>=midnight])
+    h2h=store.headToHead("anders", "bente")
+    both=[m for m in played if set(m.players)==set(["anders", "bente"])]
+    wins=len([m for m in both if (m.score1>m.score2)==(m.players[0]=="anders")])
+    assert (h2h["matches"], h2h["wins1"], h2h["wins2"])==(len(both), wins, len(both)-wins), h2h
+    print("Queries: OK (last match %.3f ms, matches today %.3f ms, goal sequence %.3f ms, head to head %.1f ms)" %
+          (timed(1000, store.lastMatch), timed(100, store.matchesToday), timed(1000, store.goalSequence, count//2),
+           timed(10, store.headToHead, "anders", "bente")))
+
+    # The queries are served by indexes
+    db=store.reader()
+    for (sql, args) in ((matchstore.LAST_MATCH, ("foosball",)), (matchstore.MATCHES_BETWEEN, ("foosball", 0, 1)),
+                        (matchstore.GOAL_SEQUENCE, (1,)), (matchstore.HEAD_TO_HEAD, ("a", "b", "foosball")*2)):
+      plan=" ".join(str(r[-1]) for r in db.execute("EXPLAIN QUERY PLAN "+sql, args))
+      assert "INDEX" in plan and "SCAN" not in plan.replace("SCAN matches USING INDEX", "").replace("SCAN (subquery", ""), (sql, plan)
+    print("Query plans use indexes: OK")
+    store.stop()
+
+    # A match with a correction, and the occupied period, played on the table
+    pi=fakepi.FakePi()
+    foosball=foosball_main.Foosball(pi=pi, wwwdir=directory, commandsocket=None, database=path)
+    try:
+      foosball.start()
+      foosball.occupied()
+      foosball.runCommand({"cmd": "players", "team1": "anders", "team2": "erik"}, None)
+      for gpio in foosball.goaldetect.detect: pi.inject(gpio, 0)
+      for gpio in (10, 10, 11):
+        tick=pi.tick()
+        pi.inject(gpio, 1, tick)
+        pi.inject(gpio, 0, (tick+5000) & 0xffffffff)
+        foosball.events.drain()
+      foosball.setScore(2, 2)
+      foosball.vacant()
+      foosball.events.drain()
+      assert foosball.database.flush()
+      last=foosball.database.lastMatch()
+      assert (last["id"], last["score1"], last["score2"], last["reason"])==(count+1, 2, 2, "vacant"), last
+      assert (last["team1"], last["team2"])==("anders", "erik") and foosball.matchlog.players==(None, None)
+      assert foosball.database.headToHead("erik", "anders")=={"matches": 1, "wins1": 0, "wins2": 0, "goals1": 2, "goals2": 2}
+      assert [g["team"] for g in foosball.database.goalSequence(last["id"])]==[1, 1, 2]
+      assert [(c["score1"], c["score2"]) for c in foosball.database.corrections(last["id"])]==[(2, 2)]
+      assert foosball.database.reader().execute("SELECT count(*) FROM sessions").fetchone()[0]==1
+      print("Match, players, correction and occupied period from the table: OK")
+    finally:
+      foosball.stop()
+  finally:
+    shutil.rmtree(directory)
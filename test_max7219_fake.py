@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Test the max7219 driver and the scoreboards against an in-memory transport.
+# Needs no pi and no pigpio daemon
+
+import max7219bb
+import max7219transport
+import teamscore
+
+fake=max7219transport.FakeTransport()
+
+# Setup sends the default state
+m=max7219bb.MAX7219bb(None, clock=22, data=27, load=23, transport=fake)
+print("Setup: %s" % fake.latched(23))
+assert fake.latched(23)=={max7219bb.SHUTDOWN: 0, max7219bb.DISPLAY_TEST: 0, max7219bb.SCAN_LIMIT: 7,
+                          max7219bb.INTENSITY: 3, max7219bb.DECODE_MODE: 0}
+
+# Registers allready latched are not sent again, unless forced
+fake.clear()
+m.intensity(3)
+assert fake.sent==[]
+m.send(max7219bb.INTENSITY, 3, force=True)
+assert fake.sent==[(23, max7219bb.INTENSITY, 3)]
+
+# Frames only send changed registers
+fake.clear()
+m.setRegister(1, 5)
+m.setRegister(max7219bb.INTENSITY, 3)
+assert m.flush()==1
+assert fake.sent==[(23, 1, 5)]
+
+# Refresh resends everything known
+fake.clear()
+assert m.refresh()==6
+assert len(fake.sent)==6
+
+# Staged registers are sent in the order they were (last) staged
+fake.clear()
+m.setRegister(max7219bb.SHUTDOWN, 1)
+m.setRegister(2, 9)
+m.setRegister(max7219bb.INTENSITY, 7)
+m.setRegister(1, 6)
+m.setRegister(2, 8)
+assert m.flush()==4
+assert fake.sent==[(23, max7219bb.SHUTDOWN, 1), (23, max7219bb.INTENSITY, 7), (23, 1, 6), (23, 2, 8)], fake.sent
+
+# Validation is done before anything reaches the transport
+fake.clear()
+for (reg, data) in ((16, 0), (1, 256), (-1, 0), (1, "x")):
+  try:
+    m.send(reg, data)
+    raise AssertionError("Invalid write %s accepted" % ((reg, data),))
+  except max7219bb.Max7219Exception:
+    pass
+assert fake.sent==[]
+
+# Two scoreboards on a shared bus are updated in one batch
+bus=max7219bb.MAX7219Bus(None, clock=22, data=27, transport=fake)
+t1=teamscore.TeamScore(None, clock=22, data=27, load=23, bus=bus)
+t2=teamscore.TeamScore(None, clock=22, data=27, load=24, bus=bus)
+fake.clear()
+with bus.batch():
+  t1.setScore(12)
+  t2.setScore(7)
+  assert fake.sent==[]
+assert fake.latched(23)=={1: 2, 2: 1}
+assert fake.latched(24)=={1: 7}
+
+# Hardware SPI only works on the SPI pins
+try:
+  max7219transport.makeTransport(None, 22, 27, max7219bb.SPI)
+  assert False, "SPI on gpio 22/27 accepted"
+except max7219transport.TransportException:
+  pass
+
+print("All tests passed")
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the match, goal and correction records and the in-memory match history. No pi needed.
+# Measures the memory per goal of goals kept as dicts (as Match.goal used to), as slotted
+# Goal records and in MatchHistory, checks the binary and JSON round trips and times them.
+#
+# Usage: test_records.py [matches]
+
+import sys
+import json
+import time
+import random
+import threading
+import matchlog
+
+# Bytes used by obj and everything it refers to. Shared objects (like dict keys) count once
+def deepsize(obj, seen):
+  if id(obj) in seen or obj is None or isinstance(obj, bool) or (isinstance(obj, int) and -5<=obj<=256): return(0)
+  seen.add(id(obj))
+  size=sys.getsizeof(obj)
+  if isinstance(obj, dict):
+    size+=sum(deepsize(k, seen)+deepsize(v, seen) for (k, v) in obj.items())
+  elif isinstance(obj, (list, tuple)):
+    size+=sum(deepsize(v, seen) for v in obj)
+  elif hasattr(obj, "__slots__"):
+    size+=sum(deepsize(getattr(obj, s), seen) for s in obj.__slots__ if s!="store")
+  return(size)
+
+def randomMatch(start):
+  match=matchlog.Match(None, start)
+  score=[0, 0, 0]
+  t=start
+  while max(score)<10:
+    t+=random.uniform(5, 120)
+    if random.random()<.05 and max(score[1:])>0:
+      team=1 if score[1]>=score[2] else 2
+      score[team]-=1
+      match.correct(t, score[1], score[2])
+      continue
+    team=random.choice((1, 2))
+    score[team]+=1
+    match.goal(team, t, score[1], score[2], random.randint(0, 2**32-1))
+  match.finish(reason=random.choice(("reset", "vacant")), finishtime=t+10)
+  return(match)
+
+if __name__ == '__main__':
+  count=int(sys.argv[1]) if len(sys.argv)>1 else 5000
+  played=[randomMatch(time.time()-(count-i)*900) for i in range(count)]
+  goals=sum(len(m.goallist) for m in played)
+
+  # Memory per goal
+  asdicts=[{"team": g.team, "time": g.time, "black": g.score1, "yellow": g.score2, "tick": g.tick} for m in played for g in m.goallist]
+  dictbytes=deepsize(asdicts, set())-sys.getsizeof(asdicts)
+  records=[g for m in played for g in m.goallist]
+  slotbytes=deepsize(records, set())-sys.getsizeof(records)
+  history=matchlog.MatchHistory(size=count)
+  for m in played: history.add(m)
+  print("%d goals in %d matches. Bytes per goal: dict %.0f, slotted Goal %.0f, MatchHistory %.1f (with matches and corrections)" %
+        (goals, count, float(dictbytes)/goals, float(slotbytes)/goals, float(history.nbytes())/goals))
+  assert history.nbytes()<30*goals
+
+  # The history gives the matches back
+  for (a, b) in zip(history, played):
+    assert a.toJSON()==b.toJSON()
+  assert [m.starttime for m in history.last(3)]==[m.starttime for m in played[-1:-4:-1]]
+  assert history.last(0)==[] and len(history.last(2*count))==count
+  # The lock is not held while the iteration is paused, and last only builds the n matches
+  it=iter(history)
+  next(it)
+  adder=threading.Thread(target=history.add, args=(played[-1],))
+  adder.start()
+  adder.join(1)
+  assert not adder.is_alive() and len(history)==count+1
+  start=time.time()
+  for i in range(1000): history.last(3)
+  print("History iterator: OK (last(3) %.1f us)" % (1000*(time.time()-start)))
+  history=matchlog.MatchHistory(size=count)
+  for m in played: history.add(m)
+
+  # Binary and JSON round trips
+  start=time.time()
+  data=b"".join(m.pack() for m in played)
+  packtime=time.time()-start
+  start=time.time()
+  (offset, unpacked)=(0, [])
+  while offset<len(data):
+    (m, offset)=matchlog.Match.unpack(data, offset)
+    unpacked.append(m)
+  unpacktime=time.time()-start
+  assert [m.toJSON() for m in unpacked]==[m.toJSON() for m in played]
+  start=time.time()
+  text=json.dumps([m.toJSON() for m in played])
+  loaded=[matchlog.Match.fromJSON(d) for d in json.loads(text)]
+  jsontime=time.time()-start
+  assert [m.toJSON() for m in loaded]==[m.toJSON() for m in played]
+  copy=matchlog.MatchHistory(size=count)
+  copy.unpack(history.pack())
+  assert [m.toJSON() for m in copy]==[m.toJSON() for m in played]
+  print("Binary: %d bytes (%.1f per goal), pack %.1f us, unpack %.1f us per match. JSON: %d bytes, round trip %.1f us per match" %
+        (len(data), float(len(data))/goals, 1e6*packtime/count, 1e6*unpacktime/count, len(text), 1e6*jsontime/count))
+
+  # The history drops the oldest matches, when it has twice its size
+  small=matchlog.MatchHistory(size=100)
+  for m in played[:450]: small.add(m)
+  assert 100<=len(small)<200 and [m.toJSON() for m in small]==[m.toJSON() for m in played[450-len(small):450]]
+  print("History trimming: OK")
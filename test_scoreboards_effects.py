@@ -0,0 +1,33 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Play every segment effect on scoreboard 1, normal and upside down
+
+import time
+import pigpio
+import teamscore
+import effects
+
+pi=pigpio.pi()
+score=teamscore.TeamScore(pi, clock=22, data=27, load=23)
+score.wakeup()
+score.setScore(12)
+
+try:
+  for flip in (False, True):
+    score.flip=flip
+    for name in sorted(effects.PATTERNS):
+      print("Playing %s%s" % (name, " (upside down)" if flip else ""))
+      handle=score.playEffect(name)
+      # Endless effects are stopped after 5 seconds
+      if not handle.wait(5): score.effectCancel()
+      time.sleep(1)
+
+except KeyboardInterrupt:
+  print("Keyboard interrupt")
+
+finally:
+  print("Running finally cleanup code")
+  score.effectCancel()
+  score.shutdown()
+  pi.stop()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the memory-mapped status page. No pi needed.
+# A writer process updates the page as fast as it can, with all fields derived from one
+# counter, while the reader checks that every snapshot is consistent (no torn reads) and
+# that the sequence number never goes back. Then a half written update (odd sequence
+# number) is faked, and the reader must wait for it to be finished.
+#
+# Usage: test_statuspage.py [seconds]
+
+import os
+import sys
+import time
+import struct
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import statuspage
+
+# Fields of update number i
+def fields(i):
+  return({"score1": i % 65536, "score2": (i*7) % 65536, "lastgoalteam": 1+i%2, "lastgoaltick": i,
+          "lastgoaltime": float(i), "occupiedsince": i/2.0, "heartbeat": i})
+
+def writer(page, seconds):
+  end=time.time()+seconds
+  i=0
+  while time.time()<end:
+    i+=1
+    page.update(**fields(i))
+
+def consistent(status):
+  return(all(getattr(status, k)==v for (k, v) in fields(status.heartbeat).items()))
+
+if __name__ == '__main__':
+  seconds=float(sys.argv[1]) if len(sys.argv)>1 else 2
+  directory=tempfile.mkdtemp()
+  try:
+    path=os.path.join(directory, "status")
+    page=statuspage.StatusPage(path)
+    reader=statuspage.StatusReader(path)
+
+    # Concurrent writer in its own process, so it really runs at the same time as the reader
+    process=multiprocessing.Process(target=writer, args=(page, seconds))
+    process.start()
+    (reads, changes, last)=(0, 0, reader.read())
+    while process.is_alive():
+      status=reader.read()
+      reads+=1
+      assert status.seq%2==0 and status.seq>=last.seq, (status, last)
+      assert status.heartbeat==0 or consistent(status), status
+      if status.seq!=last.seq: changes+=1
+      last=status
+    process.join()
+    assert process.exitcode==0 and last.heartbeat>0
+    print("Concurrent writer: OK (%d reads, %d different snapshots, %d updates written)" %
+          (reads, changes, reader.read().heartbeat))
+
+    # A writer stopped between the two sequence numbers: The reader waits for the update
+    raw=statuspage.StatusReader(path)
+    seq=reader.read().seq
+    page.map[statuspage.SEQ:statuspage.SEQ+4]=struct.pack("<I", seq+1)
+    page.map[statuspage.HEAD.size:statuspage.HEAD.size+2]=struct.pack("<H", 12345)
+    result=[]
+    thread=threading.Thread(target=lambda: result.append(raw.read()))
+    thread.daemon=True
+    thread.start()
+    thread.join(.2)
+    assert thread.is_alive() and not result
+    page.map[statuspage.SEQ:statuspage.SEQ+4]=struct.pack("<I", seq+2)
+    thread.join(1)
+    assert result and result[0].seq==seq+2 and result[0].score1==12345, result
+    print("Half written update not read: OK")
+    raw.close()
+    reader.close()
+    page.close()
+  finally:
+    shutil.rmtree(directory)
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Tests the embedded web server with a local http client. No pi needed.
+# Fetches the state with ETag, follows the event stream, and checks that a client which
+# never reads is disconnected without holding up the others.
+
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import httplib
+import external
+import webserver
+
+# Read one Server-Sent Event from a file-like socket
+def readEvent(f):
+  kind=data=None
+  while True:
+    line=f.readline()
+    if not line: return(None)
+    line=line.rstrip("\n")
+    if line.startswith("event: "): kind=line[7:]
+    elif line.startswith("data: "): data=json.loads(line[6:])
+    elif line=="" and kind: return(kind, data)
+
+def openStream(port):
+  s=socket.create_connection(("127.0.0.1", port))
+  s.sendall("GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+  f=s.makefile("r")
+  while f.readline().strip(): pass   # Response headers
+  return(s, f)
+
+if __name__ == '__main__':
+  directory=tempfile.mkdtemp()
+  publisher=external.StatePublisher(directory, window=0, legacy=False)
+  server=webserver.StateServer(publisher, host="127.0.0.1", port=0, maxbuffer=65536)
+  server.start()
+  try:
+    publisher.update(score=[3, 5], vacant=False)
+    conn=httplib.HTTPConnection("127.0.0.1", server.port)
+    conn.request("GET", "/state")
+    r=conn.getresponse()
+    state=json.loads(r.read())
+    etag=r.getheader("ETag")
+    assert r.status==200 and state["score"]==[3, 5], state
+    conn.request("GET", "/state", headers={"If-None-Match": etag})
+    r=conn.getresponse(); r.read()
+    assert r.status==304, r.status
+    publisher.update(score=[4, 5])
+    conn.request("GET", "/state", headers={"If-None-Match": etag})
+    r=conn.getresponse()
+    assert r.status==200 and json.loads(r.read())["score"]==[4, 5]
+    print("State and ETag: OK")
+
+    # Event stream starts with the state, then pushed changes
+    (s, f)=openStream(server.port)
+    assert readEvent(f)[0]=="state"
+    # A client which never reads
+    slow=socket.create_connection(("127.0.0.1", server.port))
+    slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    slow.sendall("GET /events HTTP/1.1\r\n\r\n")
+    time.sleep(.1)
+    delays=[]
+    for i in range(2000):
+      start=time.time()
+      server.push("goal", {"team": 1+i%2, "n": i, "padding": "x"*4000})
+      (kind, data)=readEvent(f)
+      delays.append(time.time()-start)
+      assert kind=="goal" and data["n"]==i, (kind, data)
+    delays.sort()
+    print("Event stream: OK (push to browser p50 %.3f ms, p99 %.3f ms)" % (1000*delays[len(delays)/2], 1000*delays[int(len(delays)*.99)]))
+    assert len(server.streams())==1, "Slow client not disconnected"
+    print("Slow client disconnected: OK")
+    conn.request("GET", "/nothing")
+    r=conn.getresponse(); r.read()
+    assert r.status==404
+    s.close()
+    slow.close()
+  finally:
+    server.stop()
+    shutil.rmtree(directory)
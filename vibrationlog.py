@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Records raw vibration sensor edges to compact binary files, and reads them back.
+#
+# The pigpio callback only appends the tick to an in-memory array. flush() (called from the
+# activity heartbeat) appends it to the file of the day as a segment:
+#   header: wall clock time of the first tick (double), first tick, number of ticks (uint32)
+#   ticks:  number of ticks * uint32
+# All little endian. Ticks are converted back to wall clock times relative to the first tick
+# of their segment, so the 32 bit tick wraparound doesn't matter.
+
+import os
+import sys
+import time
+import array
+import struct
+import logging
+import threading
+import pigpio
+
+log = logging.getLogger("Foosball")
+
+HEADER=struct.Struct("<dII")
+
+class VibrationLog:
+
+  def __init__(self, pi, gpio, directory="./log/vibration", prefix="vibration"):
+    self.pi=pi
+    self.gpio=gpio
+    self.directory=directory
+    self.prefix=prefix
+    self.lock=threading.Lock()
+    self.ticks=array.array('I')
+    self.wall0=0
+    self.cb=None
+    self.recorded=0
+
+  def start(self):
+    if not os.path.isdir(self.directory): os.makedirs(self.directory)
+    log.info("Recording vibrations to %s" % self.directory)
+    self.cb=self.pi.callback(self.gpio, pigpio.RISING_EDGE, self.edge)
+
+  def stop(self):
+    if self.cb:
+      self.cb.cancel()
+      self.cb=None
+    self.flush()
+
+  # pigpio callback. Only records the tick
+  def edge(self, gpio, level, tick):
+    with self.lock:
+      if not self.ticks: self.wall0=time.time()
+      self.ticks.append(tick)
+
+  # Name of the file of the day of wall clock time t
+  def filename(self, t):
+    return(os.path.join(self.directory, "%s-%s.bin" % (self.prefix, time.strftime("%Y%m%d", time.localtime(t)))))
+
+  # Append recorded ticks as a segment to the file of the day
+  def flush(self):
+    with self.lock:
+      if not self.ticks: return
+      ticks=self.ticks
+      wall0=self.wall0
+      self.ticks=array.array('I')
+    tick0=ticks[0]
+    if sys.byteorder=="big": ticks.byteswap()
+    try:
+      with open(self.filename(wall0), "ab") as f:
+        f.write(HEADER.pack(wall0, tick0, len(ticks)))
+        f.write(ticks.tostring())
+      self.recorded+=len(ticks)
+    except (IOError, OSError) as e:
+      log.warning("Cannot write vibration log: %s" % e)
+
+# Wall clock times of all vibrations in a file
+def read(filename):
+  times=[]
+  with open(filename, "rb") as f:
+    while True:
+      header=f.read(HEADER.size)
+      if len(header)<HEADER.size: break
+      (wall0, tick0, n)=HEADER.unpack(header)
+      ticks=array.array('I')
+      data=f.read(4*n)
+      ticks.fromstring(data[:len(data)-len(data)%4])
+      if sys.byteorder=="big": ticks.byteswap()
+      # Sum of tick differences, so wraparounds within the segment are handled
+      t=wall0
+      prev=ticks[0] if ticks else tick0
+      for tick in ticks:
+        t+=pigpio.tickDiff(prev, tick)/1000000.0
+        prev=tick
+        times.append(t)
+      if len(ticks)<n: break   # Truncated last segment
+  return(times)
+
+# Wall clock times of all vibrations in several files, sorted
+def readFiles(filenames):
+  times=[]
+  for filename in filenames: times.extend(read(filename))
+  times.sort()
+  return(times)
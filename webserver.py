@@ -0,0 +1,211 @@
+#!/usr/bin/python
+# coding: utf8
+
+# Small embedded HTTP server for the homepage.
+#   GET /state   Current table state as JSON (with ETag, so unchanged state gives 304)
+#   GET /events  Server-Sent Events stream of score, goal, occupied and vacant changes
+#
+# All sockets are non-blocking and served by one thread in a select loop. Other threads only
+# queue changes with push(), which never blocks. Every client has an output buffer; a client
+# which doesn't read, so its buffer grows above maxbuffer, is disconnected.
+
+import os
+import json
+import time
+import errno
+import fcntl
+import socket
+import select
+import logging
+import threading
+import collections
+
+log = logging.getLogger("Foosball")
+
+class StateServer:
+
+  # publisher: external.StatePublisher with the state. port 0 picks a free port
+  def __init__(self, publisher, host="", port=8080, maxbuffer=65536, keepalive=15):
+    self.publisher=publisher
+    self.host=host
+    self.port=port
+    self.maxbuffer=maxbuffer
+    self.keepalive=keepalive
+    self.sock=None
+    self.thread=None
+    self.clients={}        # socket -> Client
+    self.pushed=collections.deque()
+    self.lock=threading.Lock()
+    self.stopping=False
+    # Pipe waking the select loop. Non-blocking, so push never waits
+    (self.wakeread, self.wakewrite)=os.pipe()
+    fcntl.fcntl(self.wakewrite, fcntl.F_SETFL, fcntl.fcntl(self.wakewrite, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+  def start(self):
+    self.sock=socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.sock.bind((self.host, self.port))
+    self.sock.listen(16)
+    self.sock.setblocking(0)
+    self.port=self.sock.getsockname()[1]
+    log.info("Web server listening on port %d" % self.port)
+    self.stopping=False
+    self.thread=threading.Thread(target=self.run, name="WebServer")
+    self.thread.daemon=True
+    self.thread.start()
+
+  def stop(self):
+    self.stopping=True
+    self.wake()
+    if self.thread: self.thread.join(2)
+
+  # Send an event to all event stream clients. Safe to call from any thread
+  def push(self, kind, data):
+    with self.lock:
+      self.pushed.append((kind, data))
+    self.wake()
+
+  # Event bus handler
+  def onEvent(self, event):
+    self.push(event.kind, event.data)
+
+  def wake(self):
+    try:
+      os.write(self.wakewrite, b"x")
+    except OSError:
+      pass
+
+  def run(self):
+    lastbeat=time.time()
+    while not self.stopping:
+      readers=[self.sock, self.wakeread]+list(self.clients)
+      writers=[s for (s, c) in self.clients.items() if c.outbuf]
+      try:
+        (readable, writable, broken)=select.select(readers, writers, [], 1)
+      except select.error as e:
+        if e.args[0]==errno.EINTR: continue
+        raise
+      if self.wakeread in readable:
+        os.read(self.wakeread, 4096)
+        self.sendPushed()
+      if self.sock in readable: self.accept()
+      for s in readable:
+        if s in self.clients: self.clients[s].read()
+      for s in writable:
+        if s in self.clients: self.clients[s].write()
+      if time.time()-lastbeat>=self.keepalive:
+        lastbeat=time.time()
+        for c in self.streams(): c.send(b": keepalive\n\n")
+    for c in list(self.clients.values()): c.close()
+    self.sock.close()
+
+  def streams(self):
+    return([c for c in self.clients.values() if c.streaming])
+
+  def accept(self):
+    try:
+      (s, addr)=self.sock.accept()
+    except socket.error:
+      return
+    s.setblocking(0)
+    self.clients[s]=Client(self, s)
+
+  def sendPushed(self):
+    with self.lock:
+      pushed=list(self.pushed)
+      self.pushed.clear()
+    for (kind, data) in pushed:
+      message=sse(kind, data)
+      for c in self.streams(): c.send(message)
+
+  # Handle one request
+  def request(self, client, method, path, headers):
+    if method!="GET":
+      client.respond(405, "Method Not Allowed", b"", close=True)
+    elif path=="/state":
+      (version, state)=self.publisher.snapshot()
+      etag='"%d"' % version
+      if headers.get("if-none-match")==etag:
+        client.respond(304, "Not Modified", b"", [("ETag", etag)])
+      else:
+        body=json.dumps(state, sort_keys=True).encode("utf8")
+        client.respond(200, "OK", body, [("Content-Type", "application/json"), ("ETag", etag), ("Cache-Control", "no-cache")])
+    elif path=="/events":
+      client.startStream()
+      (version, state)=self.publisher.snapshot()
+      client.send(sse("state", state))
+    else:
+      client.respond(404, "Not Found", b"", close=True)
+
+# One Server-Sent Events message
+def sse(kind, data):
+  return(("event: %s\ndata: %s\n\n" % (kind, json.dumps(data, sort_keys=True))).encode("utf8"))
+
+class Client:
+
+  def __init__(self, server, sock):
+    self.server=server
+    self.sock=sock
+    self.inbuf=b""
+    self.outbuf=b""
+    self.streaming=False
+    self.closing=False
+
+  def read(self):
+    try:
+      data=self.sock.recv(4096)
+    except socket.error as e:
+      if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK): return
+      return(self.close())
+    if not data: return(self.close())
+    if self.streaming: return
+    self.inbuf+=data
+    if len(self.inbuf)>16384: return(self.close())
+    while b"\r\n\r\n" in self.inbuf and not self.streaming and not self.closing:
+      (head, self.inbuf)=self.inbuf.split(b"\r\n\r\n", 1)
+      lines=head.decode("latin-1").split("\r\n")
+      try:
+        (method, path, version)=lines[0].split(" ", 2)
+      except ValueError:
+        return(self.respond(400, "Bad Request", b"", close=True))
+      headers={}
+      for line in lines[1:]:
+        if ":" in line:
+          (name, value)=line.split(":", 1)
+          headers[name.strip().lower()]=value.strip()
+      self.server.request(self, method, path.split("?")[0], headers)
+
+  def respond(self, status, reason, body, headers=[], close=False):
+    head="HTTP/1.1 %d %s\r\nContent-Length: %d\r\n" % (status, reason, len(body))
+    for (name, value) in headers: head+="%s: %s\r\n" % (name, value)
+    if close: head+="Connection: close\r\n"
+    self.closing=close
+    self.send(head.encode("latin-1")+b"\r\n"+body)
+
+  def startStream(self):
+    self.streaming=True
+    self.send(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+
+  # Queue data. Disconnects clients which don't keep up
+  def send(self, data):
+    if len(self.outbuf)+len(data)>self.server.maxbuffer:
+      log.info("Web client too slow. Disconnecting")
+      return(self.close())
+    self.outbuf+=data
+    self.write()
+
+  def write(self):
+    try:
+      n=self.sock.send(self.outbuf)
+    except socket.error as e:
+      if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK): return
+      return(self.close())
+    self.outbuf=self.outbuf[n:]
+    if self.closing and not self.outbuf: self.close()
+
+  def close(self):
+    self.server.clients.pop(self.sock, None)
+    try:
+      self.sock.close()
+    except socket.error:
+      pass